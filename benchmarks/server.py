@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Server SSH di prova per i benchmark, in ascolto solo su loopback.
+
+Avvia uno o più paramiko.ServerInterface su porte libere di 127.0.0.1,
+stampa le porte su stdout in una riga JSON e resta attivo finché stdin
+non viene chiuso. Accetta qualsiasi chiave pubblica; ogni exec risponde
+subito con "ok" e codice 0, così i tempi misurati sono quelli del
+client e del protocollo. L'SFTP di ogni server lavora sui file reali
+sotto <--root>/<porta>; i canali direct-tcpip verso 127.0.0.1 vengono
+inoltrati, così ogni server può fare da bastion per gli altri.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_OK
+
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        if attr.st_size is not None:
+            os.ftruncate(self.writefile.fileno(), attr.st_size)
+        return SFTP_OK
+
+
+class _SFTP(SFTPServerInterface):
+    """SFTP minimale: stat, lettura, scrittura, attributi, rinomina e rimozione di file sotto root."""
+
+    def __init__(self, server, root: str):
+        super().__init__(server)
+        self.root = root
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        path = self._path(path)
+        try:
+            if attr.st_mode is not None:
+                os.chmod(path, attr.st_mode)
+            if attr.st_atime is not None and attr.st_mtime is not None:
+                os.utime(path, (attr.st_atime, attr.st_mtime))
+            if attr.st_size is not None:
+                os.truncate(path, attr.st_size)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(self._path(path), flags, 0o644)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'r+b'
+        else:
+            mode = 'rb'
+        handle = _Handle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self):
+        # Destinazioni dei canali direct-tcpip, per id del canale
+        self.tunnels = {}
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else \
+            paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        # Il server fa anche da bastion verso le altre porte di loopback
+        if destination[0] not in ('127.0.0.1', 'localhost'):
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        self.tunnels[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        # Risposta immediata con EOF: chiudere il canale qui arriverebbe al
+        # client prima della conferma della richiesta exec
+        channel.sendall(b'ok\n')
+        channel.send_exit_status(0)
+        channel.shutdown_write()
+        return True
+
+
+def _pump(source, target) -> None:
+    try:
+        for chunk in iter(lambda: source.recv(65536), b''):
+            target.sendall(chunk)
+        # Mezza chiusura: la risposta nell'altra direzione può ancora arrivare
+        target.shutdown(socket.SHUT_WR)
+    except OSError:
+        # Con un errore si chiude tutto, anche per sbloccare l'altra direzione
+        target.close()
+        source.close()
+
+
+def _bridge(channel: paramiko.Channel, sock: socket.socket) -> None:
+    reverse = threading.Thread(target=_pump, args=(sock, channel), daemon=True)
+    reverse.start()
+    _pump(channel, sock)
+    reverse.join()
+    sock.close()
+    channel.close()
+
+
+def _forward(channel: paramiko.Channel, destination) -> None:
+    try:
+        sock = socket.create_connection(destination)
+    except OSError:
+        channel.close()
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    threading.Thread(target=_bridge, args=(channel, sock), daemon=True).start()
+
+
+def _handle(conn: socket.socket, host_key: paramiko.PKey, root: str) -> None:
+    # Come sshd: i piccoli messaggi di controllo non aspettano l'ACK
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    transport = paramiko.Transport(conn)
+    # Stessi parametri lato server del client, per non limitare l'SFTP
+    transport.default_window_size = 16 * 1024 * 1024
+    transport.default_max_packet_size = 256 * 1024
+    # Come sshd accetta la compressione se il client la chiede (calibrazione)
+    transport.use_compression(True)
+    transport.add_server_key(host_key)
+    transport.set_subsystem_handler('sftp', SFTPServer, _SFTP, root)
+    server = _Server()
+    try:
+        transport.start_server(server=server)
+    except (paramiko.SSHException, EOFError, OSError):
+        transport.close()
+        return
+    # I canali di sessione sono gestiti dalle richieste; qui solo i tunnel
+    while transport.is_active():
+        channel = transport.accept(timeout=1)
+        if channel is not None and channel.get_id() in server.tunnels:
+            _forward(channel, server.tunnels.pop(channel.get_id()))
+
+
+def _serve(listener: socket.socket, host_key: paramiko.PKey, root: str) -> None:
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=_handle, args=(conn, host_key, root), daemon=True).start()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1, help="Numero di server da avviare")
+    parser.add_argument('--host-key', required=True, help="Chiave privata dell'host")
+    parser.add_argument('--root', required=True, help="Directory radice dell'SFTP")
+    args = parser.parse_args()
+
+    # I reset delle connessioni chiuse dal client non sono errori del benchmark
+    logging.getLogger('paramiko').addHandler(logging.NullHandler())
+    host_key = paramiko.PKey.from_path(args.host_key)
+    ports = []
+    for _ in range(args.count):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1024)
+        port = listener.getsockname()[1]
+        ports.append(port)
+        # Ogni server ha la sua directory, come host distinti
+        root = os.path.join(args.root, str(port))
+        os.makedirs(root, exist_ok=True)
+        threading.Thread(target=_serve, args=(listener, host_key, root), daemon=True).start()
+
+    print(json.dumps({'ports': ports}), flush=True)
+    # Il processo termina quando il benchmark chiude la pipe
+    sys.stdin.read()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
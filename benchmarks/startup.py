@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Misura il tempo di avvio di `main.py connect <nome>` fino all'exec di ssh.
+
+Il confronto è con il vecchio avvio a freddo, che importava sempre
+paramiko, inquirer e colorama prima di mostrare qualsiasi cosa.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+EAGER_IMPORTS = "import paramiko, inquirer, colorama; colorama.init()"
+
+
+def measure(cmd: List[str], runs: int, cwd: str) -> List[float]:
+    """Esegue il comando più volte e restituisce i tempi in secondi."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "ssh_config.json"), 'w') as f:
+            json.dump({"bench": {"hostname": "127.0.0.1", "username": "bench",
+                                 "port": 22, "key_path": None}}, f)
+
+        # Un primo giro a vuoto per scaldare la cache del filesystem
+        measure([sys.executable, MAIN, "connect", "bench", "--dry-run"], 1, tmp)
+        measure([sys.executable, "-c", EAGER_IMPORTS], 1, tmp)
+
+        cli = measure([sys.executable, MAIN, "connect", "bench", "--dry-run"], args.runs, tmp)
+        eager = measure([sys.executable, "-c", EAGER_IMPORTS], args.runs, tmp)
+
+    cli_ms = statistics.median(cli) * 1000
+    eager_ms = statistics.median(eager) * 1000
+    print(f"connect <nome> fino all'exec di ssh: {cli_ms:7.1f} ms (mediana su {args.runs})")
+    print(f"import eager di paramiko/inquirer/colorama: {eager_ms:7.1f} ms (mediana su {args.runs})")
+    print(f"rapporto: {cli_ms / eager_ms:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
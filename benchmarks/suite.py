@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""Suite di benchmark contro server SSH locali, senza accesso alla rete.
+
+Misura la connessione a freddo (con il dettaglio delle fasi), il fan-out
+a vari livelli di concorrenza, anche attraverso un bastion, il throughput
+SFTP, il salvataggio e la lettura della configurazione da 1k a 100k
+istanze e l'avvio della CLI.
+Con la suite tuning il server fa da sostituto locale per la calibrazione
+dei profili di trasporto (cifrario, finestra, compressione); la suite
+forward misura connessioni e throughput attraverso i tunnel locali.
+I risultati vengono scritti in JSON con chiavi stabili e ordinate; con
+--baseline si confrontano con un'esecuzione precedente.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import paramiko  # noqa: E402
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ed25519  # noqa: E402
+
+import fanout  # noqa: E402
+import forward  # noqa: E402
+import sftp  # noqa: E402
+import store  # noqa: E402
+import transport  # noqa: E402
+import tuning  # noqa: E402
+from metrics import METRICS, Histogram  # noqa: E402
+from pool import ConnectionPool  # noqa: E402
+from startup import MAIN, measure  # noqa: E402
+from transport import open_transport  # noqa: E402
+
+SCHEMA_VERSION = 1
+SUITES = ('connect', 'fanout', 'bastion', 'sftp', 'tuning', 'forward', 'config', 'startup')
+# Variazione oltre la quale un confronto con la baseline è segnalato
+DEFAULT_THRESHOLD = 0.10
+
+
+def _write_key(path: str) -> None:
+    key = ed25519.Ed25519PrivateKey.generate()
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.OpenSSH,
+                                  serialization.NoEncryption()))
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99),
+            'mean_ms': round(statistics.fmean(ordered), 3), 'runs': len(ordered)}
+
+
+class Servers:
+    """Processo figlio con i server di prova, chiuso all'uscita dal with."""
+
+    def __init__(self, count: int, workdir: str):
+        self.workdir = workdir
+        self.host_key = os.path.join(workdir, 'host_key')
+        self.client_key = os.path.join(workdir, 'client_key')
+        self.root = os.path.join(workdir, 'remote')
+        _write_key(self.host_key)
+        _write_key(self.client_key)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, 'server.py'), '--count', str(count),
+             '--host-key', self.host_key, '--root', self.root],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.ports: List[int] = json.loads(self.process.stdout.readline())['ports']
+        # Le chiavi dei server di prova cambiano a ogni esecuzione: si salvano
+        # in un known_hosts temporaneo invece che in quello dell'utente
+        transport.KNOWN_HOSTS = os.path.join(workdir, 'known_hosts')
+
+    def __enter__(self) -> "Servers":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def instance(self, i: int) -> Dict:
+        return {'hostname': '127.0.0.1', 'username': 'bench',
+                'port': self.ports[i % len(self.ports)], 'key_path': self.client_key,
+                'accept_new_host_key': True}
+
+    def instances(self, count: int) -> Dict[str, Dict]:
+        return {f"h{i}": self.instance(i) for i in range(count)}
+
+    def remote_dir(self, i: int) -> str:
+        return os.path.join(self.root, str(self.ports[i % len(self.ports)]))
+
+
+def bench_connect(servers: Servers, runs: int) -> Dict:
+    """Handshake completo (DNS, TCP, banner, KEX, auth) ripetuto su un host."""
+    instance = servers.instance(0)
+    # Il primo giro carica la chiave e scalda gli import
+    open_transport(instance, label='warmup').close()
+    METRICS.clear()
+    totals = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        open_transport(instance, label='bench').close()
+        totals.append((time.perf_counter() - start) * 1000)
+    phases = {row['phase']: {'p50_ms': row['p50_ms'], 'p99_ms': row['p99_ms']}
+              for row in METRICS.summary() if row['host'] == 'bench'}
+    METRICS.clear()
+    return {'total': _percentiles(totals), 'phases': phases}
+
+
+def bench_fanout(servers: Servers, hosts: int, levels: List[int]) -> Dict:
+    """Comando su tutti gli host: a freddo (handshake) e a caldo (pool riusato)."""
+    instances = servers.instances(hosts)
+    names = list(instances)
+    results = {}
+    for workers in levels:
+        pool = ConnectionPool(max_size=hosts)
+        try:
+            row = {}
+            for phase in ('cold', 'warm'):
+                start = time.perf_counter()
+                outcome = fanout.run_on_instances(instances, names, 'true',
+                                                  max_workers=workers, pool=pool)
+                elapsed = time.perf_counter() - start
+                row[phase] = {'wall_ms': round(elapsed * 1000, 3),
+                              'hosts_per_s': round(hosts / elapsed, 2),
+                              'errors': sum(1 for r in outcome if not r.ok)}
+        finally:
+            pool.close_all()
+        results[f"workers_{workers}"] = row
+    return {'hosts': hosts, 'levels': results}
+
+
+def bench_bastion(servers: Servers, hosts: int, workers: int) -> Dict:
+    """Fan-out verso host raggiungibili solo tramite un bastion condiviso."""
+    instances = {'bastion': servers.instance(0)}
+    for i in range(hosts):
+        # Il server 0 fa da bastion, gli altri da destinazioni
+        instances[f"t{i}"] = {**servers.instance(1 + i % max(1, len(servers.ports) - 1)),
+                              'via': 'bastion'}
+    names = [name for name in instances if name != 'bastion']
+    METRICS.clear()
+    pool = ConnectionPool(max_size=hosts + 1, instances=instances)
+    try:
+        row = {}
+        for phase in ('cold', 'warm'):
+            start = time.perf_counter()
+            outcome = fanout.run_on_instances(instances, names, 'true',
+                                              max_workers=workers, pool=pool)
+            elapsed = time.perf_counter() - start
+            row[phase] = {'wall_ms': round(elapsed * 1000, 3),
+                          'hosts_per_s': round(hosts / elapsed, 2),
+                          'errors': sum(1 for r in outcome if not r.ok)}
+    finally:
+        pool.close_all()
+    handshakes = {row_['host']: row_['count'] for row_ in METRICS.summary()
+                  if row_['phase'] == 'connect'}
+    METRICS.clear()
+    row['bastion_handshakes'] = handshakes.get('bastion', 0)
+    return {'hosts': hosts, 'workers': workers, **row}
+
+
+def _random_file(path: str, size: int) -> None:
+    with open(path, 'wb') as f:
+        block = os.urandom(1024 * 1024)
+        for offset in range(0, size, len(block)):
+            f.write(block[:size - offset])
+
+
+def bench_sftp(servers: Servers, size_mb: int, hosts: int) -> Dict:
+    """Push e pull di un file, su un host e su più host in parallelo."""
+    size = size_mb * 1024 * 1024
+    local = os.path.join(servers.workdir, 'payload.bin')
+    _random_file(local, size)
+    remote_name = 'payload.bin'
+    results = {'size_mb': size_mb, 'hosts': hosts}
+    for label, count in (('single', 1), ('multi', hosts)):
+        instances = servers.instances(count)
+        names = list(instances)
+        # I file remoti esistenti verrebbero saltati: si parte sempre da zero
+        for i in range(count):
+            target = os.path.join(servers.remote_dir(i), remote_name)
+            if os.path.exists(target):
+                os.remove(target)
+        pool = ConnectionPool(max_size=count)
+        try:
+            # Handshake fuori dalla misura: conta solo il trasferimento
+            for name in names:
+                pool.connect(name, instances[name])
+            start = time.perf_counter()
+            pushed = sftp.push(instances, names, local, '/' + remote_name, pool=pool, resume=False)
+            push_s = time.perf_counter() - start
+            download = tempfile.mkdtemp(dir=servers.workdir)
+            start = time.perf_counter()
+            pulled = sftp.pull(instances, names, '/' + remote_name, download, pool=pool, resume=False)
+            pull_s = time.perf_counter() - start
+        finally:
+            pool.close_all()
+        total_mb = size_mb * count
+        results[label] = {
+            'push_mb_per_s': round(total_mb / push_s, 2),
+            'pull_mb_per_s': round(total_mb / pull_s, 2),
+            'errors': sum(1 for r in pushed + pulled if not r.ok),
+        }
+    return results
+
+
+def bench_tuning(servers: Servers, size_mb: int) -> Dict:
+    """Calibrazione del profilo di trasporto: throughput di ogni combinazione provata."""
+    calibration = tuning.calibrate('bench', servers.instance(0), size=size_mb * 1024 * 1024,
+                                   repeat=1, remote_path='tuning.bin')
+    combos = {}
+    for result in calibration.measurements:
+        tuned = result.profile
+        key = (f"{tuned.ciphers[0] if tuned.ciphers else 'default'}_w{tuned.window_size // 1024}k"
+               f"{'_zlib' if tuned.compression else ''}")
+        combos[key] = {'mb_per_s': round(result.throughput / (1024 * 1024), 2),
+                       'error': result.error is not None}
+    best = calibration.best
+    return {
+        'size_mb': size_mb,
+        'baseline_mb_per_s': round(calibration.baseline.throughput / (1024 * 1024), 2),
+        'best_mb_per_s': round(best.throughput / (1024 * 1024), 2) if best else 0,
+        'best_profile': best.profile.describe() if best else None,
+        'combinations': combos,
+    }
+
+
+async def _echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+def _echo_server() -> Tuple[int, asyncio.AbstractEventLoop]:
+    """Server echo in un thread, destinazione dei tunnel."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    port = []
+
+    def serve() -> None:
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(asyncio.start_server(_echo, '127.0.0.1', 0,
+                                                              backlog=4096))
+        port.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        loop.run_forever()
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return port[0], loop
+
+
+async def _clients(port: int, count: int, size: int) -> Tuple[int, float]:
+    payload = os.urandom(size)
+
+    async def one() -> bool:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(payload)
+        await writer.drain()
+        writer.write_eof()
+        received = await reader.read(-1)
+        writer.close()
+        return received == payload
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(count)), return_exceptions=True)
+    return sum(1 for r in results if r is not True), time.perf_counter() - start
+
+
+def bench_forward(servers: Servers, connections: int, size_kb: int) -> Dict:
+    """Connessioni concorrenti attraverso un tunnel verso un server echo locale.
+
+    Il motore gira nel thread principale (gestisce i segnali), i client
+    in un thread separato che lo ferma alla fine.
+    """
+    echo_port, echo_loop = _echo_server()
+    instance = {**servers.instance(0), 'forwards': [f"0:127.0.0.1:{echo_port}"]}
+    tunnels = forward.configured({'bench': instance}, ['bench'])
+    engine = forward.ForwardEngine({'bench': instance}, tunnels)
+    size = size_kb * 1024
+    outcome = {}
+
+    def load(ready_tunnels, warnings) -> None:
+        def worker() -> None:
+            try:
+                port = int(ready_tunnels[0].address.rsplit(':', 1)[1])
+                asyncio.run(_clients(port, 1, size))
+                stats = ready_tunnels[0].stats
+                stats.latency = Histogram()
+                outcome['errors'], outcome['seconds'] = asyncio.run(
+                    _clients(port, connections, size))
+            finally:
+                engine.stop()
+        threading.Thread(target=worker, daemon=True).start()
+
+    engine.run(on_ready=load)
+    echo_loop.call_soon_threadsafe(echo_loop.stop)
+    latency = tunnels[0].stats.latency
+    seconds = outcome.get('seconds') or float('inf')
+    return {
+        'connections': connections,
+        'size_kb': size_kb,
+        'conn_per_s': round(connections / seconds, 1),
+        'mb_per_s': round(2 * connections * size / seconds / (1024 * 1024), 2),
+        'open_p50_ms': round(latency.quantile(0.5) or 0, 3),
+        'open_p99_ms': round(latency.quantile(0.99) or 0, 3),
+        'errors': outcome.get('errors', connections),
+    }
+
+
+def _instances(count: int) -> Iterator[Tuple[str, Dict]]:
+    for i in range(count):
+        yield f"host-{i:06d}", {'hostname': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                                'username': 'deploy', 'port': 22, 'key_path': None}
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def bench_config(sizes: List[int], workdir: str) -> Dict:
+    """Scrittura in blocco, lettura completa, lookup e modifica singola per backend."""
+    results = {}
+    for backend, suffix in (('json', '.json'), ('sqlite', '.db')):
+        per_size = {}
+        for count in sizes:
+            path = os.path.join(workdir, f"config-{count}{suffix}")
+            probe_name = f"host-{count // 2:06d}"
+
+            def bulk_save():
+                instances = store.open_store(path)
+                instances.upsert_many(_instances(count))
+                instances.close()
+
+            def load_all():
+                instances = store.open_store(path)
+                for _ in instances.items():
+                    pass
+                instances.close()
+
+            def lookup():
+                instances = store.open_store(path)
+                instances[probe_name]
+                instances.close()
+
+            def edit_save():
+                instances = store.open_store(path)
+                instances[probe_name] = {**instances[probe_name], 'port': 2222}
+                instances.save()
+                instances.close()
+
+            per_size[str(count)] = {
+                'bulk_save_ms': _timed(bulk_save),
+                'load_all_ms': _timed(load_all),
+                'open_lookup_ms': _timed(lookup),
+                'edit_save_ms': _timed(edit_save),
+                'file_bytes': os.path.getsize(path),
+            }
+            os.remove(path)
+        results[backend] = per_size
+    return results
+
+
+def bench_startup(runs: int, workdir: str) -> Dict:
+    """Avvio della CLI fino al primo output, per i sottocomandi più rapidi."""
+    config = os.path.join(workdir, 'startup.json')
+    with open(config, 'w') as f:
+        json.dump({"bench": {"hostname": "127.0.0.1", "username": "bench",
+                             "port": 22, "key_path": None}}, f)
+    commands = {
+        'connect_dry_run': ['connect', 'bench', '--dry-run'],
+        'list_jsonl': ['list', '--format', 'jsonl'],
+    }
+    results = {}
+    for label, args in commands.items():
+        cmd = [sys.executable, MAIN, '--config', config] + args
+        measure(cmd, 1, workdir)
+        results[label] = _percentiles([t * 1000 for t in measure(cmd, runs, workdir)])
+    return results
+
+
+def _flatten(data: Dict, prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Righe di confronto per le metriche peggiorate oltre la soglia."""
+    old = dict(_flatten(baseline.get('results', {})))
+    regressions = []
+    for path, value in _flatten(current['results']):
+        before = old.get(path)
+        if not before:
+            continue
+        # Tempi: peggio se crescono; throughput: peggio se calano
+        if path.endswith('_ms'):
+            change = (value - before) / before
+        elif path.endswith('_per_s'):
+            change = (before - value) / before
+        else:
+            continue
+        if change > threshold:
+            regressions.append(f"{path}: {before} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--only', action='append', choices=SUITES,
+                        help="Esegue solo questa suite (ripetibile)")
+    parser.add_argument('--quick', action='store_true',
+                        help="Dimensioni ridotte, per una verifica veloce")
+    parser.add_argument('--servers', type=int, default=8, help="Server di prova da avviare")
+    parser.add_argument('-o', '--output', help="File JSON dei risultati (default: stdout)")
+    parser.add_argument('--baseline', help="Risultati precedenti con cui confrontarsi")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Peggioramento relativo segnalato come regressione")
+    args = parser.parse_args(argv)
+    suites = args.only or list(SUITES)
+
+    params = {
+        'connect_runs': 20 if args.quick else 200,
+        'fanout_hosts': 64 if args.quick else 512,
+        'fanout_levels': [1, 8, 32] if args.quick else [1, 8, 32, 128],
+        'bastion_hosts': 64 if args.quick else 256,
+        'bastion_workers': 32,
+        'sftp_size_mb': 8 if args.quick else 64,
+        'sftp_hosts': min(args.servers, 4),
+        'tuning_size_mb': 4 if args.quick else 32,
+        'forward_connections': 200 if args.quick else 2000,
+        'forward_size_kb': 16 if args.quick else 64,
+        'config_sizes': [1000, 10000] if args.quick else [1000, 10000, 100000],
+        'startup_runs': 5 if args.quick else 20,
+        'servers': args.servers,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        if {'connect', 'fanout', 'bastion', 'sftp', 'tuning', 'forward'} & set(suites):
+            with Servers(args.servers, workdir) as servers:
+                if 'connect' in suites:
+                    results['connect'] = bench_connect(servers, params['connect_runs'])
+                if 'fanout' in suites:
+                    results['fanout'] = bench_fanout(servers, params['fanout_hosts'],
+                                                     params['fanout_levels'])
+                if 'bastion' in suites:
+                    results['bastion'] = bench_bastion(servers, params['bastion_hosts'],
+                                                       params['bastion_workers'])
+                if 'sftp' in suites:
+                    results['sftp'] = bench_sftp(servers, params['sftp_size_mb'],
+                                                 params['sftp_hosts'])
+                if 'tuning' in suites:
+                    results['tuning'] = bench_tuning(servers, params['tuning_size_mb'])
+                if 'forward' in suites:
+                    results['forward'] = bench_forward(servers, params['forward_connections'],
+                                                       params['forward_size_kb'])
+        if 'config' in suites:
+            results['config'] = bench_config(params['config_sizes'], workdir)
+        if 'startup' in suites:
+            results['startup'] = bench_startup(params['startup_runs'], workdir)
+
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': {
+            'python': platform.python_version(),
+            'paramiko': paramiko.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'parameters': params,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True) + '\n'
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSIONE {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
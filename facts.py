@@ -0,0 +1,248 @@
+import json
+import os
+import shlex
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+from term import Fore, Style
+
+# Comandi POSIX per i fatti predefiniti; ognuno produce una sola riga
+FACTS: Dict[str, str] = {
+    'os': "uname -s",
+    'kernel': "uname -r",
+    'arch': "uname -m",
+    'distro': "sed -n 's/^PRETTY_NAME=//p' /etc/os-release | tr -d '\"'",
+    'cpus': "nproc 2>/dev/null || getconf _NPROCESSORS_ONLN",
+    'mem_mb': "awk '/^MemTotal:/ {print int($2 / 1024)}' /proc/meminfo",
+    'disk_root': "df -P / | awk 'NR == 2 {print $5}'",
+    'load': "cut -d ' ' -f 1 /proc/loadavg",
+    'uptime_days': "awk '{printf \"%.1f\", $1 / 86400}' /proc/uptime",
+}
+DEFAULT_FACTS = ('distro', 'kernel', 'arch', 'cpus', 'mem_mb', 'disk_root', 'load', 'uptime_days')
+TITLES = {'os': 'OS', 'kernel': 'Kernel', 'arch': 'Arch', 'distro': 'Distribuzione',
+          'cpus': 'CPU', 'mem_mb': 'RAM MB', 'disk_root': 'Disco /', 'load': 'Load',
+          'uptime_days': 'Uptime gg'}
+# Fatti predefiniti numerici, convertiti per ordinare correttamente l'elenco;
+# tutti gli altri (versioni, kernel, fatti personalizzati) restano testo
+NUMERIC: Dict[str, type] = {'cpus': int, 'mem_mb': int, 'load': float, 'uptime_days': float}
+# Oltre questa età i fatti vengono raccolti di nuovo
+DEFAULT_MAX_AGE = 3600.0
+
+Value = Union[str, int, float]
+
+
+@dataclass
+class HostFacts:
+    name: str
+    facts: Dict[str, Value] = field(default_factory=dict)
+    collected_at: float = 0.0
+    error: Optional[str] = None
+
+    def stale(self, wanted: List[str], max_age: float, now: float) -> bool:
+        return (self.error is not None or now - self.collected_at > max_age
+                or any(fact not in self.facts for fact in wanted))
+
+
+def parse_specs(specs: Optional[List[str]]) -> Dict[str, str]:
+    """Fatti richiesti: nomi predefiniti oppure 'nome=comando' personalizzati.
+
+    ValueError per un nome sconosciuto o non valido.
+    """
+    if not specs:
+        return {name: FACTS[name] for name in DEFAULT_FACTS}
+    selected = {}
+    for spec in specs:
+        for item in ([spec] if '=' in spec else spec.split(',')):
+            name, _, command = item.partition('=')
+            name = name.strip()
+            if not name.isidentifier():
+                raise ValueError(f"nome del fatto non valido: {name!r}")
+            if not command and name not in FACTS:
+                raise ValueError(f"fatto sconosciuto: {name!r} (disponibili: {', '.join(FACTS)})")
+            selected[name] = command or FACTS[name]
+    return selected
+
+
+def build_command(facts: Dict[str, str]) -> str:
+    """Un unico comando remoto che stampa una riga 'nome<TAB>valore' per fatto.
+
+    Ogni fatto gira in una subshell con stderr scartato: un comando che
+    fallisce lascia il valore vuoto senza interrompere gli altri.
+    """
+    parts = [f"printf '%s\\t%s\\n' {shlex.quote(name)} "
+             f"\"$( ( {command} ) 2>/dev/null | head -n 1)\""
+             for name, command in facts.items()]
+    return '; '.join(parts)
+
+
+def _value(name: str, text: str) -> Optional[Value]:
+    text = text.strip()
+    if not text:
+        return None
+    kind = NUMERIC.get(name)
+    if kind is not None:
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_output(output: str, wanted: List[str]) -> Dict[str, Value]:
+    values = {}
+    for line in output.splitlines():
+        name, sep, text = line.partition('\t')
+        if sep and name in wanted:
+            value = _value(name, text)
+            if value is not None:
+                values[name] = value
+    return values
+
+
+def cache_path(config_file: str) -> str:
+    return os.path.splitext(config_file)[0] + '.facts.json'
+
+
+def load_cache(path: str) -> Dict[str, HostFacts]:
+    """Fatti raccolti in precedenza, di qualsiasi età."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: HostFacts(**entry) for name, entry in data.items()}
+
+
+def save_cache(path: str, results: List[HostFacts]) -> None:
+    """Aggiorna la cache con i nuovi risultati mantenendo quelli degli altri host.
+
+    Se la nuova raccolta fallisce restano i fatti precedenti, con l'errore.
+    """
+    from store import file_lock
+    with file_lock(path):
+        cache = load_cache(path)
+        for result in results:
+            previous = cache.get(result.name)
+            if result.error and previous is not None:
+                previous.error = result.error
+            else:
+                if previous is not None:
+                    result.facts = {**previous.facts, **result.facts}
+                cache[result.name] = result
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({name: asdict(entry) for name, entry in cache.items()}, f)
+        os.replace(tmp_path, path)
+
+
+def stale_names(cache: Dict[str, HostFacts], names: List[str], wanted: List[str],
+                max_age: float = DEFAULT_MAX_AGE) -> List[str]:
+    now = time.time()
+    return [name for name in names
+            if name not in cache or cache[name].stale(wanted, max_age, now)]
+
+
+def gather(instances, names: List[str], facts: Dict[str, str], max_workers: int = 32,
+           timeout: float = 30.0, pool=None) -> List[HostFacts]:
+    """Raccoglie i fatti con un solo comando per host, su tutti gli host in parallelo."""
+    import fanout
+    command = build_command(facts)
+    wanted = list(facts)
+    results = []
+    for r in fanout.run_on_instances(instances, names, command, max_workers=max_workers,
+                                     timeout=timeout, pool=pool):
+        entry = HostFacts(name=r.name, collected_at=time.time())
+        if r.error is not None:
+            entry.error = r.error
+        else:
+            entry.facts = parse_output(r.stdout, wanted)
+        results.append(entry)
+    return results
+
+
+def columns(cache: Dict[str, HostFacts]) -> List[Tuple[str, str]]:
+    """Colonne dell'elenco per i fatti presenti in cache, i predefiniti per primi."""
+    present = set()
+    for entry in cache.values():
+        present.update(entry.facts)
+    ordered = [name for name in FACTS if name in present]
+    ordered += sorted(present - set(FACTS))
+    return [(f"fact.{name}", TITLES.get(name, name)) for name in ordered]
+
+
+def annotate(row: Dict, cache: Dict[str, HostFacts]) -> Dict:
+    """Aggiunge a una riga dell'elenco i fatti in cache, come colonne 'fact.<nome>'."""
+    entry = cache.get(row['name'])
+    if entry is not None:
+        for name, value in entry.facts.items():
+            row[f"fact.{name}"] = value
+    return row
+
+
+def matches(row: Dict, conditions: List[Tuple[str, str]]) -> bool:
+    """Vero se ogni fatto contiene il testo richiesto (senza distinzione di maiuscole)."""
+    for name, needle in conditions:
+        value = row.get(f"fact.{name}")
+        if value is None or needle.lower() not in str(value).lower():
+            return False
+    return True
+
+
+def parse_conditions(specs: Optional[List[str]]) -> List[Tuple[str, str]]:
+    conditions = []
+    for spec in specs or []:
+        name, sep, needle = spec.partition('=')
+        if not sep or not name.strip():
+            raise ValueError(f"condizione non valida: {spec!r} (atteso fatto=testo)")
+        conditions.append((name.strip(), needle.strip()))
+    return conditions
+
+
+def search_text(entry: Optional[HostFacts]) -> str:
+    """Testo dei fatti usato dall'indice di ricerca del selettore."""
+    if entry is None:
+        return ''
+    return ' '.join(str(value) for value in entry.facts.values())
+
+
+def describe(entry: Optional[HostFacts]) -> str:
+    """Riassunto breve dei fatti per il selettore interattivo."""
+    if entry is None or not entry.facts:
+        return ''
+    facts = entry.facts
+    parts = [str(facts[name]) for name in ('distro', 'os') if name in facts][:1]
+    if 'disk_root' in facts:
+        parts.append(f"disco {facts['disk_root']}")
+    if 'load' in facts:
+        parts.append(f"load {facts['load']}")
+    if 'uptime_days' in facts:
+        parts.append(f"up {facts['uptime_days']}gg")
+    return ', '.join(parts)
+
+
+def print_results(names: List[str], results: List[HostFacts], cache: Dict[str, HostFacts],
+                  wanted: List[str]) -> None:
+    """Tabella dei fatti in cache per gli host richiesti, con gli errori dell'ultima raccolta."""
+    import listing
+    failed = [r for r in results if r.error]
+    rows = []
+    for name in names:
+        entry = cache.get(name)
+        if entry is None:
+            continue
+        row = {'name': name}
+        for fact in wanted:
+            row[fact] = entry.facts.get(fact)
+        rows.append(row)
+    if rows:
+        print(f"\n{Fore.CYAN}=== Fatti ==={Style.RESET_ALL}")
+        listing.write_table(rows, columns=[('name', 'Istanza')] +
+                            [(fact, TITLES.get(fact, fact)) for fact in wanted])
+    for r in failed:
+        print(f"{Fore.RED}{r.name}: {r.error}{Style.RESET_ALL}")
+    print(f"\n{len(results) - len(failed)}/{len(results)} istanze aggiornate, "
+          f"{len(names) - len(results)} già recenti in cache")
@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from term import Fore, Style
+from pool import ConnectionPool
+from transport import DEFAULT_TIMEOUT
+
+DEFAULT_WORKERS = 32
+
+
+@dataclass
+class ExecResult:
+    name: str
+    hostname: str
+    exit_code: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.exit_code == 0
+
+
+def run_command(name: str, instance: Dict, command: str,
+                timeout: float = DEFAULT_TIMEOUT,
+                pool: Optional[ConnectionPool] = None) -> ExecResult:
+    """Esegue un comando su una singola istanza e ne raccoglie l'esito."""
+    result = ExecResult(name=name, hostname=instance['hostname'])
+    start = time.monotonic()
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(timeout=timeout)
+    try:
+        code, stdout, stderr = pool.exec_command(name, instance, command, timeout)
+        result.exit_code = code
+        result.stdout = stdout.decode(errors='replace')
+        result.stderr = stderr.decode(errors='replace')
+    except Exception as e:
+        result.error = str(e) or e.__class__.__name__
+    finally:
+        if own_pool:
+            pool.close_all()
+        result.elapsed = time.monotonic() - start
+    return result
+
+
+def run_on_instances(instances: Dict[str, Dict], names: List[str], command: str,
+                     max_workers: int = DEFAULT_WORKERS,
+                     timeout: float = DEFAULT_TIMEOUT,
+                     pool: Optional[ConnectionPool] = None) -> List[ExecResult]:
+    """Esegue lo stesso comando su più istanze in parallelo.
+
+    Il pool di thread è limitato a max_workers, quindi il tempo totale
+    dipende dall'host più lento e non dalla somma di tutti gli host.
+    Passando un ConnectionPool le connessioni restano aperte per le
+    esecuzioni successive.
+    """
+    if not names:
+        return []
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(max_size=len(names), timeout=timeout, instances=instances)
+    workers = max(1, min(max_workers, len(names)))
+    try:
+        pool.prefetch_dns(instances, names)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_command, name, instances[name], command,
+                                       timeout, pool)
+                       for name in names]
+            return [future.result() for future in futures]
+    finally:
+        if own_pool:
+            pool.close_all()
+
+
+def print_results(results: List[ExecResult], show_output: bool = True) -> None:
+    """Stampa l'output di ogni host seguito da una tabella riassuntiva."""
+    if show_output:
+        for r in results:
+            color = Fore.GREEN if r.ok else Fore.RED
+            print(f"\n{color}=== {r.name} ({r.hostname}) ==={Style.RESET_ALL}")
+            if r.error:
+                print(f"{Fore.RED}Errore: {r.error}{Style.RESET_ALL}")
+            if r.stdout:
+                print(r.stdout.rstrip('\n'))
+            if r.stderr:
+                print(f"{Fore.YELLOW}{r.stderr.rstrip()}{Style.RESET_ALL}")
+    print_summary(results)
+
+
+def print_summary(results: List[ExecResult]) -> None:
+    """Stampa la tabella riassuntiva con esito e durata per host."""
+    if not results:
+        return
+    width = max(len("Istanza"), max(len(r.name) for r in results))
+    print(f"\n{Fore.CYAN}=== Riepilogo ==={Style.RESET_ALL}")
+    print(f"{'Istanza':<{width}}  {'Esito':<8}  {'Codice':>6}  {'Tempo':>8}")
+    print(f"{'-' * width}  {'-' * 8}  {'-' * 6}  {'-' * 8}")
+    for r in results:
+        status = 'OK' if r.ok else ('ERRORE' if r.error else 'FALLITO')
+        color = Fore.GREEN if r.ok else Fore.RED
+        code = '-' if r.exit_code is None else str(r.exit_code)
+        print(f"{r.name:<{width}}  {color}{status:<8}{Style.RESET_ALL}  "
+              f"{code:>6}  {r.elapsed:>7.2f}s")
+    ok = sum(1 for r in results if r.ok)
+    slowest = max(r.elapsed for r in results)
+    print(f"\n{ok}/{len(results)} istanze completate con successo "
+          f"(host più lento: {slowest:.2f}s)")
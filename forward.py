@@ -0,0 +1,479 @@
+import asyncio
+import re
+import signal
+import socket
+import sys
+import time
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from metrics import METRICS, Histogram
+from pool import ConnectionPool
+from term import Fore, Style
+from transport import DEFAULT_TIMEOUT
+
+DEFAULT_BIND = '127.0.0.1'
+READ_SIZE = 65536
+SEND_SIZE = 256 * 1024
+# Attesa prima di riprovare un invio con la finestra SSH esaurita
+SEND_RETRY = 0.005
+# Thread che aprono i canali: l'apertura attende la risposta del server
+DEFAULT_OPEN_WORKERS = 64
+DEFAULT_BACKLOG = 1024
+# [bind:]porta:host:porta_host, con gli indirizzi IPv6 tra parentesi quadre
+_ADDRESS = r'(\[[^\]]+\]|[^:\[\]]+)'
+_SPEC_RE = re.compile(rf'^(?:{_ADDRESS}:)?(\d+):{_ADDRESS}:(\d+)$')
+
+
+@dataclass(frozen=True)
+class Forward:
+    bind: str
+    port: int
+    host: str
+    host_port: int
+
+    def __str__(self) -> str:
+        return f"{_join(self.bind, self.port)} -> {_join(self.host, self.host_port)}"
+
+    @property
+    def spec(self) -> str:
+        """Forma normalizzata salvata nel campo 'forwards' dell'istanza."""
+        return f"{_join(self.bind, self.port)}:{_join(self.host, self.host_port)}"
+
+
+def _join(host: str, port: int) -> str:
+    return f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+
+
+def parse_forward(spec: str) -> Forward:
+    """Interpreta una specifica come quella di 'ssh -L': [bind:]porta:host:porta_host.
+
+    ValueError se la specifica o le porte non sono valide.
+    """
+    match = _SPEC_RE.match(str(spec).strip())
+    if match is None:
+        raise ValueError(f"port forwarding non valido: {spec!r} (atteso [bind:]porta:host:porta)")
+    bind, port, host, host_port = match.groups()
+    forward = Forward(bind=(bind or DEFAULT_BIND).strip('[]'), port=int(port),
+                      host=host.strip('[]'), host_port=int(host_port))
+    if forward.port > 65535 or not 0 < forward.host_port <= 65535:
+        raise ValueError(f"porta non valida in {spec!r}")
+    return forward
+
+
+def parse_forwards(value: Union[None, str, Iterable[str]]) -> List[str]:
+    """Normalizza il campo 'forwards' da una lista o da un testo separato da virgole."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[,;\s]+', value)
+    elif not isinstance(value, (list, tuple)):
+        raise ValueError(f"port forwarding non validi: {value!r}")
+    specs = []
+    for item in value:
+        if str(item).strip():
+            spec = parse_forward(item).spec
+            if spec not in specs:
+                specs.append(spec)
+    return specs
+
+
+@dataclass
+class TunnelStats:
+    connections: int = 0
+    active: int = 0
+    failed: int = 0
+    # Dal remoto verso il client locale (in) e viceversa (out)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    # Attesa dall'accept all'apertura del canale, in ms
+    latency: Histogram = field(default_factory=Histogram)
+
+
+@dataclass
+class Tunnel:
+    name: str
+    forward: Forward
+    stats: TunnelStats = field(default_factory=TunnelStats)
+    error: Optional[str] = None
+    last_error: Optional[str] = None
+    server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def listening(self) -> bool:
+        return self.server is not None
+
+    @property
+    def address(self) -> str:
+        """Indirizzo locale effettivo, utile con la porta 0."""
+        if self.server is not None and self.server.sockets:
+            host, port = self.server.sockets[0].getsockname()[:2]
+            return _join(host, port)
+        return _join(self.forward.bind, self.forward.port)
+
+
+def configured(instances, names: List[str]) -> List[Tunnel]:
+    """Tunnel definiti nel campo 'forwards' delle istanze.
+
+    ValueError se una specifica non è valida o se due tunnel usano la
+    stessa porta locale.
+    """
+    tunnels = []
+    seen: Dict[Tuple[str, int], str] = {}
+    for name in names:
+        for spec in instances[name].get('forwards') or ():
+            try:
+                forward = parse_forward(spec)
+            except ValueError as e:
+                raise ValueError(f"{name}: {e}")
+            key = (forward.bind, forward.port)
+            if forward.port and key in seen:
+                raise ValueError(f"{name}: la porta locale {_join(*key)} è già usata da '{seen[key]}'")
+            seen[key] = name
+            tunnels.append(Tunnel(name=name, forward=forward))
+    return tunnels
+
+
+class _Connection(asyncio.Protocol):
+    """Una connessione locale inoltrata su un canale direct-tcpip.
+
+    I dati del canale arrivano tramite il descrittore di notifica di
+    paramiko (Channel.fileno) registrato nel loop; quelli del client
+    vengono inviati sul canale in modo non bloccante. Se la finestra SSH
+    è esaurita si sospende la lettura dal client, se il client non legge
+    si sospende quella dal canale: la contropressione arriva fino al
+    server remoto senza buffer illimitati.
+    """
+
+    def __init__(self, engine: "ForwardEngine", tunnel: Tunnel):
+        self.engine = engine
+        self.tunnel = tunnel
+        self.stats = tunnel.stats
+        self.transport: Optional[asyncio.Transport] = None
+        self.channel: Optional[paramiko.Channel] = None
+        self.lease: Optional[ExitStack] = None
+        self.pending = bytearray()
+        self.started = time.perf_counter()
+        self.reading_channel = False
+        self.send_blocked = False
+        self.local_eof = False
+        self.remote_eof = False
+        self.closed = False
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.stats.connections += 1
+        self.stats.active += 1
+        self.engine.connections.add(self)
+        # Il client resta in attesa finché il canale non è aperto
+        transport.pause_reading()
+        peer = transport.get_extra_info('peername') or ('127.0.0.1', 0)
+        future = self.engine.submit(self.engine.open_channel, self.tunnel, peer[:2])
+        future.add_done_callback(self._opened)
+
+    def _opened(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self._close()
+            return
+        error = future.exception()
+        if error is not None:
+            self.stats.failed += 1
+            self.tunnel.last_error = str(error) or error.__class__.__name__
+            self._close()
+            return
+        channel, lease = future.result()
+        if self.closed:
+            # Il client ha chiuso durante l'apertura del canale
+            channel.close()
+            lease.close()
+            return
+        self.channel, self.lease = channel, lease
+        elapsed = time.perf_counter() - self.started
+        self.stats.latency.observe(elapsed * 1000)
+        METRICS.observe('forward', self.tunnel.name, elapsed)
+        channel.settimeout(0.0)
+        self._read_channel(True)
+        self.transport.resume_reading()
+
+    def _read_channel(self, enabled: bool) -> None:
+        if enabled == self.reading_channel or self.channel is None:
+            return
+        self.reading_channel = enabled
+        if enabled:
+            self.engine.loop.add_reader(self.channel.fileno(), self._on_channel_readable)
+        else:
+            self.engine.loop.remove_reader(self.channel.fileno())
+
+    def _on_channel_readable(self) -> None:
+        try:
+            data = self.channel.recv(READ_SIZE)
+        except socket.timeout:
+            return
+        except (OSError, EOFError, paramiko.SSHException):
+            self._close()
+            return
+        if not data:
+            self.remote_eof = True
+            self._read_channel(False)
+            if self.local_eof or not self.transport.can_write_eof():
+                self._close()
+            else:
+                self.transport.write_eof()
+            return
+        self.stats.bytes_in += len(data)
+        self.transport.write(data)
+
+    def data_received(self, data: bytes) -> None:
+        self.stats.bytes_out += len(data)
+        self.pending += data
+        if not self.send_blocked:
+            self._flush()
+
+    def _flush(self) -> None:
+        try:
+            while self.pending:
+                sent = self.channel.send(bytes(self.pending[:SEND_SIZE]))
+                if not sent:
+                    # Canale chiuso dal remoto
+                    self._close()
+                    return
+                del self.pending[:sent]
+        except socket.timeout:
+            if not self.send_blocked:
+                self.send_blocked = True
+                self.transport.pause_reading()
+            self.engine.loop.call_later(SEND_RETRY, self._retry)
+            return
+        except (OSError, EOFError, paramiko.SSHException):
+            self._close()
+            return
+        if self.send_blocked:
+            self.send_blocked = False
+            if not self.local_eof:
+                self.transport.resume_reading()
+        if self.local_eof:
+            self.channel.shutdown_write()
+
+    def _retry(self) -> None:
+        if not self.closed:
+            self._flush()
+
+    def eof_received(self) -> bool:
+        self.local_eof = True
+        if self.remote_eof:
+            return False
+        if self.channel is not None and not self.pending:
+            self.channel.shutdown_write()
+        # La connessione resta aperta per la risposta del remoto
+        return True
+
+    def pause_writing(self) -> None:
+        self._read_channel(False)
+
+    def resume_writing(self) -> None:
+        if not self.remote_eof and not self.closed:
+            self._read_channel(True)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.stats.active -= 1
+        self.engine.connections.discard(self)
+        # Prima si toglie il descrittore dal loop, poi si chiude il canale
+        self._read_channel(False)
+        if self.channel is not None:
+            self.channel.close()
+            self.lease.close()
+        if self.transport is not None:
+            self.transport.close()
+
+
+class ForwardEngine:
+    """Esegue molti port forwarding locali in un solo processo e un solo event loop.
+
+    Ogni tunnel ascolta su una porta locale; ogni connessione accettata
+    apre un canale direct-tcpip sulla Transport dell'istanza, condivisa
+    tramite il pool da tutti i tunnel e le connessioni verso lo stesso
+    host (e dal bastion, per le istanze con 'via'). Solo l'apertura dei
+    canali, che attende la risposta del server, passa da un piccolo pool
+    di thread: il trasferimento dei dati avviene tutto nel loop, così le
+    connessioni contemporanee possono essere migliaia.
+    """
+
+    def __init__(self, instances, tunnels: List[Tunnel], pool: Optional[ConnectionPool] = None,
+                 timeout: float = DEFAULT_TIMEOUT, open_workers: int = DEFAULT_OPEN_WORKERS):
+        self.instances = instances
+        self.tunnels = tunnels
+        self.timeout = timeout
+        self.own_pool = pool is None
+        self.pool = pool or ConnectionPool(max_size=max(64, 2 * len(tunnels)), timeout=timeout,
+                                           instances=instances)
+        self.connections: Set[_Connection] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor = ThreadPoolExecutor(max_workers=open_workers,
+                                            thread_name_prefix='forward')
+        self._stop: Optional[asyncio.Event] = None
+
+    def submit(self, fn, *args) -> asyncio.Future:
+        return self.loop.run_in_executor(self._executor, fn, *args)
+
+    def open_channel(self, tunnel: Tunnel, peer: Tuple[str, int]) -> Tuple[paramiko.Channel, ExitStack]:
+        """Apre il canale verso la destinazione del tunnel (in un thread del pool).
+
+        Il lease sulla Transport resta attivo finché il canale è aperto,
+        così il pool non la chiude per inattività o per il limite LRU.
+        """
+        forward = tunnel.forward
+        lease = ExitStack()
+        transport = lease.enter_context(self.pool.lease(tunnel.name, self.instances[tunnel.name]))
+        try:
+            channel = transport.open_channel('direct-tcpip', (forward.host, forward.host_port),
+                                             peer, timeout=self.timeout)
+        except BaseException:
+            lease.close()
+            raise
+        return channel, lease
+
+    async def _warm_up(self) -> Dict[str, str]:
+        """Apre in parallelo le connessioni delle istanze; restituisce gli errori per istanza."""
+        names = list(dict.fromkeys(tunnel.name for tunnel in self.tunnels if tunnel.listening))
+        self.pool.prefetch_dns(self.instances, names)
+        results = await asyncio.gather(
+            *(self.submit(self.pool.connect, name, self.instances[name]) for name in names),
+            return_exceptions=True)
+        return {name: str(result) or result.__class__.__name__
+                for name, result in zip(names, results) if isinstance(result, BaseException)}
+
+    async def _listen(self) -> None:
+        for tunnel in self.tunnels:
+            forward = tunnel.forward
+            try:
+                tunnel.server = await self.loop.create_server(
+                    lambda tunnel=tunnel: _Connection(self, tunnel), forward.bind, forward.port,
+                    reuse_address=True, backlog=DEFAULT_BACKLOG)
+            except OSError as e:
+                tunnel.error = e.strerror or str(e)
+
+    async def _main(self, stats_interval: float, on_ready, on_stats) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self._stop.set)
+        try:
+            await self._listen()
+            warnings = await self._warm_up()
+            if on_ready is not None:
+                on_ready(self.tunnels, warnings)
+            if not any(tunnel.listening for tunnel in self.tunnels):
+                return
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), stats_interval or None)
+                except asyncio.TimeoutError:
+                    if on_stats is not None:
+                        on_stats(self.tunnels)
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self.loop.remove_signal_handler(signum)
+            await self._shutdown()
+
+    async def _shutdown(self) -> None:
+        for tunnel in self.tunnels:
+            if tunnel.server is not None:
+                tunnel.server.close()
+        for connection in list(self.connections):
+            connection._close()
+        if self.own_pool:
+            # Chiudere le Transport sblocca anche le aperture di canale in corso
+            self.pool.close_all()
+        await self.loop.run_in_executor(None, self._executor.shutdown)
+
+    def stop(self) -> None:
+        """Ferma il motore; si può chiamare da qualsiasi thread."""
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def run(self, stats_interval: float = 0.0,
+            on_ready: Optional[Callable[[List[Tunnel], Dict[str, str]], None]] = None,
+            on_stats: Optional[Callable[[List[Tunnel]], None]] = None) -> None:
+        """Avvia i tunnel e resta in esecuzione fino a Ctrl-C, SIGTERM o stop()."""
+        _raise_fd_limit()
+        asyncio.run(self._main(stats_interval, on_ready, on_stats))
+
+
+def _raise_fd_limit() -> None:
+    # Ogni connessione usa un socket e una pipe di notifica del canale
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY
+                                                        else max(soft, 65536), hard))
+        except (ValueError, OSError):
+            pass
+
+
+def _human(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+    return f"{int(size)} B" if unit == 'B' else f"{size:.1f} {unit}"
+
+
+def print_tunnels(tunnels: List[Tunnel], warnings: Dict[str, str]) -> None:
+    """Elenco dei tunnel all'avvio, con le porte che non è stato possibile aprire."""
+    print(f"\n{Fore.CYAN}=== Port forwarding ==={Style.RESET_ALL}")
+    for tunnel in tunnels:
+        target = _join(tunnel.forward.host, tunnel.forward.host_port)
+        if tunnel.listening:
+            print(f"{Fore.GREEN}{tunnel.address}{Style.RESET_ALL} -> {target} via {tunnel.name}")
+        else:
+            print(f"{Fore.RED}{tunnel.address}{Style.RESET_ALL} -> {target} via {tunnel.name}: "
+                  f"{tunnel.error}")
+    for name, error in warnings.items():
+        print(f"{Fore.YELLOW}{name}: connessione non riuscita ({error}), "
+              f"verrà ritentata alla prima richiesta{Style.RESET_ALL}")
+    if any(tunnel.listening for tunnel in tunnels):
+        print(f"{Fore.YELLOW}Ctrl-C per terminare.{Style.RESET_ALL}")
+    sys.stdout.flush()
+
+
+FORWARD_COLUMNS = [('name', 'Istanza'), ('local', 'Locale'), ('remote', 'Destinazione'),
+                   ('connections', 'Conn.'), ('active', 'Attive'), ('failed', 'Errori'),
+                   ('bytes_in', 'Ricevuti'), ('bytes_out', 'Inviati'),
+                   ('p50_ms', 'p50 ms'), ('p99_ms', 'p99 ms')]
+
+
+def stats_rows(tunnels: List[Tunnel]) -> List[Dict]:
+    rows = []
+    for tunnel in tunnels:
+        stats = tunnel.stats
+        p50, p99 = stats.latency.quantile(0.5), stats.latency.quantile(0.99)
+        rows.append({'name': tunnel.name, 'local': tunnel.address,
+                     'remote': _join(tunnel.forward.host, tunnel.forward.host_port),
+                     'connections': stats.connections, 'active': stats.active,
+                     'failed': stats.failed, 'bytes_in': _human(stats.bytes_in),
+                     'bytes_out': _human(stats.bytes_out),
+                     'p50_ms': None if p50 is None else round(p50, 2),
+                     'p99_ms': None if p99 is None else round(p99, 2)})
+    return rows
+
+
+def print_stats(tunnels: List[Tunnel]) -> None:
+    """Tabella con connessioni, byte e latenza di apertura per tunnel."""
+    import listing
+    print(f"\n{Fore.CYAN}=== Statistiche {time.strftime('%H:%M:%S')} ==={Style.RESET_ALL}")
+    listing.write_table(stats_rows(tunnels), columns=FORWARD_COLUMNS)
+    for tunnel in tunnels:
+        if tunnel.last_error:
+            print(f"{Fore.RED}{tunnel.name} {tunnel.forward}: {tunnel.last_error}{Style.RESET_ALL}")
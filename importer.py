@@ -0,0 +1,210 @@
+import csv
+import getpass
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from tags import parse_tags
+
+DEFAULT_SSH_CONFIG = os.path.expanduser("~/.ssh/config")
+FORMATS = ('ssh', 'csv', 'jsonl')
+# Errori conservati per il riepilogo: gli altri vengono solo contati
+MAX_ERRORS = 20
+# Separatore tra parola chiave e argomento in ssh_config(5): spazi, tab o '='
+_SSH_KEYWORD_RE = re.compile(r'\s*=\s*|\s+')
+
+Record = Tuple[int, Dict]
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f"riga {line}: {message}")
+
+
+def detect_format(path: str) -> str:
+    """Formato dedotto dall'estensione; i file senza estensione nota sono ssh_config."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return 'ssh'
+
+
+def parse_ssh_config(lines: Iterable[str]) -> Iterator[Record]:
+    """Produce un record per ogni alias concreto di un blocco Host.
+
+    I blocchi con caratteri jolly (Host *, Host *.example) e i blocchi
+    Match non descrivono un host e vengono ignorati, così come le
+    direttive diverse da HostName, User, Port, IdentityFile, ProxyJump e
+    LocalForward. ProxyJump diventa il campo via solo se indica un altro
+    alias; ogni LocalForward diventa un elemento del campo forwards.
+    Parola chiave e argomento possono essere separati da spazi, tab o '='.
+
+    >>> list(parse_ssh_config(['Host\\tweb', '\\tHostName\\tweb.example', '  Port=2222']))
+    [(1, {'name': 'web', 'hostname': 'web.example', 'port': '2222'})]
+    """
+    aliases: List[str] = []
+    options: Dict[str, str] = {}
+    start = 0
+
+    def flush() -> Iterator[Record]:
+        for alias in aliases:
+            yield start, {'name': alias, **options}
+
+    for number, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        key, *rest = _SSH_KEYWORD_RE.split(line, 1)
+        key, value = key.lower(), (rest[0] if rest else '').strip().strip('"')
+        if key in ('host', 'match'):
+            yield from flush()
+            start, options = number, {}
+            aliases = [alias for alias in value.split()
+                       if key == 'host' and not any(c in alias for c in '*?!')]
+        elif key == 'hostname':
+            options.setdefault('hostname', value)
+        elif key == 'user':
+            options.setdefault('username', value)
+        elif key == 'port':
+            options.setdefault('port', value)
+        elif key == 'identityfile':
+            options.setdefault('key_path', value)
+        elif key == 'proxyjump' and value.lower() != 'none' and not any(c in value for c in '@:,'):
+            options.setdefault('via', value)
+        elif key == 'localforward':
+            # 'LocalForward 5432 db:5432' equivale a 'ssh -L 5432:db:5432'
+            options.setdefault('forwards', []).append(':'.join(value.split()))
+    yield from flush()
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Record]:
+    """Righe CSV con intestazione: name, hostname, username, port, key_path, via, tags, forwards.
+
+    I tag e i port forwarding di una riga sono separati da virgola o punto e virgola.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, {key.strip().lower(): value for key, value in row.items()
+                                if key is not None and value not in (None, '')}
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[Record]:
+    """Un oggetto JSON per riga, con gli stessi campi del file di configurazione."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = {'_error': f"JSON non valido ({e})"}
+        if not isinstance(record, dict):
+            record = {'_error': "attesa un oggetto JSON"}
+        yield number, record
+
+
+PARSERS = {'ssh': parse_ssh_config, 'csv': parse_csv, 'jsonl': parse_jsonl}
+
+
+def normalize(record: Dict, default_user: str) -> Tuple[str, Dict]:
+    """Converte un record nel formato delle istanze; ValueError se non valido."""
+    if '_error' in record:
+        raise ValueError(record['_error'])
+    hostname = record.get('hostname') or record.get('name')
+    if not hostname:
+        raise ValueError("hostname mancante")
+    name = str(record.get('name') or hostname)
+    try:
+        port = int(record.get('port') or 22)
+    except (TypeError, ValueError):
+        raise ValueError(f"porta non valida: {record.get('port')!r}")
+    key_path = record.get('key_path')
+    instance = {
+        'hostname': str(hostname),
+        'username': str(record.get('username') or default_user),
+        'port': port,
+        'key_path': os.path.expanduser(key_path) if key_path else None,
+    }
+    if record.get('via'):
+        instance['via'] = str(record['via'])
+    tags = parse_tags(record.get('tags'))
+    if tags:
+        instance['tags'] = tags
+    if record.get('forwards'):
+        # Il modulo dei tunnel carica paramiko: solo se servono
+        from forward import parse_forwards
+        instance['forwards'] = parse_forwards(record['forwards'])
+    return name, instance
+
+
+def _endpoint(instance: Dict) -> Tuple[str, str, int, str]:
+    # Lo stesso indirizzo privato dietro bastion diversi è un altro host
+    return (str(instance.get('username')), str(instance.get('hostname')).lower(),
+            int(instance.get('port') or 22), str(instance.get('via') or ''))
+
+
+def import_records(instances, records: Iterable[Record], update: bool = False,
+                   dry_run: bool = False) -> ImportResult:
+    """Importa i record con un'unica scrittura batch nell'archivio.
+
+    I record sono consumati in streaming: solo i nomi e gli endpoint
+    (utente, host, porta, bastion) già visti restano in memoria per
+    scartare i duplicati, sia rispetto alle istanze esistenti sia
+    all'interno del file. Con update le istanze con lo stesso nome
+    vengono aggiornate.
+    """
+    result = ImportResult()
+    default_user = getpass.getuser()
+    names = set()
+    endpoints = {}
+    for name, instance in instances.items():
+        names.add(name)
+        endpoints[_endpoint(instance)] = name
+
+    def accepted() -> Iterator[Tuple[str, Dict]]:
+        for line, record in records:
+            try:
+                name, instance = normalize(record, default_user)
+            except ValueError as e:
+                result.error(line, str(e))
+                continue
+            endpoint = _endpoint(instance)
+            owner = endpoints.get(endpoint)
+            if (name in names and not update) or (owner is not None and owner != name):
+                result.skipped += 1
+                continue
+            names.add(name)
+            endpoints[endpoint] = name
+            result.imported += 1
+            yield name, instance
+
+    if dry_run:
+        for _ in accepted():
+            pass
+    else:
+        instances.upsert_many(accepted())
+    return result
+
+
+def import_file(instances, path: str, fmt: Optional[str] = None, update: bool = False,
+                dry_run: bool = False) -> ImportResult:
+    """Importa un file ssh_config, CSV o JSON Lines in una sola passata."""
+    parser = PARSERS[fmt or detect_format(path)]
+    with open(os.path.expanduser(path), 'r', newline='', encoding='utf-8') as f:
+        return import_records(instances, parser(f), update=update, dry_run=dry_run)
+
+
+def import_stream(instances, stream: TextIO, fmt: str, update: bool = False,
+                  dry_run: bool = False) -> ImportResult:
+    """Come import_file, ma da uno stream già aperto (es. stdin)."""
+    return import_records(instances, PARSERS[fmt](stream), update=update, dry_run=dry_run)
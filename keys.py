@@ -0,0 +1,146 @@
+import getpass
+import os
+import sys
+import threading
+import paramiko
+from typing import Callable, Dict, List, Optional, Tuple
+
+PromptFn = Callable[[str], Optional[str]]
+
+
+def _tty_prompt(path: str) -> Optional[str]:
+    # Senza terminale non si può chiedere nulla: la chiave viene scartata
+    if not sys.stdin.isatty():
+        return None
+    try:
+        return getpass.getpass(f"Passphrase per {path}: ")
+    except (EOFError, KeyboardInterrupt):
+        return None
+
+
+def _serialized(agent_key: paramiko.AgentKey, lock: threading.Lock) -> paramiko.AgentKey:
+    """Rende sicura la firma con l'agent da più thread.
+
+    Tutte le AgentKey condividono la stessa connessione all'agent, che non
+    gestisce richieste concorrenti: le firme vengono quindi serializzate.
+    """
+    sign = agent_key.sign_ssh_data
+
+    def locked_sign(*args, **kwargs):
+        with lock:
+            return sign(*args, **kwargs)
+
+    agent_key.sign_ssh_data = locked_sign
+    return agent_key
+
+
+class KeyCache:
+    """Chiavi private caricate una sola volta per processo.
+
+    Ogni file viene letto (e, se cifrato, decifrato) alla prima richiesta e
+    il PKey risultante è condiviso da tutte le sessioni paramiko; la voce
+    è legata all'mtime del file, quindi una chiave sostituita su disco
+    viene ricaricata. Se l'agent SSH possiede già la chiave (confronto con
+    il file .pub) si usa quella dell'agent senza leggere né decifrare il
+    file. La passphrase viene chiesta al massimo una volta per file: anche
+    un tentativo fallito resta in cache fino alla modifica del file.
+    """
+
+    def __init__(self, prompt: PromptFn = _tty_prompt):
+        self.prompt = prompt
+        self._lock = threading.Lock()
+        self._prompt_lock = threading.Lock()
+        self._agent_lock = threading.Lock()
+        self._path_locks: Dict[str, threading.Lock] = {}
+        # percorso -> (mtime, chiave, errore, caricata in modo interattivo)
+        self._keys: Dict[str, Tuple[float, Optional[paramiko.PKey], Optional[str], bool]] = {}
+        self._agent: Optional[paramiko.Agent] = None
+        self._agent_keys: Optional[List[paramiko.AgentKey]] = None
+
+    def agent_keys(self) -> List[paramiko.PKey]:
+        """Chiavi dell'agent SSH, richieste una sola volta per processo."""
+        with self._lock:
+            if self._agent_keys is None:
+                try:
+                    self._agent = paramiko.Agent()
+                    self._agent_keys = [_serialized(key, self._agent_lock)
+                                        for key in self._agent.get_keys()]
+                except paramiko.SSHException:
+                    self._agent_keys = []
+            return list(self._agent_keys)
+
+    def _from_agent(self, path: str) -> Optional[paramiko.PKey]:
+        public_path = path + '.pub'
+        if not os.path.exists(public_path):
+            return None
+        try:
+            blob = paramiko.PublicBlob.from_file(public_path)
+        except (OSError, ValueError):
+            return None
+        for key in self.agent_keys():
+            if key.asbytes() == blob.key_blob:
+                return key
+        return None
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._path_locks.setdefault(path, threading.Lock())
+
+    def _load(self, path: str, interactive: bool) -> Tuple[Optional[paramiko.PKey], Optional[str]]:
+        key = self._from_agent(path)
+        if key is not None:
+            return key, None
+        try:
+            return paramiko.PKey.from_path(path), None
+        # cryptography segnala la passphrase mancante con TypeError
+        except (paramiko.PasswordRequiredException, TypeError):
+            if not interactive:
+                return None, f"La chiave {path} è protetta da passphrase"
+        except (OSError, paramiko.SSHException) as e:
+            return None, f"Impossibile leggere la chiave {path}: {str(e) or e.__class__.__name__}"
+        # Un solo prompt alla volta, anche per file diversi
+        with self._prompt_lock:
+            passphrase = self.prompt(path)
+        if not passphrase:
+            return None, f"Passphrase non fornita per {path}"
+        try:
+            # Posizionale: il parametro si chiama passphrase o password secondo la versione
+            return paramiko.PKey.from_path(path, passphrase.encode()), None
+        except (TypeError, ValueError, paramiko.SSHException):
+            return None, f"Passphrase errata per {path}"
+
+    def _stale(self, path: str, mtime: float, interactive: bool) -> bool:
+        cached = self._keys.get(path)
+        if cached is None or cached[0] != mtime:
+            return True
+        # Una chiave cifrata scartata senza prompt può ancora essere decifrata
+        return interactive and cached[1] is None and not cached[3]
+
+    def get(self, path: str, interactive: bool = True) -> paramiko.PKey:
+        """PKey per il file indicato; SSHException se non utilizzabile.
+
+        Con interactive=False una chiave cifrata non ancora decifrata viene
+        rifiutata invece di chiedere la passphrase.
+        """
+        path = os.path.realpath(os.path.expanduser(path))
+        mtime = os.stat(path).st_mtime
+        if self._stale(path, mtime, interactive):
+            with self._path_lock(path):
+                if self._stale(path, mtime, interactive):
+                    key, error = self._load(path, interactive)
+                    self._keys[path] = (mtime, key, error, interactive)
+        _, key, error, _ = self._keys[path]
+        if key is None:
+            raise paramiko.SSHException(error)
+        return key
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._agent_keys = None
+            if self._agent is not None:
+                self._agent.close()
+                self._agent = None
+
+
+KEYS = KeyCache()
@@ -0,0 +1,143 @@
+import itertools
+import json
+import shutil
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from term import Fore, Style
+
+COLUMNS: List[Tuple[str, str]] = [
+    ('name', 'Nome'),
+    ('hostname', 'Hostname'),
+    ('username', 'Username'),
+    ('port', 'Porta'),
+    ('key_path', 'Chiave SSH'),
+    ('via', 'Via'),
+    ('tags', 'Tag'),
+]
+# Blocco di righe per singola scrittura quando l'output non è paginato
+BLOCK_SIZE = 500
+
+
+def iter_rows(instances, text_filter: Optional[str] = None,
+              sort: Optional[str] = None, reverse: bool = False,
+              annotate: Optional[Callable[[Dict], Dict]] = None,
+              names: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    """Scorre le istanze come righe piatte, con filtro e ordinamento opzionali.
+
+    Senza ordinamento le righe vengono prodotte man mano che si legge
+    l'archivio; l'ordinamento richiede invece di raccogliere le righe
+    filtrate. annotate può aggiungere colonne calcolate (es. stato e
+    latenza in cache) prima di filtro e ordinamento. Con names (es. il
+    risultato di un selettore di tag) si leggono solo quelle istanze.
+    """
+    needle = text_filter.lower() if text_filter else None
+    items = ((name, instances[name]) for name in names) if names is not None else instances.items()
+    rows = ({'name': name, **instance} for name, instance in items)
+    if annotate:
+        rows = map(annotate, rows)
+    if needle:
+        rows = (row for row in rows
+                if any(needle in str(row.get(key) or '').lower()
+                       for key in ('name', 'hostname', 'username')))
+    if sort:
+        return iter(sorted(rows, key=lambda row: _sort_key(row.get(sort)), reverse=reverse))
+    return rows
+
+
+def _sort_key(value) -> Tuple[int, object]:
+    # I valori mancanti finiscono in fondo, numeri e stringhe non si mescolano
+    if value is None:
+        return (2, '')
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, str(value).lower())
+
+
+def _cell(row: Dict, key: str) -> str:
+    value = row.get(key)
+    if value is None or value == []:
+        return '-'
+    if isinstance(value, list):
+        return ','.join(map(str, value))
+    return str(value)
+
+
+def column_widths(rows: List[Dict], columns: List[Tuple[str, str]] = COLUMNS) -> List[int]:
+    """Larghezza di ogni colonna: il valore più lungo del blocco o il titolo."""
+    return [max([len(title)] + [len(_cell(row, key)) for row in rows])
+            for key, title in columns]
+
+
+def format_page(rows: List[Dict], columns: List[Tuple[str, str]] = COLUMNS,
+                color: bool = True, header: bool = True,
+                widths: Optional[List[int]] = None) -> str:
+    """Formatta un blocco di righe come tabella a colonne allineate.
+
+    Senza widths le larghezze si calcolano sul blocco stesso.
+    """
+    cells = [[_cell(row, key) for key, _ in columns] for row in rows]
+    if widths is None:
+        widths = column_widths(rows, columns)
+    lines = []
+    if header:
+        title_line = '  '.join(title.ljust(width)
+                               for (_, title), width in zip(columns, widths)).rstrip()
+        if color:
+            title_line = f"{Fore.CYAN}{title_line}{Style.RESET_ALL}"
+        lines.extend([title_line, '  '.join('-' * width for width in widths)])
+    for line in cells:
+        text = '  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+        if color:
+            # Il nome in verde, come nella vecchia vista a schede
+            text = f"{Fore.GREEN}{line[0].ljust(widths[0])}{Style.RESET_ALL}" + text[widths[0]:]
+        lines.append(text)
+    return '\n'.join(lines) + '\n'
+
+
+def default_page_size(out: TextIO = sys.stdout) -> int:
+    """Righe per pagina: l'altezza del terminale, oppure 0 se l'output non è un terminale."""
+    if not out.isatty():
+        return 0
+    return max(5, shutil.get_terminal_size().lines - 4)
+
+
+def write_table(rows: Iterable[Dict], page_size: int = 0, out: TextIO = sys.stdout,
+                columns: List[Tuple[str, str]] = COLUMNS) -> int:
+    """Scrive la tabella una pagina alla volta, con una sola write per pagina.
+
+    Con page_size > 0 e un terminale interattivo attende invio tra una
+    pagina e l'altra (q per interrompere). Restituisce le righe scritte.
+    """
+    interactive = page_size > 0 and out.isatty() and sys.stdin.isatty()
+    size = page_size if page_size > 0 else BLOCK_SIZE
+    color = out.isatty()
+    rows = iter(rows)
+    total = 0
+    page = list(itertools.islice(rows, size))
+    # Senza paginazione l'intestazione compare solo all'inizio: tutti i blocchi
+    # usano le larghezze del primo per restare allineati con essa
+    widths = None if interactive else column_widths(page, columns)
+    while page:
+        total += len(page)
+        out.write(format_page(page, columns, color, header=interactive or total == len(page),
+                              widths=widths))
+        out.flush()
+        page = list(itertools.islice(rows, size))
+        if page and interactive:
+            answer = input(f"{Fore.YELLOW}-- {total} istanze mostrate: invio per continuare, "
+                           f"q per uscire --{Style.RESET_ALL} ")
+            if answer.strip().lower() == 'q':
+                break
+    return total
+
+
+def write_jsonl(rows: Iterable[Dict], out: TextIO = sys.stdout) -> int:
+    """Scrive le righe in formato JSON Lines, a blocchi, per l'uso in pipe."""
+    total = 0
+    rows = iter(rows)
+    while True:
+        block = list(itertools.islice(rows, BLOCK_SIZE))
+        if not block:
+            return total
+        out.write(''.join(json.dumps(row) + '\n' for row in block))
+        total += len(block)
@@ -3,33 +3,125 @@ import os
 import sys
 import json
 import time
-import paramiko
-import getpass
-import inquirer
-import select
-import termios
-import tty
-from typing import Dict, List
-from inquirer import themes
-from colorama import init, Fore, Style
-
-# Inizializza colorama per il supporto dei colori su Windows
-init()
+import argparse
+from typing import Dict, List, Optional
+import store
+from term import Fore, Style, clear_screen, lazy_import
+
+# I moduli pesanti (paramiko, inquirer) vengono caricati solo al primo utilizzo,
+# così i sottocomandi non interattivi partono senza pagarne l'import
+inquirer = lazy_import('inquirer')
+fanout = lazy_import('fanout')
 
 class SSHManager:
-    def __init__(self, config_file: str = "ssh_config.json"):
-        self.config_file = config_file
-        self.instances = self.load_config()
+    def __init__(self, config_file: Optional[str] = None):
+        self.instances = self.load_config(config_file)
+        self.config_file = self.instances.path
+        self._pool = None
+        self._index = None
+        self._tags = None
+        self._facts = None
+
+    @property
+    def pool(self):
+        """Pool di connessioni, creato al primo utilizzo."""
+        # Le connessioni restano aperte tra un'operazione e l'altra
+        if self._pool is None:
+            from pool import ConnectionPool
+            self._attach_dns_cache()
+            self._pool = ConnectionPool(instances=self.instances)
+        return self._pool
+
+    def _attach_dns_cache(self) -> None:
+        # La cache DNS su disco fa risparmiare la risoluzione al primo collegamento
+        from resolver import RESOLVER, cache_path
+        RESOLVER.attach(cache_path(self.config_file))
+
+    @property
+    def index(self):
+        """Indice di ricerca delle istanze, costruito al primo utilizzo."""
+        if self._index is None:
+            from search import SearchIndex
+            self._index = SearchIndex.build(
+                (name, self._searchable(name, instance)) for name, instance in self.instances.items())
+        return self._index
+
+    def _searchable(self, name: str, instance: Dict) -> Dict:
+        # I fatti in cache si cercano come hostname e username
+        import facts
+        return {**instance, 'facts': facts.search_text(self.facts_cache.get(name))}
+
+    @property
+    def facts_cache(self) -> Dict:
+        """Fatti raccolti dagli host, letti dalla cache al primo utilizzo."""
+        if self._facts is None:
+            import facts
+            self._facts = facts.load_cache(facts.cache_path(self.config_file))
+        return self._facts
+
+    @property
+    def tag_index(self):
+        """Indice inverso dei tag, costruito al primo utilizzo."""
+        if self._tags is None:
+            from tags import TagIndex
+            self._tags = TagIndex.build(self.instances.items())
+        return self._tags
+
+    def _update_index(self, name: str) -> None:
+        # Se un indice non è ancora stato costruito lo sarà già aggiornato
+        indexes = [index for index in (self._index, self._tags) if index is not None]
+        if not indexes:
+            return
+        instance = self.instances.get(name)
+        if instance is None:
+            for index in indexes:
+                index.remove(name)
+            return
+        if self._index is not None:
+            self._index.add(name, self._searchable(name, instance))
+        if self._tags is not None:
+            self._tags.add(name, instance)
+
+    def select_instances(self, expression: str) -> List[str]:
+        """Nomi delle istanze che soddisfano un selettore di tag (es. 'env=prod & !drained')."""
+        return self.tag_index.select(expression)
 
-    def load_config(self) -> Dict:
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
-        return {}
+    def pick_instance(self, message: str) -> Optional[str]:
+        """Chiede di scegliere un'istanza con la ricerca incrementale."""
+        from picker import pick
+        return pick(self.index, message, describe=self._describe_instance)
+
+    def _describe_instance(self, name: str) -> str:
+        import facts
+        instance = self.instances[name]
+        summary = facts.describe(self.facts_cache.get(name))
+        return f"{instance['username']}@{instance['hostname']}" + (f"  {summary}" if summary else '')
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close_all()
+        resolver = sys.modules.get('resolver')
+        if resolver is not None:
+            try:
+                resolver.RESOLVER.save()
+            except OSError:
+                pass
+        # Le durate raccolte si accumulano su disco con quelle delle esecuzioni precedenti
+        metrics = sys.modules.get('metrics')
+        if metrics is not None and metrics.METRICS:
+            try:
+                metrics.save(metrics.metrics_path(self.config_file), metrics.METRICS)
+            except OSError as e:
+                print(f"{Fore.YELLOW}Impossibile salvare le metriche: {e}{Style.RESET_ALL}",
+                      file=sys.stderr)
+        self.instances.close()
+
+    def load_config(self, config_file: Optional[str] = None):
+        """Apre l'archivio delle istanze (JSON o SQLite) senza caricarlo tutto."""
+        return store.open_store(config_file)
 
     def save_config(self) -> None:
-        with open(self.config_file, 'w') as f:
-            json.dump(self.instances, f, indent=4)
+        self.instances.save()
 
     def add_instance(self) -> None:
         """Aggiunge una nuova istanza alla configurazione."""
@@ -178,6 +270,16 @@ class SSHManager:
         else:
             key_path = None
 
+        via = self._ask_via(name_answer['name'])
+        if via is False:
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
+        tags = self._ask_tags()
+        if tags is None:
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
         # Conferma finale
         print("\nRiepilogo configurazione:")
         print(f"Nome: {name_answer['name']}")
@@ -186,6 +288,10 @@ class SSHManager:
         print(f"Porta: {port}")
         if key_path:
             print(f"Chiave SSH: {key_path}")
+        if via:
+            print(f"Bastion: {via}")
+        if tags:
+            print(f"Tag: {', '.join(tags)}")
         
         confirm_question = [
             inquirer.List('action',
@@ -201,16 +307,22 @@ class SSHManager:
             print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
             return
 
-        self.instances[name_answer['name']] = {
+        instance = {
             "hostname": hostname_answer['hostname'],
             "username": username_answer['username'],
             "port": port,
             "key_path": key_path
         }
+        if via:
+            instance["via"] = via
+        if tags:
+            instance["tags"] = tags
+        self.instances[name_answer['name']] = instance
         
         print(f"\n{Fore.GREEN}Istanza '{name_answer['name']}' aggiunta con successo!{Style.RESET_ALL}")
         self._print_ssh_command(name_answer['name'])
         self.save_config()
+        self._update_index(name_answer['name'])
 
     def edit_instance(self) -> None:
         """Modifica un'istanza esistente."""
@@ -219,21 +331,11 @@ class SSHManager:
             return
 
         # Seleziona l'istanza da modificare
-        instance_choices = list(self.instances.keys())
-        instance_choices.append('Annulla')
-        
-        instance_question = [
-            inquirer.List('instance',
-                         message="Seleziona l'istanza da modificare",
-                         choices=instance_choices)
-        ]
-        
-        instance_answer = inquirer.prompt(instance_question)
-        if not instance_answer or instance_answer['instance'] == 'Annulla':
+        instance_name = self.pick_instance("Seleziona l'istanza da modificare")
+        if not instance_name:
             print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
             return
 
-        instance_name = instance_answer['instance']
         current_instance = self.instances[instance_name]
 
         print(f"\n{Fore.CYAN}=== Modifica Istanza: {instance_name} ==={Style.RESET_ALL}")
@@ -365,12 +467,24 @@ class SSHManager:
         else:
             new_key_path = current_instance.get('key_path')
 
+        new_via = self._ask_via(instance_name, current_instance.get('via'))
+        if new_via is False:
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
+        new_tags = self._ask_tags(current_instance.get('tags'))
+        if new_tags is None:
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
         # Riepilogo modifiche
         print("\nRiepilogo modifiche:")
         print(f"Hostname: {new_hostname}")
         print(f"Username: {new_username}")
         print(f"Porta: {new_port}")
         print(f"Chiave SSH: {new_key_path or 'Nessuna'}")
+        print(f"Bastion: {new_via or 'Nessuno'}")
+        print(f"Tag: {', '.join(new_tags) or 'Nessuno'}")
         
         # Conferma finale
         confirm_question = [
@@ -387,15 +501,24 @@ class SSHManager:
             print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
             return
 
-        # Aggiorna l'istanza
-        self.instances[instance_name] = {
+        # Aggiorna l'istanza, mantenendo gli eventuali altri campi
+        updated = {
+            **current_instance,
             "hostname": new_hostname,
             "username": new_username,
             "port": new_port,
             "key_path": new_key_path
         }
+        updated.pop("via", None)
+        if new_via:
+            updated["via"] = new_via
+        updated.pop("tags", None)
+        if new_tags:
+            updated["tags"] = new_tags
+        self.instances[instance_name] = updated
         
         self.save_config()
+        self._update_index(instance_name)
         print(f"\n{Fore.GREEN}Istanza '{instance_name}' modificata con successo!{Style.RESET_ALL}")
         self._print_ssh_command(instance_name)
 
@@ -407,16 +530,16 @@ class SSHManager:
             return
 
         # Seleziona l'istanza da eliminare
-        instance_question = [
-            inquirer.List('instance',
-                         message="Seleziona l'istanza da eliminare",
-                         choices=list(self.instances.keys()))
-        ]
-        instance_answer = inquirer.prompt(instance_question)
-        if not instance_answer:
+        instance_name = self.pick_instance("Seleziona l'istanza da eliminare")
+        if not instance_name:
             return
 
-        instance_name = instance_answer['instance']
+        dependents = [name for name, instance in self.instances.items()
+                      if instance.get('via') == instance_name]
+        if dependents:
+            print(f"\n{Fore.YELLOW}Attenzione: '{instance_name}' è il bastion di {len(dependents)} "
+                  f"istanze ({', '.join(dependents[:5])}{', ...' if len(dependents) > 5 else ''}), "
+                  f"che non saranno più raggiungibili.{Style.RESET_ALL}")
 
         # Chiedi conferma
         confirm_question = [
@@ -429,83 +552,397 @@ class SSHManager:
         if confirm_answer and confirm_answer['confirm']:
             del self.instances[instance_name]
             self.save_config()
+            self._update_index(instance_name)
             print(f"\n{Fore.GREEN}Istanza '{instance_name}' eliminata con successo!{Style.RESET_ALL}")
         else:
             print(f"\n{Fore.YELLOW}Eliminazione annullata.{Style.RESET_ALL}")
 
+    def _ask_via(self, name: str, current: Optional[str] = None):
+        """Chiede il bastion dell'istanza: il nome, None per nessuno, False se annullato."""
+        def validate(_, value):
+            value = value.strip()
+            if value and (value == name or value not in self.instances):
+                raise inquirer.errors.ValidationError('', reason="Istanza non trovata")
+            return True
+
+        answer = inquirer.prompt([
+            inquirer.Text('via', message="Bastion (nome di un'istanza, vuoto per connessione diretta)",
+                          default=current or '', validate=validate)
+        ])
+        if not answer:
+            return False
+        return answer['via'].strip() or None
+
+    def _ask_tags(self, current: Optional[List[str]] = None) -> Optional[List[str]]:
+        """Chiede i tag dell'istanza (es. 'env=prod, role=db'); None se annullato."""
+        from tags import parse_tags
+
+        def validate(_, value):
+            try:
+                parse_tags(value)
+            except ValueError as e:
+                raise inquirer.errors.ValidationError('', reason=str(e))
+            return True
+
+        answer = inquirer.prompt([
+            inquirer.Text('tags', message="Tag separati da virgola (es. env=prod, role=db)",
+                          default=', '.join(current or []), validate=validate)
+        ])
+        if not answer:
+            return None
+        return parse_tags(answer['tags'])
+
     def _print_ssh_command(self, instance_name: str) -> None:
         """Utility per stampare il comando SSH equivalente."""
-        instance = self.instances[instance_name]
+        import shlex
         print(f"\n{Fore.CYAN}Comando SSH equivalente:{Style.RESET_ALL}")
-        if instance.get('key_path'):
-            cmd = f"ssh -i {instance['key_path']} {instance['username']}@{instance['hostname']}"
-            if instance['port'] != 22:
-                cmd += f" -p {instance['port']}"
-        else:
-            cmd = f"ssh {instance['username']}@{instance['hostname']}"
-            if instance['port'] != 22:
-                cmd += f" -p {instance['port']}"
+        try:
+            cmd = shlex.join(self.build_ssh_command(instance_name))
+        except ValueError as e:
+            cmd = str(e)
         print(f"{Fore.YELLOW}{cmd}{Style.RESET_ALL}")
 
-    def list_instances(self) -> List[str]:
-        os.system('clear')
+    def list_instances(self, page_size: Optional[int] = None, text_filter: Optional[str] = None,
+                       sort: Optional[str] = None, reverse: bool = False,
+                       names: Optional[List[str]] = None,
+                       where: Optional[List] = None) -> int:
+        """Mostra le istanze in una tabella paginata e restituisce quante ne ha mostrate."""
+        import listing
         if not self.instances:
             print(f"\n{Fore.YELLOW}Nessuna istanza configurata.{Style.RESET_ALL}")
-            return []
+            return 0
 
         print(f"\n{Fore.CYAN}=== Istanze Disponibili ==={Style.RESET_ALL}")
-        for name, details in self.instances.items():
-            print(f"\n{Fore.WHITE}Nome: {Fore.GREEN}{name}{Style.RESET_ALL}")
-            print(f"Hostname: {details['hostname']}")
-            print(f"Username: {details['username']}")
-            if details['port'] != 22:
-                print(f"Porta: {details['port']}")
-            if details.get('key_path'):
-                print(f"Chiave SSH: {details['key_path']}")
-            
-            self._print_ssh_command(name)
-            print(f"{Fore.CYAN}{'-' * 30}{Style.RESET_ALL}")
-        
-        return list(self.instances.keys())
+        if page_size is None:
+            page_size = listing.default_page_size()
+        rows = self._iter_rows(text_filter, sort, reverse, names, where)
+        shown = listing.write_table(rows, page_size, columns=self._list_columns())
+        if not shown:
+            print(f"{Fore.YELLOW}Nessuna istanza corrisponde al filtro.{Style.RESET_ALL}")
+        return shown
 
-    def connect_to_instance(self, name: str) -> None:
-        if name not in self.instances:
-            print(f"\n{Fore.RED}Errore: Istanza '{name}' non trovata.{Style.RESET_ALL}")
+    def _probe_cache(self) -> Dict:
+        import probe
+        return probe.load_cache(probe.cache_path(self.config_file))
+
+    def _row_annotator(self):
+        """Restituisce la funzione che aggiunge alle righe i dati in cache."""
+        import facts
+        import probe
+        cache = self._probe_cache()
+        facts_cache = self.facts_cache
+        return lambda row: facts.annotate(probe.annotate(row, cache), facts_cache)
+
+    def _iter_rows(self, text_filter: Optional[str] = None, sort: Optional[str] = None,
+                   reverse: bool = False, names: Optional[List[str]] = None,
+                   where: Optional[List] = None):
+        """Righe dell'elenco con i dati in cache; where filtra sui fatti (fatto, testo)."""
+        import facts
+        import listing
+        rows = listing.iter_rows(self.instances, text_filter, sort, reverse,
+                                 annotate=self._row_annotator(), names=names)
+        if where:
+            rows = (row for row in rows if facts.matches(row, where))
+        return rows
+
+    def _list_columns(self) -> List:
+        import facts
+        import listing
+        import probe
+        columns = list(listing.COLUMNS)
+        if self._probe_cache():
+            columns += probe.PROBE_COLUMNS
+        return columns + facts.columns(self.facts_cache)
+
+    def probe_instances(self, names: Optional[List[str]] = None, auth: bool = False,
+                        concurrency: Optional[int] = None, timeout: Optional[float] = None) -> List:
+        """Verifica la raggiungibilità delle istanze e aggiorna la cache."""
+        import probe
+        if names is None:
+            names = list(self.instances.keys())
+        self._attach_dns_cache()
+        results = probe.probe_instances(
+            self.instances, names, auth=auth,
+            concurrency=concurrency or probe.DEFAULT_CONCURRENCY,
+            timeout=timeout or probe.DEFAULT_TIMEOUT)
+        probe.save_cache(probe.cache_path(self.config_file), results)
+        return results
+
+    def gather_facts(self, names: List[str], specs: Optional[List[str]] = None,
+                     max_age: Optional[float] = None, force: bool = False,
+                     workers: int = 32, timeout: float = 30.0, pool=None):
+        """Raccoglie i fatti dagli host non aggiornati e li salva nella cache.
+
+        Restituisce i fatti richiesti e i risultati della raccolta, che
+        riguarda solo gli host senza dati recenti (tutti con force).
+        """
+        import facts
+        wanted = facts.parse_specs(specs)
+        path = facts.cache_path(self.config_file)
+        cache = facts.load_cache(path)
+        if force:
+            stale = list(names)
+        else:
+            stale = facts.stale_names(cache, names, list(wanted),
+                                      facts.DEFAULT_MAX_AGE if max_age is None else max_age)
+        results = []
+        if stale:
+            self._attach_dns_cache()
+            results = facts.gather(self.instances, stale, wanted, max_workers=workers,
+                                   timeout=timeout, pool=pool)
+            facts.save_cache(path, results)
+            # Cache e indice di ricerca si rileggono con i nuovi fatti
+            self._facts = None
+            self._index = None
+        return wanted, results
+
+    def calibrate_transport(self, name: str, size: int, repeat: int, timeout: float,
+                            data: Optional[bytes] = None, on_measure=None):
+        """Misura il throughput dell'istanza con vari profili di trasporto.
+
+        Le istanze dietro un bastion vengono misurate attraverso di esso:
+        il bastion usa la connessione del pool, con il suo profilo.
+        """
+        import tuning
+        instance = self.instances[name]
+        via = instance.get('via')
+        if not via:
+            self._attach_dns_cache()
+            return tuning.calibrate(name, instance, size=size, repeat=repeat, timeout=timeout,
+                                    data=data, on_measure=on_measure)
+        with self.pool.lease(via, self.instances[via]) as bastion:
+            return tuning.calibrate(name, instance, size=size, repeat=repeat, timeout=timeout,
+                                    data=data, bastion=bastion, on_measure=on_measure)
+
+    def save_tuning(self, names: List[str], config: Optional[Dict]) -> None:
+        """Salva il profilo di trasporto sulle istanze, o lo rimuove con config None."""
+        for name in names:
+            updated = dict(self.instances[name])
+            updated.pop('tuning', None)
+            if config:
+                updated['tuning'] = config
+            self.instances[name] = updated
+        self.save_config()
+
+    def import_instances(self, path: str, fmt: Optional[str] = None, update: bool = False,
+                         dry_run: bool = False):
+        """Importa istanze da ssh_config, CSV o JSON Lines con un'unica scrittura."""
+        import importer
+        if path == '-':
+            result = importer.import_stream(self.instances, sys.stdin, fmt or 'ssh',
+                                            update=update, dry_run=dry_run)
+        else:
+            result = importer.import_file(self.instances, path, fmt, update=update,
+                                          dry_run=dry_run)
+        if result.imported and not dry_run:
+            # Più semplice ricostruire gli indici al prossimo utilizzo
+            self._index = None
+            self._tags = None
+        return result
+
+    def import_interactive(self) -> None:
+        """Chiede il file da importare e mostra il riepilogo."""
+        import importer
+        answers = inquirer.prompt([
+            inquirer.Text('path', message="File da importare (ssh_config, .csv, .jsonl)",
+                          default=importer.DEFAULT_SSH_CONFIG)
+        ])
+        if not answers or not answers['path'].strip():
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+        path = os.path.expanduser(answers['path'].strip())
+        if not os.path.isfile(path):
+            print(f"\n{Fore.RED}Errore: file '{path}' non trovato.{Style.RESET_ALL}")
             return
+        print_import_result(self.import_instances(path))
 
+    def _bastion_chain(self, name: str) -> List[str]:
+        """Bastion dell'istanza, dal più vicino al più lontano; ValueError se la catena non è valida."""
+        chain = []
         instance = self.instances[name]
-        
+        while instance.get('via'):
+            via = instance['via']
+            if via not in self.instances:
+                raise ValueError(f"Bastion '{via}' non trovato")
+            if via == name or via in chain:
+                raise ValueError(f"Catena di bastion circolare: {' -> '.join([name] + chain + [via])}")
+            chain.append(via)
+            instance = self.instances[via]
+        return chain
+
+    def _jump_args(self, name: str) -> List[str]:
+        chain = self._bastion_chain(name)
+        if not chain:
+            return []
+        bastions = [self.instances[via] for via in chain]
+        if not any(bastion.get('key_path') for bastion in bastions):
+            # ssh -J vuole i salti nell'ordine in cui vengono attraversati
+            hops = [f"{b['username']}@{b['hostname']}" + (f":{b['port']}" if b['port'] != 22 else '')
+                    for b in reversed(bastions)]
+            return ['-J', ','.join(hops)]
+        # -J non applica -i ai bastion: ProxyCommand porta con sé la chiave di ciascuno
+        import shlex
+        proxy = self.build_ssh_command(chain[0])
+        proxy[-1:-1] = ['-W', '%h:%p']
+        return ['-o', f"ProxyCommand={shlex.join(proxy)}"]
+
+    def build_ssh_command(self, name: str) -> List[str]:
+        """Costruisce la riga di comando ssh per un'istanza, con i bastion se presenti."""
+        instance = self.instances[name]
+        cmd = ['ssh']
+        if instance['port'] != 22:
+            cmd.extend(['-p', str(instance['port'])])
+        if instance.get('key_path'):
+            cmd.extend(['-i', instance['key_path']])
+        cmd.extend(self._jump_args(name))
+        cmd.append(f"{instance['username']}@{instance['hostname']}")
+        return cmd
+
+    def connect_to_instance(self, name: str, native: bool = False,
+                            record: Optional[str] = None) -> int:
+        """Apre una sessione interattiva con ssh oppure, con native, direttamente in paramiko.
+
+        La sessione integrata riusa la connessione del pool quando l'host è
+        stato usato di recente ed è usata automaticamente se ssh non è installato.
+        Con record (un percorso, '' per quello predefinito) o se l'istanza ha
+        'record': true la sessione viene registrata. Restituisce il codice di uscita.
+        """
+        if name not in self.instances:
+            print(f"\n{Fore.RED}Errore: Istanza '{name}' non trovata.{Style.RESET_ALL}")
+            return 1
+
+        if record is None and self.instances[name].get('record'):
+            record = ''
+        import shutil
+        if native or shutil.which('ssh') is None:
+            return self.native_shell(name, record=record)
+
         try:
             import subprocess
-            
-            if instance.get('key_path'):
-                cmd = ['ssh']
-                if instance['port'] != 22:
-                    cmd.extend(['-p', str(instance['port'])])
-                cmd.extend([
-                    '-i', instance['key_path'],
-                    f"{instance['username']}@{instance['hostname']}"
-                ])
-            else:
-                cmd = ['ssh']
-                if instance['port'] != 22:
-                    cmd.extend(['-p', str(instance['port'])])
-                cmd.append(f"{instance['username']}@{instance['hostname']}")
+
+            cmd = self.build_ssh_command(name)
 
             print(f"\n{Fore.YELLOW}Connessione in corso...{Style.RESET_ALL}")
             print(f"{Fore.GREEN}Esecuzione comando: {' '.join(cmd)}{Style.RESET_ALL}")
             
-            process = subprocess.run(cmd)
+            if record is not None:
+                import shell
+                with self._recorder(name, record) as recorder:
+                    returncode = shell.interactive_command(cmd, recorder)
+            else:
+                returncode = subprocess.run(cmd).returncode
             
-            if process.returncode != 0:
-                print(f"\n{Fore.RED}La connessione è terminata con codice di errore: {process.returncode}{Style.RESET_ALL}")
+            if returncode != 0:
+                print(f"\n{Fore.RED}La connessione è terminata con codice di errore: {returncode}{Style.RESET_ALL}")
+            return returncode
             
         except Exception as e:
             print(f"\n{Fore.RED}Errore durante la connessione: {str(e)}{Style.RESET_ALL}")
+            return 255
+
+    def _recorder(self, name: str, path: str):
+        """Avvia la registrazione della sessione; path vuoto per quello predefinito."""
+        import recording
+        import shell
+        path = path or recording.default_path(self.config_file, name)
+        width, height = shell.terminal_size(sys.stdout.fileno())
+        recorder = recording.Recorder(path, {'instance': name, 'width': width, 'height': height,
+                                             'term': os.environ.get('TERM', 'xterm')})
+        print(f"{Fore.YELLOW}Registrazione della sessione in '{path}'{Style.RESET_ALL}")
+        return recorder
+
+    def native_shell(self, name: str, record: Optional[str] = None) -> int:
+        """Shell interattiva sul trasporto del pool; restituisce il codice di uscita remoto."""
+        import shell
+        instance = self.instances[name]
+        reused = name in self.pool
+        print(f"\n{Fore.YELLOW}Connessione in corso{' (connessione riutilizzata)' if reused else ''}...{Style.RESET_ALL}")
+        recorder = None
+        try:
+            width, height = shell.terminal_size(sys.stdout.fileno())
+            with self.pool.shell(name, instance, term=os.environ.get('TERM', 'xterm'),
+                                 width=width, height=height) as channel:
+                if record is not None:
+                    recorder = self._recorder(name, record)
+                status = shell.interactive_shell(channel, recorder)
+        except Exception as e:
+            print(f"\n{Fore.RED}Errore durante la connessione: {str(e)}{Style.RESET_ALL}")
+            return 255
+        finally:
+            if recorder is not None:
+                recorder.close()
+        if status not in (0, -1):
+            print(f"\n{Fore.RED}La connessione è terminata con codice di errore: {status}{Style.RESET_ALL}")
+        return status
+
+    def exec_on_instances(self) -> None:
+        """Esegue un comando su più istanze in parallelo."""
+        if not self.instances:
+            print(f"\n{Fore.YELLOW}Nessuna istanza configurata.{Style.RESET_ALL}")
+            return
+
+        names = self._ask_targets()
+        if not names:
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
+        questions = [
+            inquirer.Text('command', message="Comando da eseguire"),
+            inquirer.Text('timeout', message="Timeout per host (secondi)",
+                          default=str(int(fanout.DEFAULT_TIMEOUT)))
+        ]
+        answers = inquirer.prompt(questions)
+        if not answers or not answers['command'].strip():
+            print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+            return
+
+        print(f"\n{Fore.YELLOW}Esecuzione su {len(names)} istanze...{Style.RESET_ALL}")
+        results = fanout.run_on_instances(self.instances, names, answers['command'],
+                                          timeout=float(answers['timeout']),
+                                          pool=self.pool)
+        fanout.print_results(results)
+
+    def _ask_targets(self) -> Optional[List[str]]:
+        """Sceglie le istanze con un selettore di tag oppure una per una."""
+        def validate(_, value):
+            if value.strip():
+                try:
+                    if not self.select_instances(value):
+                        raise inquirer.errors.ValidationError('', reason="Nessuna istanza corrisponde")
+                except ValueError as e:
+                    raise inquirer.errors.ValidationError('', reason=str(e))
+            return True
+
+        answer = inquirer.prompt([
+            inquirer.Text('select', message="Selettore di tag (es. env=prod & !drained, "
+                                            "vuoto per scegliere le istanze)",
+                          validate=validate)
+        ])
+        if not answer:
+            return None
+        if answer['select'].strip():
+            names = self.select_instances(answer['select'])
+            print(f"\n{Fore.CYAN}{len(names)} istanze selezionate.{Style.RESET_ALL}")
+            return names
+        answer = inquirer.prompt([
+            inquirer.Checkbox('instances',
+                              message="Seleziona le istanze (spazio per selezionare)",
+                              choices=list(self.instances.keys()))
+        ])
+        return answer['instances'] if answer else None
 
-def main():
-    manager = SSHManager()
-    os.system('clear')
+def print_import_result(result, dry_run: bool = False) -> None:
+    verb = "da importare" if dry_run else "importate"
+    print(f"\n{Fore.GREEN}{result.imported} istanze {verb}{Style.RESET_ALL}, "
+          f"{result.skipped} duplicate, {result.failed} non valide.")
+    for error in result.errors:
+        print(f"{Fore.RED}  {error}{Style.RESET_ALL}")
+    if result.failed > len(result.errors):
+        print(f"{Fore.RED}  ... e altri {result.failed - len(result.errors)} errori{Style.RESET_ALL}")
+
+
+def interactive_menu(manager: SSHManager) -> None:
+    clear_screen()
     
     while True:
         questions = [
@@ -514,9 +951,14 @@ def main():
                          choices=[
                              ('Lista istanze', 'list'),
                              ('Aggiungi istanza', 'add'),
+                             ('Importa istanze da file', 'import'),
                              ('Modifica istanza', 'edit'),
                              ('Elimina istanza', 'delete'),
                              ('Connetti a istanza', 'connect'),
+                             ('Connetti a istanza (shell integrata)', 'connect_native'),
+                             ('Esegui comando su più istanze', 'exec'),
+                             ('Verifica raggiungibilità', 'probe'),
+                             ('Raccogli informazioni sugli host', 'facts'),
                              ('Esci', 'exit')
                          ],
                          )
@@ -525,37 +967,716 @@ def main():
         answers = inquirer.prompt(questions)
         
         if answers['action'] == 'list':
-            os.system('clear')
+            clear_screen()
             manager.list_instances()
         elif answers['action'] == 'add':
-            os.system('clear')
+            clear_screen()
             manager.add_instance()
+        elif answers['action'] == 'import':
+            clear_screen()
+            manager.import_interactive()
         elif answers['action'] == 'edit':
-            os.system('clear')
+            clear_screen()
             manager.edit_instance()
         elif answers['action'] == 'delete':
-            os.system('clear')
+            clear_screen()
             manager.delete_instance()
-        elif answers['action'] == 'connect':
-            os.system('clear')
-            instance_list = manager.list_instances()
-            if instance_list:
-                instance_question = [
-                    inquirer.List('instance',
-                                message="Seleziona l'istanza a cui connettersi",
-                                choices=instance_list + [('Annulla', 'cancel')]
-                                )
-                ]
-                instance_answer = inquirer.prompt(instance_question)
-                if instance_answer['instance'] != 'cancel':
-                    manager.connect_to_instance(instance_answer['instance'])
-                if instance_answer['instance'] == 'cancel':
-                    print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
-                    time.sleep(1)
-                    os.system('clear')
+        elif answers['action'] in ('connect', 'connect_native'):
+            clear_screen()
+            if not manager.instances:
+                print(f"\n{Fore.YELLOW}Nessuna istanza configurata.{Style.RESET_ALL}")
+                continue
+            instance_name = manager.pick_instance("Cerca l'istanza a cui connettersi")
+            if instance_name:
+                manager.connect_to_instance(instance_name,
+                                            native=answers['action'] == 'connect_native')
+            else:
+                print(f"\n{Fore.YELLOW}Operazione annullata.{Style.RESET_ALL}")
+                time.sleep(1)
+                clear_screen()
+        elif answers['action'] == 'exec':
+            clear_screen()
+            manager.exec_on_instances()
+        elif answers['action'] == 'probe':
+            clear_screen()
+            if not manager.instances:
+                print(f"\n{Fore.YELLOW}Nessuna istanza configurata.{Style.RESET_ALL}")
+                continue
+            print(f"\n{Fore.YELLOW}Verifica di {len(manager.instances)} istanze...{Style.RESET_ALL}")
+            import probe
+            probe.print_results(manager.probe_instances())
+        elif answers['action'] == 'facts':
+            clear_screen()
+            if not manager.instances:
+                print(f"\n{Fore.YELLOW}Nessuna istanza configurata.{Style.RESET_ALL}")
+                continue
+            import facts
+            names = list(manager.instances.keys())
+            print(f"\n{Fore.YELLOW}Raccolta dei fatti non aggiornati...{Style.RESET_ALL}")
+            wanted, results = manager.gather_facts(names, pool=manager.pool)
+            facts.print_results(names, results, manager.facts_cache, list(wanted))
         elif answers['action'] == 'exit':
             print(f"\n{Fore.YELLOW}Arrivederci!{Style.RESET_ALL}")
+            manager.close()
             break
 
+def cmd_list(manager: SSHManager, args: argparse.Namespace) -> int:
+    import facts
+    names = None
+    try:
+        if args.select:
+            names = manager.select_instances(args.select)
+        where = facts.parse_conditions(args.where)
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    if args.format == 'jsonl':
+        import listing
+        listing.write_jsonl(manager._iter_rows(args.filter, args.sort, args.reverse, names, where))
+        return 0
+    manager.list_instances(page_size=args.page_size, text_filter=args.filter,
+                           sort=args.sort, reverse=args.reverse, names=names, where=where)
+    return 0
+
+
+def cmd_facts(manager: SSHManager, args: argparse.Namespace) -> int:
+    import facts
+    names = _target_names(manager, args, default_all=True)
+    if names is None:
+        return 1
+    try:
+        wanted, results = manager.gather_facts(names, args.fact, max_age=args.max_age,
+                                               force=args.force, workers=args.workers,
+                                               timeout=args.timeout)
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    facts.print_results(names, results, manager.facts_cache, list(wanted))
+    return 0 if all(r.error is None for r in results) else 1
+
+
+def cmd_tags(manager: SSHManager, args: argparse.Namespace) -> int:
+    counts = manager.tag_index.counts()
+    if not counts:
+        print(f"{Fore.YELLOW}Nessun tag assegnato.{Style.RESET_ALL}")
+        return 0
+    import listing
+    listing.write_table(({'tag': tag, 'count': count} for tag, count in counts),
+                        columns=TAGS_COLUMNS)
+    return 0
+
+
+def cmd_connect(manager: SSHManager, args: argparse.Namespace) -> int:
+    import shutil
+    if args.name not in manager.instances:
+        print(f"{Fore.RED}Errore: Istanza '{args.name}' non trovata.{Style.RESET_ALL}")
+        return 1
+    record = args.record
+    if record is None and manager.instances[args.name].get('record'):
+        record = ''
+    if args.native or (not args.dry_run and shutil.which('ssh') is None):
+        status = manager.native_shell(args.name, record=record)
+        return 0 if status == -1 else status
+    try:
+        cmd = manager.build_ssh_command(args.name)
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    if args.dry_run:
+        import shlex
+        print(shlex.join(cmd))
+        return 0
+    if record is not None:
+        # La registrazione richiede che i byte passino da questo processo
+        return manager.connect_to_instance(args.name, record=record)
+    # Il processo viene sostituito da ssh: nessun fork e nessun import aggiuntivo
+    sys.stdout.flush()
+    os.execvp(cmd[0], cmd)
+
+
+def _target_names(manager: SSHManager, args: argparse.Namespace,
+                  default_all: bool = False) -> Optional[List[str]]:
+    """Risolve le istanze indicate con -n/-s/--all; None (con errore stampato) se non valide."""
+    if args.all or (default_all and not args.names and not args.select):
+        return list(manager.instances.keys())
+    names = args.names or []
+    missing = [name for name in names if name not in manager.instances]
+    if missing:
+        print(f"{Fore.RED}Errore: istanze non trovate: {', '.join(missing)}{Style.RESET_ALL}")
+        return None
+    if args.select:
+        try:
+            selected = manager.select_instances(args.select)
+        except ValueError as e:
+            print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+            return None
+        if not selected and not names:
+            print(f"{Fore.RED}Errore: nessuna istanza corrisponde a '{args.select}'.{Style.RESET_ALL}")
+            return None
+        # -n e -s si sommano, senza ripetere le istanze
+        names = list(dict.fromkeys(names + selected))
+    if not names:
+        print(f"{Fore.RED}Errore: specifica almeno un'istanza con -n, -s oppure --all.{Style.RESET_ALL}")
+        return None
+    return names
+
+
+def cmd_exec(manager: SSHManager, args: argparse.Namespace) -> int:
+    names = _target_names(manager, args)
+    if names is None:
+        return 1
+    manager._attach_dns_cache()
+    results = fanout.run_on_instances(manager.instances, names, args.remote_command,
+                                      max_workers=args.workers, timeout=args.timeout)
+    fanout.print_results(results, show_output=not args.quiet)
+    return 0 if all(r.ok for r in results) else 1
+
+
+def cmd_rollout(manager: SSHManager, args: argparse.Namespace) -> int:
+    import rollout
+    names = _target_names(manager, args)
+    if names is None:
+        return 1
+    try:
+        # Errori nei parametri prima di toccare qualsiasi host
+        rollout.parse_amount(args.batch, len(names))
+        rollout.parse_amount(args.max_failures, len(names))
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    manager._attach_dns_cache()
+    checkpoint = rollout.Checkpoint(args.checkpoint or rollout.checkpoint_path(manager.config_file))
+    try:
+        outcome = rollout.rollout(
+            manager.instances, names, args.remote_command, batch=args.batch,
+            max_in_flight=args.max_in_flight, max_failures=args.max_failures,
+            pause=args.pause, timeout=args.timeout, checkpoint=checkpoint, resume=args.resume,
+            on_wave=rollout.print_wave,
+            on_result=lambda result, progress: rollout.print_progress(
+                result, progress, show_output=not args.quiet))
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    except KeyboardInterrupt:
+        print(f"\n{Fore.YELLOW}Rollout interrotto: riprendi con --resume "
+              f"(checkpoint in '{checkpoint.path}').{Style.RESET_ALL}")
+        return 130
+    progress = outcome.progress
+    fanout.print_summary(outcome.results)
+    if progress.skipped:
+        print(f"{progress.skipped} istanze già completate in un'esecuzione precedente.")
+    if outcome.stopped:
+        print(f"\n{Fore.RED}Rollout fermato dopo {progress.failed} errori: "
+              f"{len(outcome.pending)} istanze non eseguite. Riprendi con --resume "
+              f"(checkpoint in '{checkpoint.path}').{Style.RESET_ALL}")
+    elif not outcome.ok:
+        print(f"\n{Fore.YELLOW}{progress.failed} errori entro la soglia: riprendi con --resume "
+              f"per ritentare solo le istanze fallite.{Style.RESET_ALL}")
+    else:
+        print(f"\n{Fore.GREEN}Rollout completato in {progress.elapsed:.1f}s.{Style.RESET_ALL}")
+    return 0 if outcome.ok else 1
+
+
+def cmd_probe(manager: SSHManager, args: argparse.Namespace) -> int:
+    import probe
+    names = _target_names(manager, args, default_all=True)
+    if names is None:
+        return 1
+    results = manager.probe_instances(names, auth=args.auth, concurrency=args.concurrency,
+                                      timeout=args.timeout)
+    probe.print_results(results)
+    return 0 if all(r.reachable for r in results) else 1
+
+
+def cmd_push(manager: SSHManager, args: argparse.Namespace) -> int:
+    import sftp
+    if not os.path.isfile(args.local):
+        print(f"{Fore.RED}Errore: file '{args.local}' non trovato.{Style.RESET_ALL}")
+        return 1
+    names = _target_names(manager, args)
+    if names is None:
+        return 1
+    manager._attach_dns_cache()
+    results = sftp.push(manager.instances, names, args.local, args.remote,
+                        max_workers=args.workers, checksum=args.checksum,
+                        resume=args.resume)
+    sftp.print_results(results)
+    return 0 if all(r.ok for r in results) else 1
+
+
+def cmd_pull(manager: SSHManager, args: argparse.Namespace) -> int:
+    import sftp
+    names = _target_names(manager, args)
+    if names is None:
+        return 1
+    manager._attach_dns_cache()
+    results = sftp.pull(manager.instances, names, args.remote, args.local_dir,
+                        max_workers=args.workers, checksum=args.checksum,
+                        resume=args.resume)
+    sftp.print_results(results)
+    return 0 if all(r.ok for r in results) else 1
+
+
+def cmd_tail(manager: SSHManager, args: argparse.Namespace) -> int:
+    import re
+    import tail
+    names = _target_names(manager, args)
+    if names is None:
+        return 1
+    manager._attach_dns_cache()
+    try:
+        errors = tail.tail(manager.instances, names, args.path, pattern=args.grep,
+                           invert=args.invert_match, ignore_case=args.ignore_case,
+                           lines=args.lines, follow=not args.no_follow,
+                           buffer_lines=args.buffer)
+    except re.error as e:
+        print(f"{Fore.RED}Errore: regex non valida: {e}{Style.RESET_ALL}")
+        return 1
+    return 1 if errors else 0
+
+
+def cmd_forward(manager: SSHManager, args: argparse.Namespace) -> int:
+    import forward
+    try:
+        if args.local:
+            if not args.names or len(args.names) != 1 or args.select or args.all:
+                print(f"{Fore.RED}Errore: -L richiede una sola istanza indicata con -n.{Style.RESET_ALL}")
+                return 1
+            name = args.names[0]
+            if name not in manager.instances:
+                print(f"{Fore.RED}Errore: Istanza '{name}' non trovata.{Style.RESET_ALL}")
+                return 1
+            tunnels = forward.configured({name: {'forwards': args.local}}, [name])
+        else:
+            names = _target_names(manager, args, default_all=True)
+            if names is None:
+                return 1
+            tunnels = forward.configured(manager.instances, names)
+    except ValueError as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    if not tunnels:
+        print(f"{Fore.YELLOW}Nessun port forwarding configurato: aggiungi il campo 'forwards' "
+              f"alle istanze oppure usa -L.{Style.RESET_ALL}")
+        return 1
+    manager._attach_dns_cache()
+    engine = forward.ForwardEngine(manager.instances, tunnels, timeout=args.timeout,
+                                   open_workers=args.workers)
+    engine.run(stats_interval=args.stats_interval, on_ready=forward.print_tunnels,
+               on_stats=forward.print_stats)
+    if any(tunnel.listening for tunnel in tunnels):
+        forward.print_stats(tunnels)
+    return 0 if all(tunnel.listening for tunnel in tunnels) else 1
+
+
+def cmd_calibrate(manager: SSHManager, args: argparse.Namespace) -> int:
+    import tuning
+    if args.name not in manager.instances:
+        print(f"{Fore.RED}Errore: Istanza '{args.name}' non trovata.{Style.RESET_ALL}")
+        return 1
+    targets = [args.name]
+    if args.apply_to:
+        try:
+            targets += [name for name in manager.select_instances(args.apply_to) if name != args.name]
+        except ValueError as e:
+            print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+            return 1
+    if args.reset:
+        manager.save_tuning(targets, None)
+        print(f"{Fore.GREEN}Profilo di trasporto rimosso da {len(targets)} istanze.{Style.RESET_ALL}")
+        return 0
+    size = args.size * 1024 * 1024
+    data = None
+    if args.sample:
+        try:
+            with open(args.sample, 'rb') as f:
+                data = f.read(size)
+        except OSError as e:
+            print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+            return 1
+        if not data:
+            print(f"{Fore.RED}Errore: il file '{args.sample}' è vuoto.{Style.RESET_ALL}")
+            return 1
+    sample_mb = len(data) / (1024 * 1024) if data else args.size
+    print(f"{Fore.CYAN}Calibrazione di '{args.name}' con {sample_mb:.1f} MiB per misura..."
+          f"{Style.RESET_ALL}")
+    calibration = manager.calibrate_transport(args.name, size, args.repeat, args.timeout,
+                                              data=data, on_measure=tuning.print_measure)
+    tuning.print_summary(calibration)
+    if calibration.best is None:
+        return 1
+    if args.dry_run:
+        print(f"{Fore.YELLOW}Profilo non salvato (--dry-run).{Style.RESET_ALL}")
+        return 0
+    if not calibration.improved:
+        # Un profilo salvato in precedenza renderebbe la connessione più lenta
+        manager.save_tuning(targets, None)
+        print(f"{Fore.GREEN}Nessun profilo salvato su {len(targets)} istanze.{Style.RESET_ALL}")
+        return 0
+    manager.save_tuning(targets, tuning.saved_config(calibration))
+    print(f"{Fore.GREEN}Profilo salvato su {len(targets)} istanze.{Style.RESET_ALL}")
+    return 0
+
+
+TAGS_COLUMNS = [('tag', 'Tag'), ('count', 'Istanze')]
+
+METRICS_COLUMNS = [('host', 'Istanza'), ('phase', 'Fase'), ('count', 'N'),
+                   ('mean_ms', 'Media ms'), ('p50_ms', 'p50 ms'), ('p99_ms', 'p99 ms')]
+
+
+def cmd_metrics(manager: SSHManager, args: argparse.Namespace) -> int:
+    import metrics
+    path = metrics.metrics_path(manager.config_file)
+    if args.reset:
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"{Fore.GREEN}Metriche azzerate.{Style.RESET_ALL}")
+        return 0
+    data = metrics.load(path)
+    if args.names or args.phase:
+        data = data.filter(args.names, args.phase)
+    if args.format == 'prometheus':
+        sys.stdout.write(data.to_prometheus())
+    elif args.format == 'json':
+        json.dump({'summary': data.summary(), **data.to_dict()}, sys.stdout)
+        sys.stdout.write('\n')
+    elif not data:
+        print(f"{Fore.YELLOW}Nessuna metrica registrata.{Style.RESET_ALL}")
+    else:
+        import listing
+        listing.write_table(data.summary(), columns=METRICS_COLUMNS)
+    return 0
+
+
+def cmd_replay(manager: SSHManager, args: argparse.Namespace) -> int:
+    import re
+    import recording
+    try:
+        rec = recording.Recording(args.file)
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}Errore: {e}{Style.RESET_ALL}")
+        return 1
+    with rec:
+        if args.info:
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(rec.meta.get('started', 0)))
+            print(f"Istanza: {rec.meta.get('instance', '-')}\nInizio: {started}\n"
+                  f"Durata: {recording.format_time(rec.duration)}\nBlocchi: {len(rec)}\n"
+                  f"Dimensione: {os.path.getsize(args.file)} byte\n"
+                  f"Chiusa correttamente: {'sì' if rec.complete else 'no'}")
+            return 0
+        if args.grep:
+            try:
+                pattern = re.compile(args.grep.encode(), re.IGNORECASE if args.ignore_case else 0)
+            except re.error as e:
+                print(f"{Fore.RED}Errore: regex non valida: {e}{Style.RESET_ALL}")
+                return 1
+            kinds = (recording.INPUT,) if args.input else (recording.OUTPUT,)
+            found = 0
+            for moment, line in rec.grep(pattern, kinds, args.start):
+                found += 1
+                print(f"{Fore.CYAN}{recording.format_time(moment)}{Style.RESET_ALL}  {line}")
+            return 0 if found else 1
+        try:
+            recording.replay(rec, sys.stdout.fileno(), speed=args.speed, start=args.start,
+                             max_idle=args.max_idle)
+        except KeyboardInterrupt:
+            pass
+        sys.stdout.write(Style.RESET_ALL + '\n')
+    return 0
+
+
+def cmd_import(manager: SSHManager, args: argparse.Namespace) -> int:
+    if args.path != '-' and not os.path.isfile(os.path.expanduser(args.path)):
+        print(f"{Fore.RED}Errore: file '{args.path}' non trovato.{Style.RESET_ALL}")
+        return 1
+    result = manager.import_instances(args.path, args.format, update=args.update,
+                                      dry_run=args.dry_run)
+    print_import_result(result, dry_run=args.dry_run)
+    return 0 if not result.failed else 1
+
+
+def cmd_migrate(manager: SSHManager, args: argparse.Namespace) -> int:
+    source, target = store.migration_paths(args.config)
+    source, target = args.source or source, args.target or target
+    if not os.path.exists(source):
+        print(f"{Fore.RED}Errore: file '{source}' non trovato.{Style.RESET_ALL}")
+        return 1
+    count = store.migrate_json_to_sqlite(source, target)
+    print(f"{Fore.GREEN}{count} istanze migrate in '{target}' "
+          f"(originale salvato in '{source}.bak').{Style.RESET_ALL}")
+    return 0
+
+
+def _add_target_args(parser: argparse.ArgumentParser, all_help: str) -> None:
+    parser.add_argument('-n', '--name', action='append', dest='names',
+                        help="Istanza di destinazione (ripetibile)")
+    parser.add_argument('-s', '--select', metavar='SELETTORE',
+                        help="Istanze con i tag indicati, es. 'env=prod & role=db & !drained'")
+    parser.add_argument('--all', action='store_true', help=all_help)
+
+
+def _add_transfer_args(parser: argparse.ArgumentParser) -> None:
+    _add_target_args(parser, "Usa tutte le istanze")
+    parser.add_argument('--checksum', action='store_true',
+                        help="Salta solo i file con sha256 identico, invece di confrontare "
+                             "dimensione e data di modifica")
+    parser.add_argument('--resume', action='store_true',
+                        help="Riprende i file .part lasciati da un trasferimento interrotto, "
+                             "se il loro contenuto coincide")
+    parser.add_argument('--workers', type=int, default=16,
+                        help="Numero massimo di host in parallelo")
+
+
+# Fatti predefiniti (facts.FACTS), qui per non importare il modulo all'avvio
+FACT_NAMES = ['os', 'kernel', 'arch', 'distro', 'cpus', 'mem_mb', 'disk_root', 'load', 'uptime_days']
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="SSH Connection Manager. Senza sottocomandi avvia il menu interattivo.")
+    parser.add_argument('--config', default=None,
+                        help="Archivio delle istanze: file .json oppure database .db "
+                             f"(default: {store.DEFAULT_DB} se esiste, altrimenti {store.DEFAULT_JSON})")
+    subparsers = parser.add_subparsers(dest='command')
+
+    list_parser = subparsers.add_parser('list', help="Elenca le istanze configurate")
+    list_parser.add_argument('--format', choices=['table', 'jsonl'], default='table',
+                             help="Tabella paginata oppure JSON Lines per le pipe")
+    list_parser.add_argument('--filter', help="Mostra solo le istanze che contengono il testo "
+                                              "nel nome, hostname o username")
+    list_parser.add_argument('--sort', choices=['name', 'hostname', 'username', 'port',
+                                                'key_path', 'via', 'status', 'latency']
+                             + [f"fact.{name}" for name in FACT_NAMES],
+                             help="Campo di ordinamento (status e latency dall'ultimo probe, "
+                                  "fact.<nome> dai fatti raccolti)")
+    list_parser.add_argument('--where', action='append', metavar='FATTO=TESTO',
+                             help="Mostra solo le istanze il cui fatto contiene il testo, "
+                                  "es. distro=ubuntu (ripetibile)")
+    list_parser.add_argument('-s', '--select', metavar='SELETTORE',
+                             help="Mostra solo le istanze con i tag indicati (es. 'env=prod & !drained')")
+    list_parser.add_argument('--reverse', action='store_true', help="Ordine decrescente")
+    list_parser.add_argument('--page-size', type=int, default=None,
+                             help="Righe per pagina (0 per disattivare la paginazione)")
+
+    subparsers.add_parser('tags', help="Elenca i tag assegnati e quante istanze li hanno")
+
+    facts_parser = subparsers.add_parser(
+        'facts', help="Raccoglie informazioni sugli host (OS, kernel, disco, load...) in cache")
+    _add_target_args(facts_parser, "Tutte le istanze (default)")
+    facts_parser.add_argument('--fact', action='append',
+                              help="Fatto da raccogliere: uno tra " + ', '.join(FACT_NAMES)
+                                   + " oppure nome=comando (ripetibile)")
+    facts_parser.add_argument('--max-age', type=float, default=None,
+                              help="Età in secondi oltre la quale i fatti vengono aggiornati "
+                                   "(default: 3600)")
+    facts_parser.add_argument('--force', action='store_true',
+                              help="Aggiorna anche i fatti recenti")
+    facts_parser.add_argument('--workers', type=int, default=32,
+                              help="Numero massimo di host in parallelo")
+    facts_parser.add_argument('--timeout', type=float, default=30.0,
+                              help="Timeout per host in secondi")
+
+    connect_parser = subparsers.add_parser('connect', help="Si connette a un'istanza con ssh")
+    connect_parser.add_argument('name', help="Nome dell'istanza")
+    connect_parser.add_argument('--dry-run', action='store_true',
+                                help="Stampa il comando ssh senza eseguirlo")
+    connect_parser.add_argument('--native', action='store_true',
+                                help="Usa la shell integrata (paramiko) invece del comando ssh")
+    connect_parser.add_argument('--record', nargs='?', const='', default=None, metavar='FILE',
+                                help="Registra la sessione (default: recordings/<istanza>-<data>.rec "
+                                     "accanto alla configurazione)")
+
+    replay_parser = subparsers.add_parser('replay',
+                                          help="Riproduce o cerca in una sessione registrata")
+    replay_parser.add_argument('file', help="File di registrazione (.rec)")
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help="Velocità di riproduzione (0 per scrivere tutto subito)")
+    replay_parser.add_argument('--from', dest='start', type=float, default=0.0,
+                               help="Parte da questo istante, in secondi")
+    replay_parser.add_argument('--max-idle', type=float, default=2.0,
+                               help="Pausa massima tra due frame, in secondi")
+    replay_parser.add_argument('-g', '--grep', help="Mostra le righe che corrispondono alla regex, "
+                                                    "con l'istante, invece di riprodurre")
+    replay_parser.add_argument('-i', '--ignore-case', action='store_true',
+                               help="Ignora maiuscole/minuscole in --grep")
+    replay_parser.add_argument('--input', action='store_true',
+                               help="Con --grep cerca nei tasti digitati invece che nell'output")
+    replay_parser.add_argument('--info', action='store_true',
+                               help="Mostra solo i dati della registrazione")
+
+    exec_parser = subparsers.add_parser('exec', help="Esegue un comando su più istanze in parallelo")
+    exec_parser.add_argument('remote_command', help="Comando da eseguire")
+    _add_target_args(exec_parser, "Esegue su tutte le istanze")
+    exec_parser.add_argument('--timeout', type=float, default=30.0,
+                             help="Timeout per host in secondi")
+    exec_parser.add_argument('--workers', type=int, default=32,
+                             help="Numero massimo di host in parallelo")
+    exec_parser.add_argument('-q', '--quiet', action='store_true',
+                             help="Mostra solo la tabella riassuntiva")
+
+    rollout_parser = subparsers.add_parser(
+        'rollout', help="Esegue un comando a ondate, fermandosi oltre una soglia di errori")
+    rollout_parser.add_argument('remote_command', help="Comando da eseguire")
+    _add_target_args(rollout_parser, "Esegue su tutte le istanze")
+    rollout_parser.add_argument('--batch', default='10%',
+                                help="Istanze per ondata, numero o percentuale (default: 10%%)")
+    rollout_parser.add_argument('--max-in-flight', type=int, default=32,
+                                help="Istanze in esecuzione contemporaneamente (default: 32)")
+    rollout_parser.add_argument('--max-failures', default='0',
+                                help="Errori tollerati prima di fermarsi, numero o percentuale "
+                                     "del totale (default: 0)")
+    rollout_parser.add_argument('--pause', type=float, default=0.0,
+                                help="Secondi di attesa tra un'ondata e la successiva")
+    rollout_parser.add_argument('--timeout', type=float, default=30.0,
+                                help="Timeout per host in secondi")
+    rollout_parser.add_argument('--checkpoint',
+                                help="File di checkpoint (default: <config>.rollout.jsonl)")
+    rollout_parser.add_argument('--resume', action='store_true',
+                                help="Riprende dal checkpoint saltando le istanze già completate")
+    rollout_parser.add_argument('-q', '--quiet', action='store_true',
+                                help="Non mostra l'output dei comandi")
+
+    probe_parser = subparsers.add_parser('probe',
+                                         help="Verifica in parallelo la raggiungibilità delle istanze")
+    _add_target_args(probe_parser, "Verifica tutte le istanze (default)")
+    probe_parser.add_argument('--auth', action='store_true',
+                              help="Esegue anche l'autenticazione SSH completa")
+    probe_parser.add_argument('--concurrency', type=int, default=512,
+                              help="Numero massimo di verifiche contemporanee")
+    probe_parser.add_argument('--timeout', type=float, default=5.0,
+                              help="Timeout per host in secondi")
+
+    push_parser = subparsers.add_parser('push', help="Carica un file su più istanze via SFTP")
+    push_parser.add_argument('local', help="File locale")
+    push_parser.add_argument('remote', help="Percorso remoto di destinazione")
+    _add_transfer_args(push_parser)
+
+    pull_parser = subparsers.add_parser('pull', help="Scarica un file da più istanze via SFTP")
+    pull_parser.add_argument('remote', help="Percorso remoto del file")
+    pull_parser.add_argument('local_dir', help="Directory locale (un file per istanza in <dir>/<istanza>/)")
+    _add_transfer_args(pull_parser)
+
+    tail_parser = subparsers.add_parser('tail', help="Segue lo stesso file di log su più istanze")
+    tail_parser.add_argument('path', help="Percorso remoto del file di log")
+    _add_target_args(tail_parser, "Segue il file su tutte le istanze")
+    tail_parser.add_argument('-g', '--grep', help="Mostra solo le righe che corrispondono alla regex")
+    tail_parser.add_argument('-v', '--invert-match', action='store_true',
+                             help="Mostra le righe che NON corrispondono a --grep")
+    tail_parser.add_argument('-i', '--ignore-case', action='store_true',
+                             help="Ignora maiuscole/minuscole in --grep")
+    tail_parser.add_argument('--lines', type=int, default=10,
+                             help="Righe iniziali mostrate per host")
+    tail_parser.add_argument('--no-follow', action='store_true',
+                             help="Mostra le ultime righe ed esce")
+    tail_parser.add_argument('--buffer', type=int, default=1000,
+                             help="Righe in attesa per host prima di rallentarne la lettura")
+
+    forward_parser = subparsers.add_parser(
+        'forward', help="Avvia i port forwarding locali configurati (come ssh -L) in un solo processo")
+    _add_target_args(forward_parser, "Tutte le istanze con port forwarding configurati (default)")
+    forward_parser.add_argument('-L', '--local', action='append', metavar='[BIND:]PORTA:HOST:PORTA',
+                                help="Port forwarding aggiuntivo per l'istanza indicata con -n, "
+                                     "invece di quelli configurati (ripetibile)")
+    forward_parser.add_argument('--stats-interval', type=float, default=0.0,
+                                help="Mostra le statistiche ogni N secondi (default: solo all'uscita)")
+    forward_parser.add_argument('--timeout', type=float, default=30.0,
+                                help="Timeout di connessione e di apertura dei canali in secondi")
+    forward_parser.add_argument('--workers', type=int, default=64,
+                                help="Aperture di canale contemporanee")
+
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help="Misura il throughput con vari cifrari, finestre e compressione "
+                          "e salva il profilo di trasporto migliore")
+    calibrate_parser.add_argument('name', help="Istanza su cui misurare")
+    calibrate_parser.add_argument('--size', type=int, default=8,
+                                  help="MiB caricati e scaricati via SFTP per ogni misura (default: 8)")
+    calibrate_parser.add_argument('--repeat', type=int, default=2,
+                                  help="Ripetizioni per combinazione, si tiene la migliore")
+    calibrate_parser.add_argument('--sample', metavar='FILE',
+                                  help="Usa questo file come dati di prova (default: misto "
+                                       "di dati casuali e testo)")
+    calibrate_parser.add_argument('--timeout', type=float, default=30.0,
+                                  help="Timeout di connessione in secondi")
+    calibrate_parser.add_argument('--apply-to', metavar='SELETTORE',
+                                  help="Salva il profilo anche sulle istanze con questi tag, "
+                                       "es. 'region=eu-west'")
+    calibrate_parser.add_argument('--dry-run', action='store_true',
+                                  help="Misura senza salvare il profilo")
+    calibrate_parser.add_argument('--reset', action='store_true',
+                                  help="Rimuove il profilo salvato e torna ai default")
+
+    import_parser = subparsers.add_parser('import',
+                                          help="Importa istanze da ssh_config, CSV o JSON Lines")
+    import_parser.add_argument('path', nargs='?', default=os.path.expanduser("~/.ssh/config"),
+                               help="File da importare, '-' per stdin (default: ~/.ssh/config)")
+    import_parser.add_argument('--format', choices=['ssh', 'csv', 'jsonl'],
+                               help="Formato del file (default: dedotto dall'estensione)")
+    import_parser.add_argument('--update', action='store_true',
+                               help="Aggiorna le istanze esistenti con lo stesso nome")
+    import_parser.add_argument('--dry-run', action='store_true',
+                               help="Mostra cosa verrebbe importato senza scrivere")
+
+    metrics_parser = subparsers.add_parser('metrics',
+                                           help="Mostra le durate delle fasi di connessione per host")
+    metrics_parser.add_argument('-n', '--name', action='append', dest='names',
+                                help="Mostra solo questa istanza (ripetibile)")
+    metrics_parser.add_argument('--phase', action='append',
+                                choices=['dns', 'tcp', 'tunnel', 'banner', 'kex', 'auth', 'connect', 'channel', 'exec',
+                                         'forward'],
+                                help="Mostra solo questa fase (ripetibile)")
+    metrics_parser.add_argument('--format', choices=['table', 'json', 'prometheus'], default='table',
+                                help="Formato di output (default: table)")
+    metrics_parser.add_argument('--reset', action='store_true', help="Azzera le metriche salvate")
+
+    migrate_parser = subparsers.add_parser('migrate',
+                                           help="Migra le istanze dal file JSON a SQLite")
+    migrate_parser.add_argument('--source',
+                                help="File JSON di origine (default: quello indicato con --config)")
+    migrate_parser.add_argument('--target',
+                                help="Database SQLite di destinazione (default: il file JSON con "
+                                     "estensione .db)")
+
+    return parser.parse_args(argv)
+
+
+COMMANDS = {
+    'list': cmd_list,
+    'tags': cmd_tags,
+    'facts': cmd_facts,
+    'connect': cmd_connect,
+    'replay': cmd_replay,
+    'exec': cmd_exec,
+    'rollout': cmd_rollout,
+    'probe': cmd_probe,
+    'push': cmd_push,
+    'pull': cmd_pull,
+    'tail': cmd_tail,
+    'forward': cmd_forward,
+    'calibrate': cmd_calibrate,
+    'import': cmd_import,
+    'metrics': cmd_metrics,
+    'migrate': cmd_migrate,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.command == 'migrate':
+        return cmd_migrate(None, args)
+    manager = SSHManager(args.config)
+    if args.command is None:
+        interactive_menu(manager)
+        return 0
+    try:
+        return COMMANDS[args.command](manager, args)
+    except BrokenPipeError:
+        # Output chiuso in anticipo (es. '| head'): si esce senza traceback
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    finally:
+        manager.close()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,197 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PHASES = ('dns', 'tcp', 'tunnel', 'banner', 'kex', 'auth', 'connect', 'channel', 'exec', 'forward')
+# Limiti superiori dei bucket in ms, in progressione geometrica (2^(1/4)):
+# l'errore sui quantili resta sotto il 10% da 0.25 ms a oltre un minuto
+BUCKETS: List[float] = [round(0.25 * 2 ** (i / 4), 4) for i in range(73)]
+
+
+class Histogram:
+    """Istogramma a bucket fissi delle durate in millisecondi."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.sum += ms
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Stima del quantile per interpolazione lineare nel bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def to_dict(self) -> Dict:
+        # Solo i bucket non vuoti: il file resta piccolo anche con molti host
+        return {'sum': self.sum, 'count': self.count,
+                'buckets': {str(i): c for i, c in enumerate(self.counts) if c}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Histogram":
+        hist = cls()
+        hist.sum = data.get('sum', 0.0)
+        hist.count = data.get('count', 0)
+        for i, count in data.get('buckets', {}).items():
+            hist.counts[int(i)] = count
+        return hist
+
+
+class Metrics:
+    """Raccoglie le durate per fase e per host.
+
+    Le osservazioni restano in memoria come istogrammi; save() le somma a
+    quelle salvate dalle esecuzioni precedenti, così p50/p99 riflettono
+    lo storico di ogni host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], Histogram] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._series)
+
+    def observe(self, phase: str, host: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._series.get((phase, host))
+            if hist is None:
+                hist = self._series[(phase, host)] = Histogram()
+            hist.observe(seconds * 1000)
+
+    @contextmanager
+    def timer(self, phase: str, host: str) -> Iterator[None]:
+        """Misura il blocco; le durate delle fasi fallite non vengono registrate."""
+        start = time.perf_counter()
+        yield
+        self.observe(phase, host, time.perf_counter() - start)
+
+    def series(self) -> List[Tuple[str, str, Histogram]]:
+        with self._lock:
+            return sorted((phase, host, hist) for (phase, host), hist in self._series.items())
+
+    def merge(self, other: "Metrics") -> None:
+        for phase, host, hist in other.series():
+            with self._lock:
+                self._series.setdefault((phase, host), Histogram()).merge(hist)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def filter(self, hosts: Optional[List[str]] = None,
+               phases: Optional[List[str]] = None) -> "Metrics":
+        """Sottoinsieme delle serie per gli host e le fasi indicati."""
+        selected = Metrics()
+        for phase, host, hist in self.series():
+            if (not hosts or host in hosts) and (not phases or phase in phases):
+                selected._series[(phase, host)] = hist
+        return selected
+
+    def to_dict(self) -> Dict:
+        return {'buckets': BUCKETS,
+                'series': [{'phase': phase, 'host': host, **hist.to_dict()}
+                           for phase, host, hist in self.series()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Metrics":
+        metrics = cls()
+        # Bucket diversi (versione precedente) non sono confrontabili
+        if data.get('buckets') != BUCKETS:
+            return metrics
+        for entry in data.get('series', []):
+            metrics._series[(entry['phase'], entry['host'])] = Histogram.from_dict(entry)
+        return metrics
+
+    def summary(self) -> List[Dict]:
+        """Una riga per fase e host con conteggio, media, p50 e p99 in ms."""
+        rows = []
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        series = sorted(self.series(), key=lambda s: (s[1], order.get(s[0], len(order)), s[0]))
+        for phase, host, hist in series:
+            rows.append({'host': host, 'phase': phase, 'count': hist.count,
+                         'mean_ms': round(hist.sum / hist.count, 2) if hist.count else None,
+                         'p50_ms': _round(hist.quantile(0.5)),
+                         'p99_ms': _round(hist.quantile(0.99))})
+        return rows
+
+    def to_prometheus(self, prefix: str = 'sshmgr') -> str:
+        """Esporta gli istogrammi nel formato testuale di Prometheus."""
+        name = f"{prefix}_phase_duration_ms"
+        lines = [f"# HELP {name} Durata delle fasi di connessione e dei canali SSH.",
+                 f"# TYPE {name} histogram"]
+        for phase, host, hist in self.series():
+            labels = f'phase="{phase}",host="{_escape(host)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum:.4f}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metrics_path(config_file: str) -> str:
+    return os.path.splitext(config_file)[0] + '.metrics.json'
+
+
+def load(path: str) -> Metrics:
+    if not os.path.exists(path):
+        return Metrics()
+    try:
+        with open(path, 'r') as f:
+            return Metrics.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return Metrics()
+
+
+def save(path: str, metrics: Metrics) -> None:
+    """Somma le nuove osservazioni a quelle su disco e le azzera in memoria."""
+    from store import file_lock
+    with file_lock(path):
+        total = load(path)
+        total.merge(metrics)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(total.to_dict(), f)
+        os.replace(tmp_path, path)
+    metrics.clear()
+
+
+# Osservazioni del processo corrente
+METRICS = Metrics()
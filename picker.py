@@ -0,0 +1,75 @@
+import os
+import sys
+import termios
+import tty
+from typing import Callable, List, Optional
+from search import SearchIndex
+from term import Fore, Style
+
+KEY_UP = ('\x1b[A', '\x1bOA', '\x10')
+KEY_DOWN = ('\x1b[B', '\x1bOB', '\x0e')
+KEY_ENTER = ('\r', '\n')
+KEY_BACKSPACE = ('\x7f', '\x08')
+KEY_CANCEL = ('\x1b', '\x03', '\x04')
+
+
+def _read_key(fd: int) -> str:
+    data = os.read(fd, 32)
+    return data.decode(errors='ignore')
+
+
+def pick(index: SearchIndex, message: str, limit: int = 10,
+         describe: Optional[Callable[[str], str]] = None) -> Optional[str]:
+    """Selettore incrementale: filtra le istanze a ogni tasto premuto.
+
+    Restituisce il nome scelto oppure None se l'utente annulla con Esc o
+    Ctrl-C. describe, se indicato, fornisce il testo mostrato accanto a
+    ciascun nome.
+    """
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    query = ''
+    selected = 0
+    drawn = 0
+    results: List[str] = index.search(query, limit)
+
+    def render() -> None:
+        nonlocal drawn
+        # Un'unica scrittura per frame: cursore a inizio blocco, poi pulizia
+        lines = [f"{Fore.CYAN}?{Style.RESET_ALL} {message}: {query}"]
+        for i, name in enumerate(results):
+            detail = f"  {Style.DIM}{describe(name)}{Style.RESET_ALL}" if describe else ''
+            if i == selected:
+                lines.append(f"{Fore.GREEN}> {name}{Style.RESET_ALL}{detail}")
+            else:
+                lines.append(f"  {name}{detail}")
+        if not results:
+            lines.append(f"  {Fore.YELLOW}Nessuna istanza trovata{Style.RESET_ALL}")
+        lines.append(f"{Style.DIM}(frecce per scegliere, invio per confermare, esc per annullare){Style.RESET_ALL}")
+        up = f"\x1b[{drawn}A" if drawn else ''
+        sys.stdout.write(up + '\r\x1b[J' + '\r\n'.join(lines) + '\r\n')
+        sys.stdout.flush()
+        drawn = len(lines)
+
+    try:
+        tty.setraw(fd)
+        render()
+        while True:
+            key = _read_key(fd)
+            if key in KEY_ENTER:
+                return results[selected] if results else None
+            if key in KEY_CANCEL:
+                return None
+            if key in KEY_UP:
+                selected = max(0, selected - 1)
+            elif key in KEY_DOWN:
+                selected = min(max(len(results) - 1, 0), selected + 1)
+            elif key in KEY_BACKSPACE:
+                query = query[:-1]
+                results, selected = index.search(query, limit), 0
+            elif key.isprintable():
+                query += key
+                results, selected = index.search(query, limit), 0
+            render()
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
@@ -0,0 +1,282 @@
+import select
+import threading
+import time
+import paramiko
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from metrics import METRICS
+from resolver import RESOLVER
+from transport import DEFAULT_TIMEOUT, open_transport, open_tunnel
+
+DEFAULT_MAX_SIZE = 64
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_KEEPALIVE = 30
+MAX_HOPS = 8
+
+
+@dataclass
+class _Entry:
+    transport: paramiko.Transport
+    last_used: float = field(default_factory=time.monotonic)
+    leases: int = 0
+    # Bastion da cui passa la connessione: resta in uso finché questa è aperta
+    parent: Optional["_Entry"] = None
+
+
+class ConnectionPool:
+    """Pool di Transport autenticate, indicizzate per nome istanza.
+
+    Ogni operazione apre un nuovo canale su una Transport già autenticata,
+    così dalla seconda operazione su un host non si ripete l'handshake.
+    Le Transport inattive oltre idle_timeout vengono chiuse e, superato
+    max_size, si scarta la meno usata di recente tra quelle non in uso.
+
+    Le istanze con 'via' passano dal bastion indicato (un'altra istanza di
+    instances): la sua Transport viene aperta una sola volta e ogni
+    istanza dietro di esso usa un canale direct-tcpip su quella
+    connessione. Il bastion resta aperto finché c'è almeno un'istanza
+    collegata tramite esso.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 keepalive: int = DEFAULT_KEEPALIVE,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 instances=None):
+        self.instances = instances
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def _host_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._host_locks.setdefault(name, threading.Lock())
+
+    def _take(self, name: str) -> Optional[_Entry]:
+        """Restituisce l'entry se ancora valida, marcandola come in uso."""
+        with self._lock:
+            self._evict_locked()
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if not entry.transport.is_active():
+                del self._entries[name]
+                self._close_locked(entry)
+                return None
+            entry.leases += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(name)
+            return entry
+
+    def _close_locked(self, entry: _Entry) -> None:
+        entry.transport.close()
+        if entry.parent is not None:
+            entry.parent.leases -= 1
+            entry.parent.last_used = time.monotonic()
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        for name, entry in list(self._entries.items()):
+            if entry.leases == 0 and now - entry.last_used > self.idle_timeout:
+                del self._entries[name]
+                self._close_locked(entry)
+        # Limite LRU: le entry in uso (compresi i bastion con connessioni attive) non vengono mai chiuse
+        for name, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_size:
+                break
+            if entry.leases == 0:
+                del self._entries[name]
+                self._close_locked(entry)
+
+    def _bastion_chain(self, name: str, instance: Dict) -> None:
+        """Verifica che la catena di bastion esista e non contenga cicli."""
+        seen = [name]
+        while instance.get('via'):
+            via = instance['via']
+            if self.instances is None or via not in self.instances:
+                raise paramiko.SSHException(f"Bastion '{via}' di '{seen[-1]}' non trovato")
+            if via in seen or len(seen) > MAX_HOPS:
+                raise paramiko.SSHException(f"Catena di bastion non valida: {' -> '.join(seen + [via])}")
+            seen.append(via)
+            instance = self.instances[via]
+
+    def _acquire(self, name: str, instance: Dict) -> _Entry:
+        entry = self._take(name)
+        if entry is not None:
+            return entry
+        via = instance.get('via')
+        if via:
+            self._bastion_chain(name, instance)
+        # Un solo handshake per host anche con richieste concorrenti
+        with self._host_lock(name):
+            entry = self._take(name)
+            if entry is not None:
+                return entry
+            parent = self._acquire(via, self.instances[via]) if via else None
+            try:
+                sock = open_tunnel(parent.transport, instance, self.timeout, name) if parent else None
+                transport = open_transport(instance, self.timeout, label=name, sock=sock)
+            except Exception:
+                if parent is not None:
+                    self._release(parent)
+                raise
+            if self.keepalive:
+                transport.set_keepalive(self.keepalive)
+            # Il lease sul bastion preso da _acquire resta finché questa entry è aperta
+            entry = _Entry(transport=transport, leases=1, parent=parent)
+            with self._lock:
+                self._entries[name] = entry
+                self._evict_locked()
+            return entry
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            self._evict_locked()
+
+    @contextmanager
+    def lease(self, name: str, instance: Dict) -> Iterator[paramiko.Transport]:
+        """Fornisce la Transport dell'istanza, proteggendola dall'eviction durante l'uso."""
+        entry = self._acquire(name, instance)
+        try:
+            yield entry.transport
+        finally:
+            self._release(entry)
+
+    def get_transport(self, name: str, instance: Dict) -> paramiko.Transport:
+        """Restituisce la Transport dell'istanza, aprendola se necessario.
+
+        Non tiene un lease: va bene solo per letture immediate come
+        remote_version. Per aprire canali usare lease() o session().
+        """
+        entry = self._acquire(name, instance)
+        self._release(entry)
+        return entry.transport
+
+    def connect(self, name: str, instance: Dict) -> None:
+        """Apre la connessione dell'istanza in anticipo, senza usarla."""
+        with self.lease(name, instance):
+            pass
+
+    def prefetch_dns(self, instances, names: Iterable[str]) -> int:
+        """Risolve in parallelo gli host senza una connessione aperta, prima di un'operazione in blocco.
+
+        Per le istanze dietro un bastion si risolve il primo bastion della
+        catena: gli altri nomi li risolve il bastion stesso.
+        """
+        targets = set()
+        for name in names:
+            if name in self._entries:
+                continue
+            instance = instances[name]
+            for _ in range(MAX_HOPS):
+                via = instance.get('via')
+                if not via or via not in instances:
+                    break
+                name, instance = via, instances[via]
+            if name not in self._entries:
+                targets.add((instance['hostname'], instance.get('port', 22)))
+        return RESOLVER.prefetch(targets)
+
+    @contextmanager
+    def session(self, name: str, instance: Dict,
+                window_size: Optional[int] = None) -> Iterator[paramiko.Channel]:
+        """Canale di sessione chiuso all'uscita dal with.
+
+        Il lease sulla Transport resta attivo finché il canale è aperto,
+        così il pool non la chiude per inattività o per il limite LRU.
+        """
+        with self.lease(name, instance) as transport:
+            with METRICS.timer('channel', name):
+                if window_size is None:
+                    channel = transport.open_session(timeout=self.timeout)
+                else:
+                    channel = transport.open_session(window_size=window_size, timeout=self.timeout)
+            try:
+                yield channel
+            finally:
+                channel.close()
+
+    @contextmanager
+    def sftp(self, name: str, instance: Dict) -> Iterator[paramiko.SFTPClient]:
+        """Client SFTP con il profilo dell'istanza, chiuso all'uscita dal with insieme al lease."""
+        from sftp import open_sftp
+        with self.lease(name, instance) as transport:
+            client = open_sftp(transport, instance)
+            try:
+                yield client
+            finally:
+                client.close()
+
+    @contextmanager
+    def shell(self, name: str, instance: Dict, term: str = 'xterm',
+              width: int = 80, height: int = 24) -> Iterator[paramiko.Channel]:
+        with self.session(name, instance) as channel:
+            channel.get_pty(term=term, width=width, height=height)
+            channel.invoke_shell()
+            yield channel
+
+    def exec_command(self, name: str, instance: Dict, command: str,
+                     timeout: float = DEFAULT_TIMEOUT) -> Tuple[int, bytes, bytes]:
+        """Esegue un comando su un nuovo canale e ne restituisce codice, stdout e stderr."""
+        with self.lease(name, instance) as transport:
+            with METRICS.timer('channel', name):
+                channel = transport.open_session(timeout=timeout)
+            try:
+                with METRICS.timer('exec', name):
+                    channel.exec_command(command)
+                    stdout, stderr = read_channel(channel, timeout)
+                    status = channel.recv_exit_status()
+                return status, stdout, stderr
+            finally:
+                channel.close()
+
+    def close(self, name: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._close_locked(entry)
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            # Prima le connessioni che passano da un bastion, poi i bastion
+            for entry in sorted(entries, key=lambda e: e.parent is None):
+                self._close_locked(entry)
+
+
+def read_channel(channel: paramiko.Channel, timeout: float) -> Tuple[bytes, bytes]:
+    """Legge stdout e stderr di un canale fino alla chiusura.
+
+    I due flussi vengono letti insieme, così uno stderr abbondante non
+    esaurisce la finestra SSH mentre si è in attesa di stdout.
+    """
+    stdout, stderr = [], []
+    deadline = time.monotonic() + timeout
+    while True:
+        while channel.recv_ready():
+            stdout.append(channel.recv(65536))
+        while channel.recv_stderr_ready():
+            stderr.append(channel.recv_stderr(65536))
+        if (channel.eof_received or channel.closed) and not channel.recv_ready() \
+                and not channel.recv_stderr_ready():
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Timeout in attesa dell'output del comando")
+        select.select([channel], [], [], min(remaining, 1.0))
+    return b''.join(stdout), b''.join(stderr)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+from resolver import RESOLVER, targets
+from term import Fore, Style
+
+DEFAULT_CONCURRENCY = 512
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_TTL = 300.0
+# Descrittori lasciati liberi per il resto del processo
+FD_RESERVE = 64
+
+PROBE_COLUMNS = [('status', 'Stato'), ('latency', 'Latenza (ms)')]
+
+
+@dataclass
+class ProbeResult:
+    name: str
+    hostname: str
+    port: int
+    reachable: bool = False
+    banner: Optional[str] = None
+    connect_ms: Optional[float] = None
+    banner_ms: Optional[float] = None
+    auth_ms: Optional[float] = None
+    error: Optional[str] = None
+    checked_at: float = 0.0
+
+
+def _fd_limit(concurrency: int) -> int:
+    """Limita la concorrenza in base ai descrittori di file disponibili."""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - FD_RESERVE))
+
+
+def _auth(name: str, instance: Dict, timeout: float) -> None:
+    from transport import open_transport
+    open_transport(instance, timeout, label=name).close()
+
+
+def _via_bastion(pool, name: str, instance: Dict) -> str:
+    """Connessione completa tramite il bastion; restituisce il banner del server."""
+    try:
+        return pool.get_transport(name, instance).remote_version
+    finally:
+        # Il bastion resta nel pool per le istanze successive
+        pool.close(name)
+
+
+async def _probe_via(name: str, instance: Dict, result: ProbeResult,
+                     executor: ThreadPoolExecutor, pool) -> None:
+    # Dietro un bastion non c'è una connessione TCP diretta da misurare
+    start = time.perf_counter()
+    try:
+        result.banner = await asyncio.get_running_loop().run_in_executor(
+            executor, _via_bastion, pool, name, instance)
+        result.auth_ms = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        result.error = f"Tramite {instance['via']}: {str(e) or e.__class__.__name__}"
+
+
+async def _probe_one(name: str, instance: Dict, timeout: float, semaphore: asyncio.Semaphore,
+                     executor: Optional[ThreadPoolExecutor], auth: bool = False,
+                     pool=None) -> ProbeResult:
+    result = ProbeResult(name=name, hostname=instance['hostname'],
+                         port=instance.get('port', 22), checked_at=time.time())
+    async with semaphore:
+        if instance.get('via'):
+            await _probe_via(name, instance, result, executor, pool)
+            result.reachable = result.error is None
+            return result
+        try:
+            # Già in cache dopo il prefetch: nessuna attesa del DNS nel ciclo di eventi
+            address = RESOLVER.resolve(result.hostname, result.port)[0][4]
+        except OSError as e:
+            result.error = f"DNS: {str(e) or e.__class__.__name__}"
+            return result
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(address[0], address[1]), timeout)
+        except Exception as e:
+            result.error = str(e) or e.__class__.__name__
+            return result
+        result.connect_ms = (time.perf_counter() - start) * 1000
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            result.banner_ms = (time.perf_counter() - start) * 1000
+            result.banner = line.decode(errors='replace').strip()
+            if not result.banner.startswith('SSH-'):
+                result.error = "Banner SSH non valido"
+        except Exception as e:
+            result.error = f"Banner non ricevuto: {str(e) or e.__class__.__name__}"
+        finally:
+            writer.close()
+            # Senza attendere la chiusura i trasporti restano al GC ("unclosed transport")
+            with suppress(Exception):
+                await asyncio.wait_for(writer.wait_closed(), timeout)
+
+        if auth and result.error is None:
+            start = time.perf_counter()
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    executor, _auth, name, instance, timeout)
+                result.auth_ms = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                result.error = f"Autenticazione fallita: {str(e) or e.__class__.__name__}"
+    result.reachable = result.error is None
+    return result
+
+
+async def _probe_all(instances, names: List[str], concurrency: int, timeout: float,
+                     auth: bool) -> List[ProbeResult]:
+    semaphore = asyncio.Semaphore(_fd_limit(concurrency))
+    tunneled = any(instances[name].get('via') for name in names)
+    # L'autenticazione paramiko è bloccante: gira in un pool di thread limitato
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, 64)) if auth or tunneled else None
+    pool = None
+    if tunneled:
+        from pool import ConnectionPool
+        pool = ConnectionPool(max_size=len(names), timeout=timeout, instances=instances)
+    try:
+        return await asyncio.gather(*(
+            _probe_one(name, instances[name], timeout, semaphore, executor, auth, pool)
+            for name in names))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if pool is not None:
+            pool.close_all()
+
+
+def probe_instances(instances, names: List[str], concurrency: int = DEFAULT_CONCURRENCY,
+                    timeout: float = DEFAULT_TIMEOUT, auth: bool = False) -> List[ProbeResult]:
+    """Verifica in parallelo connessione TCP e banner SSH (e, se richiesto, l'autenticazione)."""
+    if not names:
+        return []
+    # I nomi dietro un bastion vengono risolti dal bastion
+    RESOLVER.prefetch(targets(instances, [name for name in names if not instances[name].get('via')]))
+    return asyncio.run(_probe_all(instances, names, concurrency, timeout, auth))
+
+
+def cache_path(config_file: str) -> str:
+    return os.path.splitext(config_file)[0] + '.probe.json'
+
+
+def load_cache(path: str, ttl: float = DEFAULT_TTL) -> Dict[str, ProbeResult]:
+    """Legge i risultati in cache, scartando quelli più vecchi di ttl secondi."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {name: ProbeResult(**entry) for name, entry in data.items()
+            if now - entry.get('checked_at', 0) <= ttl}
+
+
+def save_cache(path: str, results: List[ProbeResult]) -> None:
+    """Aggiorna la cache con i nuovi risultati mantenendo quelli degli altri host."""
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    data.update({r.name: asdict(r) for r in results})
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def latency(result: ProbeResult) -> Optional[float]:
+    """Latenza più significativa disponibile: autenticazione, banner o connessione."""
+    for value in (result.auth_ms, result.banner_ms, result.connect_ms):
+        if value is not None:
+            return value
+    return None
+
+
+def annotate(row: Dict, cache: Dict[str, ProbeResult]) -> Dict:
+    """Aggiunge a una riga dell'elenco lo stato e la latenza in cache."""
+    result = cache.get(row['name'])
+    if result is None:
+        row['status'], row['latency'] = None, None
+    else:
+        row['status'] = 'up' if result.reachable else 'down'
+        value = latency(result)
+        row['latency'] = round(value, 1) if value is not None and result.reachable else None
+    return row
+
+
+def print_results(results: List[ProbeResult]) -> None:
+    """Stampa i risultati ordinati per latenza, con gli host irraggiungibili in fondo."""
+    if not results:
+        return
+    ordered = sorted(results, key=lambda r: (not r.reachable, latency(r) or 0.0))
+    width = max(len("Istanza"), max(len(r.name) for r in results))
+
+    def ms(value: Optional[float]) -> str:
+        return '-' if value is None else f"{value:.1f}"
+
+    print(f"\n{Fore.CYAN}=== Raggiungibilità ==={Style.RESET_ALL}")
+    print(f"{'Istanza':<{width}}  {'Stato':<6}  {'TCP ms':>8}  {'Banner ms':>9}  {'Auth ms':>8}  Dettagli")
+    for r in ordered:
+        color = Fore.GREEN if r.reachable else Fore.RED
+        status = 'UP' if r.reachable else 'DOWN'
+        detail = r.error if r.error else (r.banner or '')
+        print(f"{r.name:<{width}}  {color}{status:<6}{Style.RESET_ALL}  {ms(r.connect_ms):>8}  "
+              f"{ms(r.banner_ms):>9}  {ms(r.auth_ms):>8}  {detail}")
+    up = sum(1 for r in results if r.reachable)
+    print(f"\n{up}/{len(results)} istanze raggiungibili")
@@ -0,0 +1,341 @@
+import bisect
+import json
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Pattern, Sequence, Tuple
+
+MAGIC = b'SSHREC\x01\n'
+OUTPUT, INPUT, RESIZE = 0, 1, 2
+# Un blocco compresso si chiude a questa dimensione o dopo FLUSH_INTERVAL:
+# un crash perde al più l'ultimo secondo di sessione
+BLOCK_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0
+# Ogni INDEX_INTERVAL blocchi viene scritto un record di indice
+INDEX_INTERVAL = 64
+COMPRESS_LEVEL = 6
+MAX_LINE_LENGTH = 64 * 1024
+
+_LENGTH = struct.Struct('<I')
+# tipo, lunghezza compressa, lunghezza originale, timestamp del primo frame (µs)
+_BLOCK = struct.Struct('<cIIQ')
+# tipo, numero di voci, offset dell'indice precedente (0 se è il primo)
+_INDEX = struct.Struct('<cIQ')
+_INDEX_ENTRY = struct.Struct('<QQ')
+# tipo, offset dell'ultimo indice, magic: presente solo se la registrazione è chiusa
+_TRAILER = struct.Struct('<cQ8s')
+_SIZE = struct.Struct('<HH')
+_ANSI_RE = re.compile(rb'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]')
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def default_path(config_file: str, name: str) -> str:
+    """Percorso predefinito: recordings/<istanza>-<data>.rec accanto alla configurazione."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(config_file)), 'recordings')
+    safe = re.sub(r'[^\w.-]', '_', name)
+    return os.path.join(directory, f"{safe}-{time.strftime('%Y%m%d-%H%M%S')}.rec")
+
+
+class Recorder:
+    """Registra una sessione di terminale in un file compresso append-only.
+
+    I metodi output/input/resize mettono solo il frame in una coda, così
+    il percorso dei tasti non attende mai il disco né la compressione. Un
+    thread in background raggruppa i frame in blocchi zlib indipendenti,
+    con timestamp delta in µs, e ogni INDEX_INTERVAL blocchi scrive un
+    indice (timestamp, offset) collegato al precedente. close() scrive
+    l'ultimo indice e il trailer che punta ad esso.
+    """
+
+    def __init__(self, path: str, meta: Optional[Dict] = None):
+        self.path = path
+        # Le registrazioni contengono anche i tasti premuti, comprese le password
+        # digitate ai prompt: file e cartella sono leggibili solo dal proprietario
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        # Una registrazione non sovrascrive mai un file esistente
+        self._file = os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb')
+        header = json.dumps({'version': 1, 'started': time.time(), **(meta or {})}).encode()
+        self._file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        self._file.flush()
+        self._start = time.monotonic()
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+
+    def output(self, data: bytes) -> None:
+        self._queue.put((time.monotonic(), OUTPUT, data))
+
+    def input(self, data: bytes) -> None:
+        self._queue.put((time.monotonic(), INPUT, data))
+
+    def resize(self, width: int, height: int) -> None:
+        self._queue.put((time.monotonic(), RESIZE, _SIZE.pack(width, height)))
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        block = bytearray()
+        block_ts = last_ts = 0
+        pending: List[Tuple[int, int]] = []
+        last_index = 0
+
+        def flush() -> None:
+            nonlocal block, last_index
+            if not block:
+                return
+            data = zlib.compress(bytes(block), COMPRESS_LEVEL)
+            pending.append((block_ts, self._file.tell()))
+            self._file.write(_BLOCK.pack(b'B', len(data), len(block), block_ts) + data)
+            self._file.flush()
+            block = bytearray()
+            if len(pending) >= INDEX_INTERVAL:
+                last_index = write_index()
+
+        def write_index() -> int:
+            offset = self._file.tell()
+            self._file.write(_INDEX.pack(b'I', len(pending), last_index) +
+                             b''.join(_INDEX_ENTRY.pack(*entry) for entry in pending))
+            pending.clear()
+            return offset
+
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL if block else None)
+            except queue.Empty:
+                flush()
+                continue
+            if item is None:
+                break
+            moment, kind, data = item
+            ts = int((moment - self._start) * 1_000_000)
+            if not block:
+                block_ts = last_ts = ts
+            block += _varint(ts - last_ts) + bytes((kind,)) + _varint(len(data)) + data
+            last_ts = ts
+            if len(block) >= BLOCK_SIZE or ts - block_ts >= FLUSH_INTERVAL * 1_000_000:
+                flush()
+        flush()
+        if pending:
+            last_index = write_index()
+        self._file.write(_TRAILER.pack(b'T', last_index, MAGIC))
+        self._file.close()
+
+
+@dataclass
+class Frame:
+    time: float
+    kind: int
+    data: bytes
+
+
+class Recording:
+    """Lettura di una registrazione tramite mmap.
+
+    Solo i blocchi effettivamente letti vengono decompressi: posizionarsi
+    in un punto qualsiasi costa una ricerca binaria nell'indice, e la
+    memoria usata non dipende dalla dimensione del file. Le registrazioni
+    interrotte (senza trailer) restano leggibili fino all'ultimo blocco
+    completo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        size = os.fstat(self._fd).st_size
+        if size < len(MAGIC) + _LENGTH.size:
+            os.close(self._fd)
+            raise ValueError(f"'{path}' non è una registrazione")
+        self._mm = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' non è una registrazione")
+        (length,) = _LENGTH.unpack_from(self._mm, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        self.meta: Dict = json.loads(self._mm[start:start + length])
+        self._data_start = start + length
+        self.complete = False
+        self._blocks = self._load_index()
+        self._times = [ts for ts, _ in self._blocks]
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    def __enter__(self) -> "Recording":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def _load_index(self) -> List[Tuple[int, int]]:
+        mm = self._mm
+        if len(mm) >= self._data_start + _TRAILER.size:
+            kind, offset, magic = _TRAILER.unpack_from(mm, len(mm) - _TRAILER.size)
+            if kind == b'T' and magic == MAGIC:
+                self.complete = True
+                chunks = []
+                # Gli indici sono collegati all'indietro a partire dal trailer
+                while offset:
+                    _, count, previous = _INDEX.unpack_from(mm, offset)
+                    start = offset + _INDEX.size
+                    chunks.append([_INDEX_ENTRY.unpack_from(mm, start + i * _INDEX_ENTRY.size)
+                                   for i in range(count)])
+                    offset = previous
+                return [entry for chunk in reversed(chunks) for entry in chunk]
+        return self._scan()
+
+    def _scan(self) -> List[Tuple[int, int]]:
+        # Registrazione interrotta: si saltano i blocchi leggendo solo le intestazioni
+        mm = self._mm
+        blocks = []
+        offset = self._data_start
+        while offset + 1 <= len(mm):
+            kind = mm[offset:offset + 1]
+            if kind == b'B' and offset + _BLOCK.size <= len(mm):
+                _, length, _, ts = _BLOCK.unpack_from(mm, offset)
+                end = offset + _BLOCK.size + length
+                if end > len(mm):
+                    break
+                blocks.append((ts, offset))
+                offset = end
+            elif kind == b'I' and offset + _INDEX.size <= len(mm):
+                _, count, _ = _INDEX.unpack_from(mm, offset)
+                offset += _INDEX.size + count * _INDEX_ENTRY.size
+            else:
+                break
+        return blocks
+
+    def _decode(self, offset: int) -> Iterator[Tuple[int, int, bytes]]:
+        _, length, _, ts = _BLOCK.unpack_from(self._mm, offset)
+        start = offset + _BLOCK.size
+        raw = zlib.decompress(self._mm[start:start + length])
+        pos = 0
+        while pos < len(raw):
+            delta, pos = _read_varint(raw, pos)
+            kind = raw[pos]
+            size, pos = _read_varint(raw, pos + 1)
+            ts += delta
+            yield ts, kind, raw[pos:pos + size]
+            pos += size
+
+    def frames(self, start: float = 0.0, kinds: Sequence[int] = (OUTPUT, INPUT, RESIZE)
+               ) -> Iterator[Frame]:
+        """Frame a partire da start secondi, decomprimendo un blocco alla volta."""
+        start_us = int(start * 1_000_000)
+        first = max(0, bisect.bisect_right(self._times, start_us) - 1)
+        for _, offset in self._blocks[first:]:
+            for ts, kind, data in self._decode(offset):
+                if ts >= start_us and kind in kinds:
+                    yield Frame(ts / 1_000_000, kind, data)
+
+    @property
+    def duration(self) -> float:
+        if not self._blocks:
+            return 0.0
+        last = 0
+        for last, _, _ in self._decode(self._blocks[-1][1]):
+            pass
+        return last / 1_000_000
+
+    def grep(self, pattern: Pattern[bytes], kinds: Sequence[int] = (OUTPUT,),
+             start: float = 0.0) -> Iterator[Tuple[float, str]]:
+        """Righe (senza sequenze ANSI) che corrispondono, con l'istante in cui iniziano.
+
+        La regex viene applicata a un blocco intero alla volta; l'istante
+        si calcola solo per le righe trovate.
+        """
+        start_us = int(start * 1_000_000)
+        first = max(0, bisect.bisect_right(self._times, start_us) - 1)
+        # Riga incompleta di fine blocco, con gli istanti dei frame che la compongono
+        carry = b''
+        carry_times: List[Tuple[int, int]] = []
+        for _, offset in self._blocks[first:]:
+            chunks = [carry]
+            times = list(carry_times)
+            size = len(carry)
+            for ts, kind, data in self._decode(offset):
+                if ts >= start_us and kind in kinds:
+                    data = _ANSI_RE.sub(b'', data)
+                    times.append((size, ts))
+                    chunks.append(data)
+                    size += len(data)
+            text = b''.join(chunks)
+            end = text.rfind(b'\n') + 1
+            positions = [position for position, _ in times]
+            last_line = -1
+            for match in pattern.finditer(text, 0, end):
+                line_start = text.rfind(b'\n', 0, match.start()) + 1
+                if line_start == last_line:
+                    continue
+                last_line = line_start
+                line_end = text.find(b'\n', match.start())
+                ts = times[max(0, bisect.bisect_right(positions, line_start) - 1)][1]
+                yield ts / 1_000_000, text[line_start:line_end].rstrip(b'\r').decode(errors='replace')
+            carry = text[end:][-MAX_LINE_LENGTH:]
+            carry_times = []
+            if carry and times:
+                cut = len(text) - len(carry)
+                first_frame = max(0, bisect.bisect_right(positions, cut) - 1)
+                carry_times = [(0, times[first_frame][1])] + [
+                    (position - cut, ts) for position, ts in times[first_frame + 1:]]
+        if carry and pattern.search(carry):
+            yield carry_times[0][1] / 1_000_000, carry.rstrip(b'\r').decode(errors='replace')
+
+
+def replay(recording: Recording, fd: int, speed: float = 1.0, start: float = 0.0,
+           max_idle: float = 2.0) -> None:
+    """Riproduce l'output sul descrittore fd rispettando i tempi originali.
+
+    speed 0 scrive tutto senza pause; le pause più lunghe di max_idle
+    secondi vengono accorciate.
+    """
+    previous = None
+    for frame in recording.frames(start, (OUTPUT,)):
+        if previous is not None and speed > 0:
+            time.sleep(min(frame.time - previous, max_idle) / speed)
+        previous = frame.time
+        view = memoryview(frame.data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+def format_time(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
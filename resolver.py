@@ -0,0 +1,191 @@
+import ipaddress
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_TTL = 300.0
+NEGATIVE_TTL = 30.0
+# Se il resolver non risponde si usa l'ultimo indirizzo noto fino a questa età
+STALE_TTL = 24 * 3600.0
+PREFETCH_WORKERS = 32
+# Errori temporanei: il nome esiste probabilmente ancora
+TRANSIENT_ERRORS = {socket.EAI_AGAIN}
+
+AddrInfo = Tuple[int, int, int, str, tuple]
+Key = Tuple[str, int]
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class _Entry:
+    __slots__ = ('addresses', 'error', 'resolved_at')
+
+    def __init__(self, addresses: List[AddrInfo], error: Optional[str], resolved_at: float):
+        self.addresses = addresses
+        self.error = error
+        self.resolved_at = resolved_at
+
+    def fresh(self, now: float, ttl: float, negative_ttl: float) -> bool:
+        return now - self.resolved_at <= (negative_ttl if self.error else ttl)
+
+
+class Resolver:
+    """Cache di getaddrinfo per host e porta, condivisa da tutto il processo.
+
+    Le risposte positive valgono ttl secondi, quelle negative negative_ttl.
+    Se una nuova risoluzione fallisce per un errore temporaneo si continua
+    a usare l'ultimo indirizzo noto. Con attach() la cache viene letta da
+    un file e salvata con save(), così il primo collegamento dopo l'avvio
+    non attende il DNS. Gli indirizzi IP letterali non passano dalla cache.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, negative_ttl: float = NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path: Optional[str] = None
+        self._entries: Dict[Key, _Entry] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Key, threading.Lock] = {}
+        self._loaded = False
+        self._dirty = False
+
+    def attach(self, path: str) -> None:
+        """Usa path come cache persistente, letta al primo utilizzo."""
+        with self._lock:
+            if path != self.path:
+                self.path = path
+                self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if self.path is None or not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            for key, entry in data.items():
+                host, _, port = key.rpartition(':')
+                addresses = [(family, socktype, proto, canon, tuple(sockaddr))
+                             for family, socktype, proto, canon, sockaddr in entry['addresses']]
+                # Le voci già in memoria sono più recenti di quelle su disco
+                self._entries.setdefault((host, int(port)), _Entry(
+                    addresses, entry.get('error'), entry['resolved_at']))
+
+    def _key_lock(self, key: Key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key: Key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.fresh(time.time(), self.ttl, self.negative_ttl):
+            return entry
+        return None
+
+    def _lookup(self, key: Key) -> _Entry:
+        host, port = key
+        previous = self._entries.get(key)
+        try:
+            addresses = [(family, socktype, proto, canon, sockaddr)
+                         for family, socktype, proto, canon, sockaddr
+                         in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)]
+            entry = _Entry(addresses, None, time.time())
+        except socket.gaierror as e:
+            if (e.errno in TRANSIENT_ERRORS and previous is not None and not previous.error
+                    and time.time() - previous.resolved_at <= STALE_TTL):
+                return previous
+            entry = _Entry([], str(e), time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._dirty = True
+        return entry
+
+    def resolve(self, host: str, port: int) -> List[AddrInfo]:
+        """Indirizzi per host e porta; socket.gaierror se il nome non si risolve."""
+        if _is_ip(host):
+            return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM, 0, socket.AI_NUMERICHOST)
+        self._ensure_loaded()
+        key = (host, port)
+        entry = self._cached(key)
+        if entry is None:
+            # Richieste concorrenti per lo stesso host fanno una sola risoluzione
+            with self._key_lock(key):
+                entry = self._cached(key) or self._lookup(key)
+        if entry.error:
+            raise socket.gaierror(entry.error)
+        return entry.addresses
+
+    def invalidate(self, host: str, port: int) -> None:
+        """Scarta la voce, ad esempio dopo una connessione fallita verso l'indirizzo in cache."""
+        with self._lock:
+            if self._entries.pop((host, port), None) is not None:
+                self._dirty = True
+
+    def prefetch(self, targets: Iterable[Key], max_workers: int = PREFETCH_WORKERS) -> int:
+        """Risolve in parallelo i target non in cache; restituisce quanti ne ha risolti."""
+        self._ensure_loaded()
+        pending = {key for key in targets if not _is_ip(key[0]) and self._cached(key) is None}
+        if not pending:
+            return 0
+
+        def resolve(key: Key) -> None:
+            try:
+                self.resolve(*key)
+            except socket.gaierror:
+                pass
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            list(executor.map(resolve, pending))
+        return len(pending)
+
+    def save(self) -> None:
+        """Scrive la cache su file, unendo le voci salvate da altri processi."""
+        if self.path is None or not self._dirty:
+            return
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        with self._lock:
+            now = time.time()
+            for (host, port), entry in self._entries.items():
+                data[f"{host}:{port}"] = {'addresses': entry.addresses, 'error': entry.error,
+                                          'resolved_at': entry.resolved_at}
+            self._dirty = False
+        # Le voci troppo vecchie anche per l'uso di riserva non servono più
+        data = {key: entry for key, entry in data.items()
+                if now - entry['resolved_at'] <= STALE_TTL}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+def cache_path(config_file: str) -> str:
+    return os.path.splitext(config_file)[0] + '.dns.json'
+
+
+def targets(instances, names: Iterable[str]) -> List[Key]:
+    return [(instances[name]['hostname'], instances[name].get('port', 22)) for name in names]
+
+
+RESOLVER = Resolver()
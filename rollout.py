@@ -0,0 +1,247 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, TextIO
+from fanout import ExecResult, run_command
+from pool import ConnectionPool
+from term import Fore, Style
+from transport import DEFAULT_TIMEOUT
+
+DEFAULT_BATCH = '10%'
+DEFAULT_IN_FLIGHT = 32
+CHECKPOINT_VERSION = 1
+
+
+def parse_amount(value: str, total: int, minimum: int = 0) -> int:
+    """Converte '25' o '10%' (di total, arrotondato per eccesso) in un numero di host."""
+    value = str(value).strip()
+    try:
+        if value.endswith('%'):
+            percent = float(value[:-1])
+            if not 0 <= percent <= 100:
+                raise ValueError
+            amount = math.ceil(total * percent / 100)
+        else:
+            amount = int(value)
+            if amount < 0:
+                raise ValueError
+    except ValueError:
+        raise ValueError(f"valore non valido: {value!r} (atteso un numero o una percentuale)")
+    return max(minimum, amount)
+
+
+def plan_waves(names: List[str], batch: str, total: Optional[int] = None) -> List[List[str]]:
+    """Divide gli host in ondate; le percentuali di batch sono riferite a total."""
+    size = parse_amount(batch, len(names) if total is None else total, minimum=1)
+    return [names[i:i + size] for i in range(0, len(names), size)]
+
+
+def checkpoint_path(config_file: str) -> str:
+    return os.path.splitext(config_file)[0] + '.rollout.jsonl'
+
+
+class Checkpoint:
+    """Registro append-only degli host completati, per riprendere un rollout.
+
+    La prima riga descrive il comando; ogni host terminato aggiunge una
+    riga scritta subito su disco, così un'interruzione (Ctrl-C, crash,
+    connessione persa) perde al più gli host in corso.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+
+    def load(self, command: str) -> Set[str]:
+        """Host già completati con successo per lo stesso comando.
+
+        ValueError se il checkpoint riguarda un comando diverso.
+        """
+        done: Set[str] = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r') as f:
+            header = json.loads(f.readline() or '{}')
+            if header.get('command') != command:
+                raise ValueError(f"il checkpoint '{self.path}' riguarda un altro comando: "
+                                 f"{header.get('command')!r}")
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Ultima riga troncata da un'interruzione
+                    continue
+                if entry.get('ok'):
+                    done.add(entry['name'])
+                else:
+                    done.discard(entry['name'])
+        return done
+
+    def open(self, command: str, resume: bool) -> None:
+        if resume and os.path.exists(self.path):
+            self._file = open(self.path, 'a')
+            return
+        self._file = open(self.path, 'w')
+        self._write({'version': CHECKPOINT_VERSION, 'command': command, 'started': time.time()})
+
+    def _write(self, entry: Dict) -> None:
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def record(self, result: ExecResult) -> None:
+        with self._lock:
+            self._write({'name': result.name, 'ok': result.ok, 'exit_code': result.exit_code,
+                         'error': result.error, 'elapsed': round(result.elapsed, 3)})
+
+    def sync(self) -> None:
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def close(self, remove: bool = False) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@dataclass
+class Progress:
+    total: int
+    waves: int
+    wave: int = 0
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+@dataclass
+class RolloutResult:
+    results: List[ExecResult]
+    progress: Progress
+    stopped: bool = False
+    pending: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.stopped and not self.pending and self.progress.failed == 0
+
+
+def rollout(instances, names: List[str], command: str, batch: str = DEFAULT_BATCH,
+            max_in_flight: int = DEFAULT_IN_FLIGHT, max_failures: str = '0',
+            pause: float = 0.0, timeout: float = DEFAULT_TIMEOUT,
+            checkpoint: Optional[Checkpoint] = None, resume: bool = False,
+            on_result: Optional[Callable[[ExecResult, Progress], None]] = None,
+            on_wave: Optional[Callable[[List[str], Progress], None]] = None) -> RolloutResult:
+    """Esegue il comando a ondate successive, fermandosi oltre max_failures.
+
+    Ogni ondata parte solo quando la precedente è terminata e ha al più
+    max_in_flight host in corso: appena un host termina ne parte un altro.
+    Superata la soglia di errori (numero o percentuale del totale) non
+    vengono avviati altri host e quelli in corso vengono attesi. Con un
+    checkpoint e resume gli host già completati con successo vengono
+    saltati, quelli falliti ritentati.
+    """
+    max_in_flight = max(1, max_in_flight)
+    done = checkpoint.load(command) if checkpoint is not None and resume else set()
+    todo = [name for name in names if name not in done]
+    # Ripartendo da un checkpoint le ondate mantengono la dimensione originale
+    waves = plan_waves(todo, batch, total=len(names))
+    budget = parse_amount(max_failures, len(names))
+    progress = Progress(total=len(names), waves=len(waves), skipped=len(names) - len(todo))
+    outcome = RolloutResult(results=[], progress=progress)
+    if checkpoint is not None:
+        checkpoint.open(command, resume)
+    # Gli host non si ripetono: l'LRU chiude le connessioni già usate e
+    # restano aperti solo i bastion con connessioni in corso
+    pool = ConnectionPool(max_size=max_in_flight * 2, timeout=timeout,
+                          instances=instances)
+
+    def run(name: str) -> ExecResult:
+        return run_command(name, instances[name], command, timeout, pool)
+
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    try:
+        for number, wave in enumerate(waves, 1):
+            progress.wave = number
+            if on_wave is not None:
+                on_wave(wave, progress)
+            pool.prefetch_dns(instances, wave)
+            queue = list(reversed(wave))
+            running: Set[Future] = set()
+            while queue or running:
+                while queue and len(running) < max_in_flight and not outcome.stopped:
+                    running.add(executor.submit(run, queue.pop()))
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    outcome.results.append(result)
+                    progress.done += 1
+                    if not result.ok:
+                        progress.failed += 1
+                        if progress.failed > budget:
+                            outcome.stopped = True
+                    if checkpoint is not None:
+                        checkpoint.record(result)
+                    if on_result is not None:
+                        on_result(result, progress)
+                if outcome.stopped:
+                    # Gli host in coda non partono più; quelli avviati vengono attesi
+                    outcome.pending.extend(reversed(queue))
+                    queue.clear()
+            if checkpoint is not None:
+                checkpoint.sync()
+            if outcome.stopped:
+                for later in waves[number:]:
+                    outcome.pending.extend(later)
+                break
+            if pause and number < len(waves):
+                time.sleep(pause)
+    except KeyboardInterrupt:
+        outcome.stopped = True
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        pool.close_all()
+        if checkpoint is not None:
+            checkpoint.close(remove=outcome.ok)
+    return outcome
+
+
+def print_wave(wave: List[str], progress: Progress, out: TextIO = sys.stdout) -> None:
+    out.write(f"\n{Fore.CYAN}=== Ondata {progress.wave}/{progress.waves}: "
+              f"{len(wave)} istanze ==={Style.RESET_ALL}\n")
+    out.flush()
+
+
+def print_progress(result: ExecResult, progress: Progress, show_output: bool = False,
+                   out: TextIO = sys.stdout) -> None:
+    """Una riga per host appena termina, con l'avanzamento complessivo."""
+    completed = progress.done + progress.skipped
+    if result.ok:
+        status = f"{Fore.GREEN}OK{Style.RESET_ALL}"
+    else:
+        status = f"{Fore.RED}{'ERRORE' if result.error else 'FALLITO'}{Style.RESET_ALL}"
+    line = (f"[{completed}/{progress.total}] {result.name} {status} "
+            f"{result.elapsed:.2f}s (errori: {progress.failed}, {progress.elapsed:.0f}s)")
+    stderr = result.stderr.strip()
+    if result.error:
+        line += f"\n  {Fore.RED}{result.error}{Style.RESET_ALL}"
+    elif not result.ok and stderr:
+        line += f"\n  {Fore.YELLOW}{stderr.splitlines()[-1]}{Style.RESET_ALL}"
+    if show_output and result.stdout:
+        line += '\n' + '\n'.join(f"  {text}" for text in result.stdout.rstrip('\n').splitlines())
+    out.write(line + '\n')
+    out.flush()
@@ -0,0 +1,151 @@
+import bisect
+import heapq
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, Iterable, List, Set, Tuple
+
+# 'facts' è il testo dei fatti raccolti, aggiunto dal chiamante se presente
+SEARCH_FIELDS = ('hostname', 'username', 'facts')
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Indice di ricerca per nome, hostname, username e fatti delle istanze.
+
+    I risultati sono ordinati per pertinenza: prima i nomi che iniziano
+    con la query, poi hostname e username che iniziano con la query, poi
+    le sottostringhe trovate tramite l'indice inverso di trigrammi e infine
+    le corrispondenze approssimate. I prefissi si cercano per bisezione su
+    liste ordinate, quindi le query tipiche esaminano solo i risultati
+    mostrati e non l'intero inventario. L'indice si aggiorna in modo
+    incrementale con add/remove.
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, Tuple[str, ...]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._names: List[Tuple[str, str]] = []
+        self._fields: List[Tuple[str, str]] = []
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, Dict]]) -> "SearchIndex":
+        index = cls()
+        for name, instance in items:
+            index._insert(name, instance, sort=False)
+        index._names.sort()
+        index._fields.sort()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._docs
+
+    def _insert(self, name: str, instance: Dict, sort: bool = True) -> None:
+        fields = tuple([name.lower()] + [str(instance.get(f) or '').lower()
+                                         for f in SEARCH_FIELDS])
+        self._docs[name] = fields
+        add = bisect.insort if sort else list.append
+        add(self._names, (fields[0], name))
+        for field in set(fields[1:]):
+            if field:
+                add(self._fields, (field, name))
+        for field in set(fields):
+            for trigram in _trigrams(field):
+                self._trigrams.setdefault(trigram, set()).add(name)
+
+    def add(self, name: str, instance: Dict) -> None:
+        """Aggiunge o aggiorna un'istanza nell'indice."""
+        self.remove(name)
+        self._insert(name, instance)
+
+    def remove(self, name: str) -> None:
+        """Rimuove un'istanza dall'indice."""
+        fields = self._docs.pop(name, None)
+        if fields is None:
+            return
+        _sorted_remove(self._names, (fields[0], name))
+        for field in set(fields[1:]):
+            if field:
+                _sorted_remove(self._fields, (field, name))
+        for field in set(fields):
+            for trigram in _trigrams(field):
+                postings = self._trigrams.get(trigram)
+                if postings is not None:
+                    postings.discard(name)
+                    if not postings:
+                        del self._trigrams[trigram]
+
+    def search(self, query: str, limit: int = 20) -> List[str]:
+        """Restituisce i nomi delle istanze più pertinenti per la query."""
+        query = query.strip().lower()
+        if not query:
+            return [name for _, name in self._names[:limit]]
+
+        matches: List[str] = []
+        found: Set[str] = set()
+
+        def collect(names: Iterable[str]) -> bool:
+            for name in names:
+                if name not in found:
+                    found.add(name)
+                    matches.append(name)
+                    if len(matches) >= limit:
+                        return True
+            return False
+
+        if collect(_prefix_scan(self._names, query)):
+            return matches
+        if collect(_prefix_scan(self._fields, query)):
+            return matches
+        if len(query) < 3:
+            return matches
+
+        grams = sorted(_trigrams(query), key=lambda g: len(self._trigrams.get(g, ())))
+        rarest = self._trigrams.get(grams[0], set())
+
+        def contains(name: str) -> bool:
+            return name not in found and any(query in f for f in self._docs[name])
+
+        # Ogni sottostringa contiene anche il trigramma più raro: se è raro
+        # bastano i suoi candidati, altrimenti si scorrono i nomi ordinati
+        # fermandosi appena raggiunto il limite
+        if len(rarest) * 50 > len(self._names):
+            names = map(itemgetter(1), self._names)
+            ordered = filter(contains, filter(rarest.__contains__, names))
+        else:
+            ordered = heapq.nsmallest(limit - len(matches), filter(contains, rarest))
+        if collect(ordered):
+            return matches
+
+        # Ricerca approssimata (es. errori di battitura): istanze che condividono
+        # almeno metà dei trigrammi selettivi della query
+        selective = [g for g in grams
+                     if len(self._trigrams.get(g, ())) <= max(1000, len(self._docs) // 20)]
+        if not selective:
+            return matches
+        overlap = Counter()
+        for gram in selective:
+            overlap.update(self._trigrams.get(gram, ()))
+        threshold = max(2, (len(selective) + 1) // 2)
+        fuzzy = [(-count, name) for name, count in overlap.items()
+                 if count >= threshold and name not in found]
+        collect(name for _, name in heapq.nsmallest(limit - len(matches), fuzzy))
+        return matches
+
+
+def _prefix_scan(entries: List[Tuple[str, str]], prefix: str) -> Iterable[str]:
+    i = bisect.bisect_left(entries, (prefix, ''))
+    while i < len(entries) and entries[i][0].startswith(prefix):
+        yield entries[i][1]
+        i += 1
+
+
+def _sorted_remove(entries: List[Tuple[str, str]], entry: Tuple[str, str]) -> None:
+    i = bisect.bisect_left(entries, entry)
+    if i < len(entries) and entries[i] == entry:
+        del entries[i]
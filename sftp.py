@@ -0,0 +1,285 @@
+import hashlib
+import mmap
+import os
+import shlex
+import stat
+import time
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from pool import ConnectionPool
+from term import Fore, Style
+
+DEFAULT_WORKERS = 16
+CHUNK_SIZE = paramiko.SFTPFile.MAX_REQUEST_SIZE
+# Finestra ampia per non fermare le richieste in volo sui link ad alta latenza
+SFTP_WINDOW_SIZE = 16 * 1024 * 1024
+SFTP_MAX_PACKET_SIZE = 256 * 1024
+# Suffisso del file in scrittura, rinominato a trasferimento completo
+PART_SUFFIX = '.part'
+
+
+@dataclass
+class TransferResult:
+    name: str
+    hostname: str
+    path: str
+    size: int = 0
+    transferred: int = 0
+    resumed_from: int = 0
+    skipped: bool = False
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def throughput(self) -> float:
+        """Byte al secondo effettivamente trasferiti."""
+        return self.transferred / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def open_sftp(transport: paramiko.Transport, instance: Dict) -> paramiko.SFTPClient:
+    """Apre l'SFTP con finestra e pacchetto del profilo dell'istanza, se calibrata."""
+    import tuning
+    tuned = tuning.profile(instance)
+    window = tuned.window_size if tuned is not None and tuned.window_size else SFTP_WINDOW_SIZE
+    packet = tuned.max_packet_size if tuned is not None and tuned.max_packet_size else SFTP_MAX_PACKET_SIZE
+    return paramiko.SFTPClient.from_transport(transport, window_size=window, max_packet_size=packet)
+
+
+def _remote_sha256(pool: ConnectionPool, name: str, instance: Dict, path: str,
+                   length: Optional[int] = None) -> Optional[str]:
+    """Checksum calcolato sull'host remoto, None se sha256sum non è disponibile.
+
+    Con length si calcola solo sui primi length byte del file.
+    """
+    quoted = shlex.quote(path)
+    command = (f"sha256sum -- {quoted}" if length is None
+               else f"head -c {int(length)} -- {quoted} | sha256sum")
+    code, stdout, _ = pool.exec_command(name, instance, command)
+    if code != 0 or not stdout:
+        return None
+    return stdout.split()[0].decode()
+
+
+def _local_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _remote_stat(sftp: paramiko.SFTPClient, path: str) -> Optional[paramiko.SFTPAttributes]:
+    try:
+        return sftp.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _push_one(pool: ConnectionPool, name: str, instance: Dict, data: memoryview,
+              mtime: float, local_sha: Optional[str], remote_path: str,
+              resume: bool) -> TransferResult:
+    result = TransferResult(name=name, hostname=instance['hostname'], path=remote_path,
+                            size=len(data))
+    part_path = remote_path + PART_SUFFIX
+    start = time.monotonic()
+    try:
+        with pool.sftp(name, instance) as sftp:
+            remote = _remote_stat(sftp, remote_path)
+            if remote is not None and remote.st_size == len(data):
+                if local_sha is not None:
+                    same = _remote_sha256(pool, name, instance, remote_path) == local_sha
+                else:
+                    same = int(remote.st_mtime) == int(mtime)
+                if same:
+                    result.skipped = True
+                    return result
+
+            # Si riprende solo un file parziale il cui contenuto
+            # coincide con l'inizio di quello locale
+            offset = 0
+            part = _remote_stat(sftp, part_path) if resume else None
+            if part is not None and 0 < part.st_size < len(data):
+                prefix = hashlib.sha256(data[:part.st_size]).hexdigest()
+                if _remote_sha256(pool, name, instance, part_path) == prefix:
+                    offset = part.st_size
+
+            with sftp.open(part_path, 'r+b' if offset else 'wb', bufsize=0) as f:
+                f.seek(offset)
+                # Scritture in pipeline: non si attende l'ack di ogni blocco
+                f.set_pipelined(True)
+                for pos in range(offset, len(data), CHUNK_SIZE):
+                    f.write(data[pos:pos + CHUNK_SIZE])
+            if remote is not None:
+                sftp.chmod(part_path, stat.S_IMODE(remote.st_mode))
+            sftp.utime(part_path, (mtime, mtime))
+            # Il file di destinazione viene sostituito solo a trasferimento completo
+            sftp.posix_rename(part_path, remote_path)
+            result.resumed_from = offset
+            result.transferred = len(data) - offset
+        if local_sha is not None and _remote_sha256(pool, name, instance, remote_path) not in (local_sha, None):
+            result.error = "Checksum remoto diverso dopo il trasferimento"
+    except Exception as e:
+        result.error = str(e) or e.__class__.__name__
+    finally:
+        result.elapsed = time.monotonic() - start
+    return result
+
+
+def push(instances, names: List[str], local_path: str, remote_path: str,
+         pool: Optional[ConnectionPool] = None, max_workers: int = DEFAULT_WORKERS,
+         checksum: bool = False, resume: bool = False) -> List[TransferResult]:
+    """Carica lo stesso file su più istanze in parallelo.
+
+    Il file locale viene letto una sola volta tramite mmap e tutte le
+    trasmissioni condividono lo stesso buffer. Si scrive su
+    '<remote_path>.part' e lo si rinomina a trasferimento completo. Gli
+    host con un file della stessa dimensione e data di modifica (con
+    checksum: dello stesso sha256) vengono saltati; con resume un .part
+    rimasto da un trasferimento interrotto riprende dall'ultimo byte, se
+    il suo contenuto coincide con l'inizio del file locale.
+    """
+    if not names:
+        return []
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(max_size=len(names), instances=instances)
+    with open(local_path, 'rb') as f:
+        info = os.fstat(f.fileno())
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if info.st_size else None
+    data = memoryview(mapped) if mapped is not None else memoryview(b'')
+    try:
+        # Dagli stessi byte che verranno inviati, senza rileggere il file
+        local_sha = hashlib.sha256(data).hexdigest() if checksum else None
+        pool.prefetch_dns(instances, names)
+        workers = max(1, min(max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_push_one, pool, name, instances[name], data,
+                                       info.st_mtime, local_sha, remote_path, resume)
+                       for name in names]
+            return [future.result() for future in futures]
+    finally:
+        data.release()
+        if mapped is not None:
+            mapped.close()
+        if own_pool:
+            pool.close_all()
+
+
+def _pull_one(pool: ConnectionPool, name: str, instance: Dict, remote_path: str,
+              local_path: str, checksum: bool, resume: bool) -> TransferResult:
+    result = TransferResult(name=name, hostname=instance['hostname'], path=local_path)
+    part_path = local_path + PART_SUFFIX
+    start = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        with pool.sftp(name, instance) as sftp:
+            remote = sftp.stat(remote_path)
+            remote_size = result.size = remote.st_size
+            local = os.stat(local_path) if os.path.exists(local_path) else None
+            if local is not None and local.st_size == remote_size:
+                if checksum:
+                    same = _remote_sha256(pool, name, instance, remote_path) == _local_sha256(local_path)
+                else:
+                    same = int(local.st_mtime) == int(remote.st_mtime)
+                if same:
+                    result.skipped = True
+                    return result
+
+            offset = 0
+            part_size = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+            if 0 < part_size < remote_size and _remote_sha256(
+                    pool, name, instance, remote_path, part_size) == _local_sha256(part_path):
+                offset = part_size
+
+            with sftp.open(remote_path, 'rb') as source, \
+                    open(part_path, 'r+b' if offset else 'wb') as target:
+                source.seek(offset)
+                target.seek(offset)
+                # Prefetch: tutte le richieste di lettura partono subito
+                source.prefetch(remote_size)
+                while True:
+                    block = source.read(1024 * 1024)
+                    if not block:
+                        break
+                    target.write(block)
+                target.truncate()
+            os.utime(part_path, (remote.st_atime, remote.st_mtime))
+            os.replace(part_path, local_path)
+            result.resumed_from = offset
+            result.transferred = remote_size - offset
+    except Exception as e:
+        result.error = str(e) or e.__class__.__name__
+    finally:
+        result.elapsed = time.monotonic() - start
+    return result
+
+
+def pull(instances, names: List[str], remote_path: str, local_dir: str,
+         pool: Optional[ConnectionPool] = None, max_workers: int = DEFAULT_WORKERS,
+         checksum: bool = False, resume: bool = False) -> List[TransferResult]:
+    """Scarica lo stesso file da più istanze in '<local_dir>/<istanza>/<nome file>'.
+
+    Come in push si scrive su un file .part rinominato alla fine e i file
+    locali della stessa dimensione e data di modifica vengono saltati.
+    """
+    if not names:
+        return []
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(max_size=len(names), instances=instances)
+    filename = os.path.basename(remote_path.rstrip('/'))
+    try:
+        pool.prefetch_dns(instances, names)
+        workers = max(1, min(max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_pull_one, pool, name, instances[name], remote_path,
+                                       os.path.join(local_dir, name, filename), checksum, resume)
+                       for name in names]
+            return [future.result() for future in futures]
+    finally:
+        if own_pool:
+            pool.close_all()
+
+
+def _human(size: float) -> str:
+    if size < 1024:
+        return f"{int(size)} B"
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024
+        if size < 1024 or unit == 'GiB':
+            break
+    return f"{size:.1f} {unit}"
+
+
+def print_results(results: List[TransferResult]) -> None:
+    """Stampa esito, byte trasferiti e throughput per host."""
+    if not results:
+        return
+    width = max(len("Istanza"), max(len(r.name) for r in results))
+    print(f"\n{Fore.CYAN}=== Trasferimenti ==={Style.RESET_ALL}")
+    print(f"{'Istanza':<{width}}  {'Esito':<9}  {'Trasferiti':>11}  {'Tempo':>8}  {'Velocità':>12}")
+    for r in results:
+        if r.error:
+            status, color = 'ERRORE', Fore.RED
+        elif r.skipped:
+            status, color = 'SALTATO', Fore.YELLOW
+        elif r.resumed_from:
+            status, color = 'RIPRESO', Fore.GREEN
+        else:
+            status, color = 'OK', Fore.GREEN
+        speed = f"{_human(r.throughput)}/s" if r.transferred else '-'
+        print(f"{r.name:<{width}}  {color}{status:<9}{Style.RESET_ALL}  {_human(r.transferred):>11}  "
+              f"{r.elapsed:>7.2f}s  {speed:>12}")
+        if r.error:
+            print(f"{' ' * width}  {Fore.RED}{r.error}{Style.RESET_ALL}")
+    total = sum(r.transferred for r in results)
+    wall = max(r.elapsed for r in results)
+    failed = sum(1 for r in results if r.error)
+    print(f"\nTotale: {_human(total)} in {wall:.2f}s ({_human(total / wall if wall else 0)}/s aggregati), "
+          f"{failed} errori")
@@ -0,0 +1,146 @@
+import fcntl
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import termios
+import tty
+import paramiko
+from typing import List, Optional, Tuple
+
+READ_SIZE = 65536
+
+
+def terminal_size(fd: int) -> Tuple[int, int]:
+    """Colonne e righe del terminale, con un default se non è un tty."""
+    try:
+        size = os.get_terminal_size(fd)
+        return size.columns, size.lines
+    except OSError:
+        return 80, 24
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def interactive_shell(channel: paramiko.Channel, recorder=None) -> int:
+    """Collega il terminale locale a un canale con pty già aperto.
+
+    Il tty locale passa in modalità raw, i ridimensionamenti della finestra
+    vengono inoltrati con SIGWINCH e un unico ciclo select sposta i byte
+    tra i descrittori e il canale con os.read/os.write, senza passare per
+    i buffer di sys.stdin/sys.stdout. Con un recorder (recording.Recorder)
+    ogni lettura viene anche accodata alla registrazione. Restituisce il
+    codice di uscita remoto, -1 se non disponibile.
+    """
+    fd_in = sys.stdin.fileno()
+    fd_out = sys.stdout.fileno()
+    sys.stdout.flush()
+
+    def on_resize(signum, frame) -> None:
+        width, height = terminal_size(fd_out)
+        if recorder is not None:
+            recorder.resize(width, height)
+        try:
+            channel.resize_pty(width=width, height=height)
+        except paramiko.SSHException:
+            pass
+
+    old_settings = termios.tcgetattr(fd_in)
+    old_handler = signal.signal(signal.SIGWINCH, on_resize)
+    try:
+        tty.setraw(fd_in)
+        on_resize(None, None)
+        while True:
+            readable, _, _ = select.select([channel, fd_in], [], [])
+            if channel in readable:
+                data = channel.recv(READ_SIZE)
+                if not data:
+                    break
+                _write_all(fd_out, data)
+                if recorder is not None:
+                    recorder.output(data)
+            if fd_in in readable:
+                data = os.read(fd_in, READ_SIZE)
+                if not data:
+                    break
+                channel.sendall(data)
+                if recorder is not None:
+                    recorder.input(data)
+    finally:
+        termios.tcsetattr(fd_in, termios.TCSADRAIN, old_settings)
+        signal.signal(signal.SIGWINCH, old_handler)
+
+    # Lo stato di uscita può arrivare subito dopo l'EOF
+    channel.status_event.wait(1.0)
+    status = channel.exit_status if channel.exit_status_ready() else -1
+    channel.close()
+    return status
+
+
+def interactive_command(argv: List[str], recorder=None) -> int:
+    """Esegue un comando interattivo (es. ssh) in un pty locale e lo collega al terminale.
+
+    Serve a registrare le sessioni del client ssh di sistema: i byte
+    passano da questo processo come in interactive_shell, con la stessa
+    gestione di modalità raw e SIGWINCH. Restituisce il codice di uscita.
+    """
+    fd_in = sys.stdin.fileno()
+    fd_out = sys.stdout.fileno()
+    sys.stdout.flush()
+    pid, master = pty.fork()
+    if pid == 0:
+        try:
+            os.execvp(argv[0], argv)
+        finally:
+            os._exit(127)
+
+    def on_resize(signum, frame) -> None:
+        width, height = terminal_size(fd_out)
+        if recorder is not None:
+            recorder.resize(width, height)
+        fcntl.ioctl(master, termios.TIOCSWINSZ, struct.pack('HHHH', height, width, 0, 0))
+
+    old_settings: Optional[list] = None
+    if os.isatty(fd_in):
+        old_settings = termios.tcgetattr(fd_in)
+    old_handler = signal.signal(signal.SIGWINCH, on_resize)
+    try:
+        if old_settings is not None:
+            tty.setraw(fd_in)
+        on_resize(None, None)
+        inputs = [master, fd_in]
+        while True:
+            readable, _, _ = select.select(inputs, [], [])
+            if master in readable:
+                try:
+                    data = os.read(master, READ_SIZE)
+                except OSError:
+                    # EIO: il processo ha chiuso il terminale
+                    break
+                if not data:
+                    break
+                _write_all(fd_out, data)
+                if recorder is not None:
+                    recorder.output(data)
+            if fd_in in readable:
+                data = os.read(fd_in, READ_SIZE)
+                if not data:
+                    inputs.remove(fd_in)
+                    continue
+                _write_all(master, data)
+                if recorder is not None:
+                    recorder.input(data)
+    finally:
+        if old_settings is not None:
+            termios.tcsetattr(fd_in, termios.TCSADRAIN, old_settings)
+        signal.signal(signal.SIGWINCH, old_handler)
+        os.close(master)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
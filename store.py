@@ -0,0 +1,262 @@
+import fcntl
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+DEFAULT_JSON = "ssh_config.json"
+DEFAULT_DB = "ssh_config.db"
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Lock esclusivo tra processi basato su un file '<path>.lock'."""
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class JsonStore(MutableMapping):
+    """Archivio delle istanze sul file JSON storico.
+
+    Il file viene letto al primo accesso. Al salvataggio vengono applicate
+    solo le istanze modificate o eliminate, rileggendo il file sotto lock,
+    così due processi concorrenti non si sovrascrivono a vicenda.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Optional[Dict[str, Dict]] = None
+        self._dirty: Set[str] = set()
+        self._deleted: Set[str] = set()
+
+    def _read(self) -> Dict[str, Dict]:
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    @property
+    def data(self) -> Dict[str, Dict]:
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    def __getitem__(self, name: str) -> Dict:
+        return self.data[name]
+
+    def __setitem__(self, name: str, instance: Dict) -> None:
+        self.data[name] = instance
+        self._dirty.add(name)
+        self._deleted.discard(name)
+
+    def __delitem__(self, name: str) -> None:
+        del self.data[name]
+        self._dirty.discard(name)
+        self._deleted.add(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def upsert_many(self, items: Iterable[Tuple[str, Dict]]) -> int:
+        """Inserisce o aggiorna più istanze con un'unica scrittura del file."""
+        count = 0
+        for name, instance in items:
+            self[name] = instance
+            count += 1
+        self.save()
+        return count
+
+    def save(self) -> None:
+        if not self._dirty and not self._deleted:
+            return
+        with file_lock(self.path):
+            current = self._read()
+            for name in self._deleted:
+                current.pop(name, None)
+            for name in self._dirty:
+                current[name] = self.data[name]
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(current, f, indent=4)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        self._data = current
+        self._dirty.clear()
+        self._deleted.clear()
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteStore(MutableMapping):
+    """Archivio delle istanze su SQLite in modalità WAL.
+
+    Le letture per nome usano l'indice della chiave primaria e ogni
+    modifica è un upsert o una delete della sola riga interessata, quindi
+    non serve mai caricare l'intero inventario. I valori restituiti sono
+    copie: per modificare un'istanza va riassegnata per intero.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS instances ("
+            " id INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL UNIQUE,"
+            " data TEXT NOT NULL)")
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def __getitem__(self, name: str) -> Dict:
+        rows = self._query("SELECT data FROM instances WHERE name = ?", (name,))
+        if not rows:
+            raise KeyError(name)
+        return json.loads(rows[0][0])
+
+    def __contains__(self, name: object) -> bool:
+        return bool(self._query("SELECT 1 FROM instances WHERE name = ?", (name,)))
+
+    def __setitem__(self, name: str, instance: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO instances (name, data) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data",
+                (name, json.dumps(instance)))
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM instances WHERE name = ?", (name,))
+        if cursor.rowcount == 0:
+            raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        for (name,) in self._iter_rows("name"):
+            yield name
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM instances")[0][0]
+
+    def _iter_rows(self, columns: str, batch_size: int = 1000) -> Iterator[tuple]:
+        # Lettura a blocchi in ordine di inserimento, come per il dizionario JSON
+        last_id = 0
+        while True:
+            rows = self._query(
+                f"SELECT id, {columns} FROM instances WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size))
+            if not rows:
+                return
+            for row in rows:
+                yield row[1:]
+            last_id = rows[-1][0]
+
+    def iter_items(self) -> Iterator[Tuple[str, Dict]]:
+        """Scorre le istanze a blocchi senza tenerle tutte in memoria."""
+        for name, data in self._iter_rows("name, data"):
+            yield name, json.loads(data)
+
+    def items(self):
+        return self.iter_items()
+
+    def upsert_many(self, items: Iterable[Tuple[str, Dict]]) -> int:
+        """Inserisce o aggiorna più istanze in un'unica transazione."""
+        count = 0
+
+        def rows():
+            nonlocal count
+            for name, instance in items:
+                count += 1
+                yield name, json.dumps(instance)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO instances (name, data) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET data = excluded.data", rows())
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return count
+
+    def save(self) -> None:
+        # Ogni modifica è già persistita
+        pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path: Optional[str] = None):
+    """Apre l'archivio delle istanze scegliendo il backend dall'estensione.
+
+    Senza un percorso esplicito usa ssh_config.db se esiste, altrimenti il
+    file JSON storico. Un file JSON già migrato (rimasto solo come '.bak')
+    viene sostituito dal database accanto ad esso, invece di aprire un
+    archivio vuoto.
+    """
+    if path is None:
+        path = DEFAULT_DB if os.path.exists(DEFAULT_DB) else DEFAULT_JSON
+    elif not path.endswith(SQLITE_SUFFIXES) and not os.path.exists(path):
+        _, db_path = migration_paths(path)
+        if os.path.exists(path + '.bak') and os.path.exists(db_path):
+            path = db_path
+    if path.endswith(SQLITE_SUFFIXES):
+        return SqliteStore(path)
+    return JsonStore(path)
+
+
+def migration_paths(config: Optional[str] = None) -> Tuple[str, str]:
+    """File JSON e database della migrazione per il percorso passato con --config.
+
+    Il file mancante si ricava dall'altro cambiando l'estensione; senza
+    percorso si usano i nomi predefiniti.
+    """
+    if config is None:
+        return DEFAULT_JSON, DEFAULT_DB
+    base = os.path.splitext(config)[0]
+    if config.endswith(SQLITE_SUFFIXES):
+        return base + '.json', config
+    return config, base + '.db'
+
+
+def migrate_json_to_sqlite(json_path: str = DEFAULT_JSON, db_path: str = DEFAULT_DB) -> int:
+    """Copia le istanze dal file JSON nel database SQLite.
+
+    Al termine il file JSON viene rinominato in '.bak', così la migrazione
+    avviene una sola volta e il database diventa l'archivio predefinito.
+    """
+    with file_lock(json_path):
+        with open(json_path, 'r') as f:
+            instances = json.load(f)
+        store = SqliteStore(db_path)
+        try:
+            count = store.upsert_many(instances.items())
+        finally:
+            store.close()
+        os.replace(json_path, json_path + '.bak')
+    return count
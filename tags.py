@@ -0,0 +1,187 @@
+import re
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple, Union
+
+# Un tag è 'chiave=valore' oppure una sola parola (es. 'drained')
+TAG_RE = re.compile(r'^[\w.:/-]+(=[\w.:/-]*)?$')
+_TOKEN_RE = re.compile(r'\s*(?:([()&|!])|([^\s()&|!]+))')
+# Termine che corrisponde a ogni istanza
+ALL = '*'
+
+
+def parse_tags(value: Union[None, str, Iterable[str]]) -> List[str]:
+    """Normalizza i tag da una lista o da un testo separato da virgole/spazi.
+
+    ValueError se un tag contiene caratteri non ammessi.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[,;\s]+', value)
+    elif not isinstance(value, (list, tuple)):
+        raise ValueError(f"tag non validi: {value!r}")
+    tags = []
+    for tag in value:
+        tag = str(tag).strip()
+        if not tag:
+            continue
+        if not TAG_RE.match(tag):
+            raise ValueError(f"tag non valido: {tag!r}")
+        if tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _keys(tags: Iterable[str]) -> Set[str]:
+    # Ogni tag 'env=prod' rende l'istanza trovabile anche con 'env=*'
+    keys = set(tags)
+    keys.update(tag.split('=', 1)[0] + '=*' for tag in tags if '=' in tag)
+    return keys
+
+
+class TagIndex:
+    """Indice inverso dai tag ai nomi delle istanze.
+
+    I selettori combinano i tag con & (e), | (o), ! (non) e parentesi:
+    'env=prod & role=db & !drained'. 'env=*' indica qualsiasi valore di
+    env e '*' tutte le istanze. La valutazione lavora solo sugli insiemi
+    dell'indice: le intersezioni partono dall'insieme più piccolo e le
+    negazioni dentro un & vengono sottratte, senza mai scorrere
+    l'inventario. L'indice si aggiorna in modo incrementale con add/remove.
+    """
+
+    def __init__(self):
+        self._tags: Dict[str, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._names: Set[str] = set()
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, Dict]]) -> "TagIndex":
+        index = cls()
+        for name, instance in items:
+            index.add(name, instance)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, instance: Dict) -> None:
+        """Aggiunge o aggiorna un'istanza nell'indice."""
+        self.remove(name)
+        keys = frozenset(_keys(instance.get('tags') or ()))
+        self._names.add(name)
+        self._tags[name] = keys
+        for key in keys:
+            self._postings.setdefault(key, set()).add(name)
+
+    def remove(self, name: str) -> None:
+        """Rimuove un'istanza dall'indice."""
+        self._names.discard(name)
+        for key in self._tags.pop(name, ()):
+            postings = self._postings.get(key)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self._postings[key]
+
+    def counts(self) -> List[Tuple[str, int]]:
+        """Tag presenti con il numero di istanze, in ordine alfabetico."""
+        return sorted((key, len(names)) for key, names in self._postings.items()
+                      if not key.endswith('=*'))
+
+    def select(self, expression: str) -> List[str]:
+        """Nomi delle istanze che soddisfano il selettore, in ordine alfabetico.
+
+        ValueError se l'espressione non è valida.
+        """
+        return sorted(_Parser(expression, self).parse())
+
+    def _lookup(self, term: str) -> Set[str]:
+        if term == ALL:
+            return self._names
+        return self._postings.get(term, set())
+
+
+class _Parser:
+    """Discesa ricorsiva: or := and ('|' and)*, and := not ('&' not)*, not := '!' not | atomo."""
+
+    def __init__(self, expression: str, index: TagIndex):
+        self.expression = expression
+        self.index = index
+        self.tokens = self._tokenize(expression)
+        self.pos = 0
+
+    def _tokenize(self, expression: str) -> List[str]:
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            match = _TOKEN_RE.match(expression, pos)
+            if match is None:
+                raise ValueError(f"Selettore non valido: {expression!r}")
+            tokens.append(match.group(1) or match.group(2))
+            pos = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _error(self, detail: str) -> ValueError:
+        return ValueError(f"Selettore non valido: {detail} in {self.expression!r}")
+
+    def parse(self) -> Set[str]:
+        if not self.tokens:
+            raise self._error("espressione vuota")
+        result = self._or()
+        if self._peek() is not None:
+            raise self._error(f"'{self._peek()}' inatteso")
+        return result
+
+    def _or(self) -> Set[str]:
+        result = self._and()
+        while self._peek() == '|':
+            self.pos += 1
+            result |= self._and()
+        return result
+
+    def _and(self) -> Set[str]:
+        positive: List[Set[str]] = []
+        negative: List[Set[str]] = []
+        while True:
+            # Le negazioni si sottraggono dal risultato invece di complementarle
+            negated = False
+            while self._peek() == '!':
+                self.pos += 1
+                negated = not negated
+            (negative if negated else positive).append(self._atom())
+            if self._peek() != '&':
+                break
+            self.pos += 1
+        if positive:
+            positive.sort(key=len)
+            result = set(positive[0])
+            for names in positive[1:]:
+                if not result:
+                    break
+                result &= names
+        else:
+            result = set(self.index._lookup(ALL))
+        for names in negative:
+            if not result:
+                break
+            result -= names
+        return result
+
+    def _atom(self) -> Set[str]:
+        token = self._peek()
+        if token is None:
+            raise self._error("termine mancante")
+        self.pos += 1
+        if token == '(':
+            result = self._or()
+            if self._peek() != ')':
+                raise self._error("')' mancante")
+            self.pos += 1
+            return result
+        if token in ')&|':
+            raise self._error(f"'{token}' inatteso")
+        return self.index._lookup(token)
@@ -0,0 +1,211 @@
+import re
+import selectors
+import shlex
+import sys
+import time
+import paramiko
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Deque, Dict, List, Optional, Pattern, TextIO, Tuple
+from pool import ConnectionPool
+from term import Fore, Style
+
+DEFAULT_BUFFER_LINES = 1000
+# Finestra SSH ridotta: un host troppo loquace viene rallentato dal server
+# invece di riempire la memoria locale
+TAIL_WINDOW_SIZE = 256 * 1024
+READ_SIZE = 32768
+MAX_LINE_LENGTH = 64 * 1024
+RENDER_INTERVAL = 0.05
+HOST_COLORS = [Fore.GREEN, Fore.CYAN, Fore.MAGENTA, Fore.YELLOW, Fore.BLUE]
+
+
+class _Stream:
+    """Stato di un host: canale, riga parziale e righe in attesa di stampa."""
+
+    def __init__(self, name: str, channel: paramiko.Channel, lease: ExitStack,
+                 buffer_lines: int, color: str):
+        self.name = name
+        self.channel = channel
+        self.lease = lease
+        self.color = color
+        self.partial = b''
+        self.buffer_lines = buffer_lines
+        # Nessuna riga viene scartata: oltre buffer_lines si smette di leggere,
+        # quindi il buffer supera il limite al massimo di una lettura
+        self.lines: Deque[str] = deque()
+        self.errors = b''
+
+    @property
+    def full(self) -> bool:
+        return len(self.lines) >= self.buffer_lines
+
+    def close(self) -> None:
+        """Chiude il canale e rilascia il lease; si può chiamare più volte."""
+        self.lease.close()
+
+
+def _open_channel(pool: ConnectionPool, name: str, instance: Dict,
+                  command: str) -> Tuple[paramiko.Channel, ExitStack]:
+    """Apre il canale del tail; il lease sulla Transport dura quanto il canale."""
+    lease = ExitStack()
+    channel = lease.enter_context(pool.session(name, instance, window_size=TAIL_WINDOW_SIZE))
+    try:
+        channel.exec_command(command)
+    except BaseException:
+        lease.close()
+        raise
+    return channel, lease
+
+
+class MultiTail:
+    """Segue lo stesso file su più istanze in un unico thread.
+
+    Tutti i canali sono multiplexati con selectors. Ogni host ha un buffer
+    di righe in attesa di essere stampate: quando è pieno il suo
+    canale non viene più letto fino alla stampa successiva, la finestra SSH
+    si esaurisce e il server smette di inviare. La memoria resta quindi
+    limitata qualunque sia il volume di log di un host. Il filtro sulle
+    righe viene applicato prima di metterle nel buffer.
+    """
+
+    def __init__(self, pool: ConnectionPool, pattern: Optional[Pattern] = None,
+                 invert: bool = False, buffer_lines: int = DEFAULT_BUFFER_LINES,
+                 out: TextIO = sys.stdout):
+        self.pool = pool
+        self.pattern = pattern
+        self.invert = invert
+        self.buffer_lines = buffer_lines
+        self.out = out
+        self.selector = selectors.DefaultSelector()
+        self.streams: List[_Stream] = []
+        self.paused: List[_Stream] = []
+        self.width = 0
+
+    def open(self, instances, names: List[str], command: str, max_workers: int = 32) -> List[str]:
+        """Apre in parallelo un canale per istanza; restituisce gli errori di connessione."""
+        errors = []
+        self.pool.prefetch_dns(instances, names)
+        workers = max(1, min(max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(_open_channel, self.pool, name, instances[name], command)
+                       for name in names}
+        for i, (name, future) in enumerate(futures.items()):
+            try:
+                channel, lease = future.result()
+            except Exception as e:
+                errors.append(f"{name}: {str(e) or e.__class__.__name__}")
+                continue
+            stream = _Stream(name, channel, lease, self.buffer_lines,
+                             HOST_COLORS[i % len(HOST_COLORS)])
+            self.streams.append(stream)
+            self.selector.register(channel, selectors.EVENT_READ, stream)
+            self.width = max(self.width, len(name))
+        return errors
+
+    def _accept(self, line: str) -> bool:
+        if self.pattern is None:
+            return True
+        return bool(self.pattern.search(line)) != self.invert
+
+    def _read(self, stream: _Stream) -> bool:
+        """Legge i dati disponibili; restituisce False quando il canale è terminato."""
+        channel = stream.channel
+        while channel.recv_stderr_ready():
+            stream.errors = (stream.errors + channel.recv_stderr(READ_SIZE))[-MAX_LINE_LENGTH:]
+        while channel.recv_ready() and not stream.full:
+            data = stream.partial + channel.recv(READ_SIZE)
+            *complete, stream.partial = data.split(b'\n')
+            # Una riga senza fine non può crescere all'infinito
+            if len(stream.partial) > MAX_LINE_LENGTH:
+                complete.append(stream.partial)
+                stream.partial = b''
+            for raw in complete:
+                line = raw.decode(errors='replace').rstrip('\r')
+                if self._accept(line):
+                    stream.lines.append(line)
+        if stream.full:
+            return True
+        if (channel.eof_received or channel.closed) and not channel.recv_ready():
+            if stream.partial:
+                line = stream.partial.decode(errors='replace')
+                if self._accept(line):
+                    stream.lines.append(line)
+                stream.partial = b''
+            return False
+        return True
+
+    def _render(self) -> None:
+        chunks = []
+        for stream in self.streams:
+            prefix = f"{stream.color}{stream.name:<{self.width}}{Style.RESET_ALL} | "
+            while stream.lines:
+                chunks.append(prefix + stream.lines.popleft() + '\n')
+            if stream.errors:
+                message = stream.errors.decode(errors='replace').strip()
+                chunks.append(f"{prefix}{Fore.RED}{message}{Style.RESET_ALL}\n")
+                stream.errors = b''
+        if chunks:
+            self.out.write(''.join(chunks))
+            self.out.flush()
+        # Gli host messi in pausa riprendono ora che il loro buffer è vuoto
+        for stream in self.paused:
+            self.selector.register(stream.channel, selectors.EVENT_READ, stream)
+        self.paused.clear()
+
+    def run(self) -> None:
+        active = len(self.streams)
+        last_render = time.monotonic()
+        try:
+            while active:
+                for key, _ in self.selector.select(timeout=RENDER_INTERVAL):
+                    stream = key.data
+                    if not self._read(stream):
+                        self.selector.unregister(stream.channel)
+                        stream.close()
+                        active -= 1
+                    elif stream.full:
+                        self.selector.unregister(stream.channel)
+                        self.paused.append(stream)
+                now = time.monotonic()
+                if self.paused or now - last_render >= RENDER_INTERVAL:
+                    self._render()
+                    last_render = now
+        finally:
+            self._render()
+            self.close()
+
+    def close(self) -> None:
+        for stream in self.streams:
+            stream.close()
+        self.selector.close()
+
+
+def tail(instances, names: List[str], path: str, pattern: Optional[str] = None,
+         invert: bool = False, ignore_case: bool = False, lines: int = 10,
+         follow: bool = True, buffer_lines: int = DEFAULT_BUFFER_LINES,
+         pool: Optional[ConnectionPool] = None) -> List[str]:
+    """Segue un file di log su più istanze stampando le righe con il nome dell'host.
+
+    Restituisce gli errori di connessione; si interrompe con Ctrl-C.
+    re.error se pattern non è una regex valida, prima di aprire connessioni.
+    """
+    regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0) if pattern else None
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(max_size=max(1, len(names)), instances=instances)
+    command = f"tail -n {int(lines)} {'-F ' if follow else ''}-- {shlex.quote(path)}"
+    session = MultiTail(pool, regex, invert, buffer_lines)
+    try:
+        errors = session.open(instances, names, command)
+        for error in errors:
+            print(f"{Fore.RED}Errore: {error}{Style.RESET_ALL}", file=sys.stderr)
+        try:
+            session.run()
+        except KeyboardInterrupt:
+            pass
+        return errors
+    finally:
+        if own_pool:
+            pool.close_all()
@@ -0,0 +1,50 @@
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+# Sequenze ANSI equivalenti a quelle di colorama, senza doverlo importare
+# all'avvio. Su Windows colorama serve ancora per tradurle nella console.
+if os.name == 'nt':
+    from colorama import init
+    init()
+
+
+class Fore:
+    BLACK = '\033[30m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    MAGENTA = '\033[35m'
+    CYAN = '\033[36m'
+    WHITE = '\033[37m'
+    RESET = '\033[39m'
+
+
+class Style:
+    BRIGHT = '\033[1m'
+    DIM = '\033[2m'
+    NORMAL = '\033[22m'
+    RESET_ALL = '\033[0m'
+
+
+def clear_screen() -> None:
+    """Pulisce il terminale senza avviare un processo 'clear'."""
+    sys.stdout.write('\033[H\033[2J\033[3J')
+    sys.stdout.flush()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Importa un modulo rimandandone il caricamento al primo attributo usato."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
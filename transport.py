@@ -0,0 +1,215 @@
+import os
+import socket
+import sys
+import threading
+import time
+import paramiko
+from typing import Dict, List, Optional
+from keys import KEYS
+from metrics import METRICS
+from resolver import RESOLVER
+from term import Fore, Style
+import tuning
+
+DEFAULT_TIMEOUT = 30.0
+KNOWN_HOSTS = os.path.expanduser("~/.ssh/known_hosts")
+# Finestra dei canali verso le istanze dietro un bastion: tutto il traffico
+# della Transport interna, SFTP compreso, passa da qui
+TUNNEL_WINDOW_SIZE = 16 * 1024 * 1024
+DEFAULT_KEYS = [os.path.expanduser(f"~/.ssh/{name}")
+                for name in ("id_ed25519", "id_ecdsa", "id_rsa")]
+
+_known_hosts: Optional[paramiko.HostKeys] = None
+_known_hosts_lock = threading.Lock()
+# Serializza verifica e aggiunta, così un host nuovo viene salvato una sola volta
+_host_key_lock = threading.Lock()
+
+
+def _get_known_hosts() -> paramiko.HostKeys:
+    """Carica known_hosts una sola volta per processo."""
+    global _known_hosts
+    with _known_hosts_lock:
+        if _known_hosts is None:
+            _known_hosts = paramiko.HostKeys()
+            if os.path.exists(KNOWN_HOSTS):
+                try:
+                    _known_hosts.load(KNOWN_HOSTS)
+                except (IOError, paramiko.SSHException):
+                    pass
+        return _known_hosts
+
+
+class UnknownHostKeyError(paramiko.SSHException):
+    """Host assente da known_hosts, rifiutato come fa ssh con StrictHostKeyChecking."""
+
+
+def _known_host_name(instance: Dict) -> str:
+    port = instance.get('port', 22)
+    return instance['hostname'] if port == 22 else f"[{instance['hostname']}]:{port}"
+
+
+def _add_known_host(name: str, key: paramiko.PKey) -> None:
+    """Aggiunge la chiave a known_hosts, in memoria e in coda al file."""
+    _get_known_hosts().add(name, key.get_name(), key)
+    directory = os.path.dirname(KNOWN_HOSTS)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    with open(KNOWN_HOSTS, 'a') as f:
+        f.write(f"{name} {key.get_name()} {key.get_base64()}\n")
+
+
+def _check_host_key(transport: paramiko.Transport, instance: Dict) -> None:
+    """Verifica la chiave dell'host con known_hosts.
+
+    Una chiave diversa da quella registrata viene sempre rifiutata. Anche
+    un host sconosciuto viene rifiutato, a meno che l'istanza abbia
+    'accept_new_host_key': true (come StrictHostKeyChecking=accept-new):
+    in quel caso la chiave viene salvata in known_hosts con un avviso.
+    """
+    name = _known_host_name(instance)
+    key = transport.get_remote_server_key()
+    with _host_key_lock:
+        entry = _get_known_hosts().lookup(name)
+        if entry is not None and key.get_name() in entry:
+            if entry[key.get_name()] != key:
+                raise paramiko.BadHostKeyException(instance['hostname'], key, entry[key.get_name()])
+            return
+        if not instance.get('accept_new_host_key'):
+            raise UnknownHostKeyError(
+                f"Chiave dell'host {name} sconosciuta ({key.get_name()} "
+                f"{key.fingerprint}): aggiungila a {KNOWN_HOSTS} oppure imposta "
+                f"'accept_new_host_key': true nell'istanza")
+        _add_known_host(name, key)
+    print(f"{Fore.YELLOW}Attenzione: chiave {key.get_name()} dell'host {name} aggiunta a "
+          f"{KNOWN_HOSTS}.{Style.RESET_ALL}", file=sys.stderr)
+
+
+def _candidate_keys(instance: Dict) -> List[paramiko.PKey]:
+    """Restituisce le chiavi da provare per l'autenticazione, in ordine.
+
+    Le chiavi arrivano dalla cache di processo: ogni file viene letto e
+    decifrato una sola volta e i PKey sono condivisi tra le connessioni.
+    """
+    key_path = instance.get('key_path')
+    if key_path:
+        return [KEYS.get(key_path)]
+
+    keys: List[paramiko.PKey] = KEYS.agent_keys()
+    for path in DEFAULT_KEYS:
+        if os.path.exists(path):
+            try:
+                # Le chiavi di default cifrate non interrompono con un prompt
+                keys.append(KEYS.get(path, interactive=False))
+            except paramiko.SSHException:
+                continue
+    return keys
+
+
+def _authenticate(transport: paramiko.Transport, instance: Dict) -> None:
+    username = instance['username']
+    for key in _candidate_keys(instance):
+        try:
+            transport.auth_publickey(username, key)
+            return
+        except paramiko.AuthenticationException:
+            continue
+    raise paramiko.AuthenticationException(
+        f"Autenticazione fallita per {username}@{instance['hostname']}")
+
+
+def _connect_addresses(addresses: List, timeout: float, label: str) -> socket.socket:
+    error: Optional[OSError] = None
+    for family, socktype, proto, _, address in addresses:
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        # Chiusura di un canale e apertura del successivo sono messaggi
+        # piccoli e consecutivi: con Nagle il secondo attende l'ACK ritardato
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            with METRICS.timer('tcp', label):
+                sock.connect(address)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError("Nessun indirizzo disponibile")
+
+
+def _connect_socket(instance: Dict, timeout: float, label: str) -> socket.socket:
+    """Risolve l'host (tramite la cache DNS) e apre la connessione TCP, misurando le due fasi."""
+    host, port = instance['hostname'], instance.get('port', 22)
+    with METRICS.timer('dns', label):
+        addresses = RESOLVER.resolve(host, port)
+    try:
+        return _connect_addresses(addresses, timeout, label)
+    except OSError:
+        # L'indirizzo in cache potrebbe essere cambiato: si riprova una volta
+        RESOLVER.invalidate(host, port)
+        fresh = RESOLVER.resolve(host, port)
+        if fresh == addresses:
+            raise
+        return _connect_addresses(fresh, timeout, label)
+
+
+def _wait_banner(sock: socket.socket, label: str) -> None:
+    # Attende il primo byte del banner senza consumarlo: lo leggerà paramiko
+    with METRICS.timer('banner', label):
+        sock.recv(1, socket.MSG_PEEK)
+
+
+def open_tunnel(bastion: paramiko.Transport, instance: Dict, timeout: float = DEFAULT_TIMEOUT,
+                label: Optional[str] = None) -> paramiko.Channel:
+    """Apre un canale direct-tcpip dal bastion verso l'istanza.
+
+    Il nome dell'host viene risolto dal bastion, quindi funziona anche con
+    nomi visibili solo dalla rete interna.
+    """
+    label = label or instance['hostname']
+    # Il canale non deve limitare la finestra scelta dal profilo dell'istanza
+    tuned = tuning.profile(instance)
+    window = max(TUNNEL_WINDOW_SIZE, tuned.window_size or 0) if tuned else TUNNEL_WINDOW_SIZE
+    with METRICS.timer('tunnel', label):
+        return bastion.open_channel('direct-tcpip',
+                                    (instance['hostname'], instance.get('port', 22)),
+                                    ('127.0.0.1', 0), window_size=window,
+                                    timeout=timeout)
+
+
+def open_transport(instance: Dict, timeout: float = DEFAULT_TIMEOUT,
+                   label: Optional[str] = None,
+                   sock: Optional[paramiko.Channel] = None) -> paramiko.Transport:
+    """Apre e autentica una Transport paramiko verso un'istanza.
+
+    Con sock (un canale aperto da open_tunnel) la connessione passa dal
+    bastion invece di aprire un socket TCP. Il profilo dell'istanza
+    (campo 'tuning': cifrari, finestra, pacchetto, compressione) viene
+    applicato prima dello scambio chiavi. Le durate di DNS, TCP, banner,
+    scambio chiavi e autenticazione vengono registrate in metrics.METRICS
+    con l'etichetta label (default hostname).
+    """
+    label = label or instance['hostname']
+    start = time.perf_counter()
+    if sock is None:
+        sock = _connect_socket(instance, timeout, label)
+        try:
+            _wait_banner(sock, label)
+        except OSError:
+            sock.close()
+            raise
+    transport = paramiko.Transport(sock)
+    transport.banner_timeout = timeout
+    transport.auth_timeout = timeout
+    try:
+        tuned = tuning.profile(instance)
+        if tuned is not None:
+            tuning.apply(transport, tuned)
+        with METRICS.timer('kex', label):
+            transport.start_client(timeout=timeout)
+        _check_host_key(transport, instance)
+        with METRICS.timer('auth', label):
+            _authenticate(transport, instance)
+    except Exception:
+        transport.close()
+        raise
+    METRICS.observe('connect', label, time.perf_counter() - start)
+    return transport
@@ -0,0 +1,295 @@
+import os
+import time
+import paramiko
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from term import Fore, Style
+
+# Cifrari provati dalla calibrazione: GCM autentica senza un MAC separato,
+# CTR è l'alternativa supportata da qualsiasi server
+CIPHERS = ('aes128-gcm@openssh.com', 'aes256-gcm@openssh.com', 'aes128-ctr', 'aes256-ctr')
+# Coppie (finestra, pacchetto massimo): default di paramiko, valori intermedi,
+# quelli usati dall'SFTP senza profilo e una finestra per link ad alta latenza
+WINDOWS = ((2 * 1024 * 1024, 32 * 1024), (8 * 1024 * 1024, 128 * 1024),
+           (16 * 1024 * 1024, 256 * 1024), (64 * 1024 * 1024, 256 * 1024))
+# Finestra con cui si confrontano i cifrari
+REFERENCE_WINDOW = WINDOWS[2]
+DEFAULT_SIZE = 8 * 1024 * 1024
+DEFAULT_REPEAT = 2
+# Limiti accettati da paramiko per finestra e pacchetto
+MIN_SIZE = 4096
+MAX_SIZE = 2 ** 32 - 1
+
+
+@dataclass
+class Profile:
+    """Parametri della Transport per un'istanza, salvati nel campo 'tuning'.
+
+    I campi non impostati lasciano il default di paramiko.
+    """
+    ciphers: Tuple[str, ...] = ()
+    window_size: Optional[int] = None
+    max_packet_size: Optional[int] = None
+    compression: bool = False
+
+    @classmethod
+    def from_config(cls, data: Dict) -> "Profile":
+        """ValueError se un valore non è valido; i campi extra (es. throughput) sono ignorati."""
+        if not isinstance(data, dict):
+            raise ValueError(f"profilo di trasporto non valido: {data!r}")
+        ciphers = data.get('ciphers') or ()
+        if isinstance(ciphers, str):
+            ciphers = ciphers.split(',')
+        profile = cls(ciphers=tuple(c.strip() for c in ciphers if c.strip()),
+                      window_size=data.get('window_size'),
+                      max_packet_size=data.get('max_packet_size'),
+                      compression=bool(data.get('compression', False)))
+        for key in ('window_size', 'max_packet_size'):
+            value = getattr(profile, key)
+            if value is not None and (not isinstance(value, int)
+                                      or not MIN_SIZE <= value <= MAX_SIZE):
+                raise ValueError(f"{key} non valido nel profilo di trasporto: {value!r}")
+        return profile
+
+    def to_config(self) -> Dict:
+        data: Dict = {'compression': self.compression}
+        if self.ciphers:
+            data['ciphers'] = list(self.ciphers)
+        if self.window_size:
+            data['window_size'] = self.window_size
+        if self.max_packet_size:
+            data['max_packet_size'] = self.max_packet_size
+        return data
+
+    def describe(self) -> str:
+        parts = [self.ciphers[0] if self.ciphers else 'cifrario default']
+        if self.window_size:
+            parts.append(f"finestra {_size(self.window_size)}")
+        if self.max_packet_size:
+            parts.append(f"pacchetto {_size(self.max_packet_size)}")
+        parts.append('compressione' if self.compression else 'senza compressione')
+        return ', '.join(parts)
+
+
+def profile(instance: Dict) -> Optional[Profile]:
+    """Profilo salvato dell'istanza, None se non è mai stata calibrata."""
+    data = instance.get('tuning')
+    return Profile.from_config(data) if data else None
+
+
+def apply(transport: paramiko.Transport, tuned: Profile) -> None:
+    """Applica il profilo a una Transport non ancora avviata.
+
+    I cifrari del profilo vengono messi in testa alle preferenze senza
+    togliere gli altri, così un server che non li supporta resta
+    raggiungibile. Finestra e pacchetto valgono per ogni canale aperto
+    in seguito (exec, shell, SFTP).
+    """
+    if tuned.ciphers:
+        options = transport.get_security_options()
+        available = options.ciphers
+        preferred = [c for c in tuned.ciphers if c in available]
+        options.ciphers = tuple(preferred + [c for c in available if c not in preferred])
+    if tuned.window_size:
+        transport.default_window_size = tuned.window_size
+    if tuned.max_packet_size:
+        transport.default_max_packet_size = tuned.max_packet_size
+    transport.use_compression(tuned.compression)
+
+
+def _size(value: int) -> str:
+    if value >= 1024 * 1024:
+        return f"{value // (1024 * 1024)} MiB"
+    return f"{value // 1024} KiB"
+
+
+def _rate(value: float) -> str:
+    return f"{value / (1024 * 1024):.1f} MiB/s" if value else '-'
+
+
+def sample_data(size: int) -> bytes:
+    """Dati di prova: metà casuali e metà testo ripetitivo, come un misto di archivi e log.
+
+    Con solo dati casuali la compressione risulterebbe sempre dannosa,
+    con soli log sempre vantaggiosa.
+    """
+    half = size // 2
+    line = b"2024-01-01T00:00:00Z INFO richiesta completata status=200 durata_ms=12\n"
+    text = (line * (half // len(line) + 1))[:half]
+    return os.urandom(size - half) + text
+
+
+@dataclass
+class Measurement:
+    profile: Profile
+    upload: float = 0.0
+    download: float = 0.0
+    cipher: str = ''
+    compression: str = ''
+    error: Optional[str] = None
+
+    @property
+    def throughput(self) -> float:
+        """Media armonica di upload e download, in byte al secondo."""
+        if not self.upload or not self.download:
+            return 0.0
+        return 2 / (1 / self.upload + 1 / self.download)
+
+
+def _transfer(transport: paramiko.Transport, instance: Dict, data: memoryview,
+              remote_path: str) -> Tuple[float, float]:
+    import sftp
+    client = sftp.open_sftp(transport, instance)
+    try:
+        start = time.perf_counter()
+        with client.open(remote_path, 'wb', bufsize=0) as f:
+            f.set_pipelined(True)
+            for pos in range(0, len(data), sftp.CHUNK_SIZE):
+                f.write(data[pos:pos + sftp.CHUNK_SIZE])
+        upload = len(data) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        with client.open(remote_path, 'rb') as f:
+            f.prefetch(len(data))
+            while f.read(1024 * 1024):
+                pass
+        download = len(data) / (time.perf_counter() - start)
+        return upload, download
+    finally:
+        try:
+            client.remove(remote_path)
+        except OSError:
+            pass
+        client.close()
+
+
+def measure(name: str, instance: Dict, tuned: Profile, data: memoryview, remote_path: str,
+            repeat: int = DEFAULT_REPEAT, timeout: float = 30.0,
+            bastion: Optional[paramiko.Transport] = None) -> Measurement:
+    """Carica e scarica i dati via SFTP con il profilo, su una connessione nuova.
+
+    Di più ripetizioni si tiene la migliore, meno disturbata dal rumore.
+    Con bastion la connessione passa da un canale direct-tcpip.
+    """
+    from transport import open_transport, open_tunnel
+    result = Measurement(profile=tuned)
+    candidate = {**instance, 'tuning': tuned.to_config()}
+    try:
+        sock = open_tunnel(bastion, candidate, timeout, name) if bastion is not None else None
+        transport = open_transport(candidate, timeout, label=name, sock=sock)
+        try:
+            result.cipher = transport.local_cipher
+            result.compression = transport.local_compression
+            for _ in range(max(1, repeat)):
+                upload, download = _transfer(transport, candidate, data, remote_path)
+                result.upload = max(result.upload, upload)
+                result.download = max(result.download, download)
+        finally:
+            transport.close()
+    except Exception as e:
+        result.error = str(e) or e.__class__.__name__
+        return result
+    # Il server ha scelto altro: la combinazione non è disponibile
+    if tuned.ciphers and result.cipher != tuned.ciphers[0]:
+        result.error = f"cifrario {tuned.ciphers[0]} non supportato dal server"
+    elif tuned.compression and result.compression == 'none':
+        result.error = "compressione non supportata dal server"
+    return result
+
+
+@dataclass
+class Calibration:
+    baseline: Measurement
+    measurements: List[Measurement] = field(default_factory=list)
+    best: Optional[Measurement] = None
+
+    @property
+    def gain(self) -> float:
+        """Miglioramento relativo del profilo migliore rispetto alla connessione senza profilo."""
+        if self.best is None or not self.baseline.throughput:
+            return 0.0
+        return self.best.throughput / self.baseline.throughput - 1
+
+    @property
+    def improved(self) -> bool:
+        """Vero se un profilo è più veloce della connessione senza profilo."""
+        return self.best is not None and self.best is not self.baseline
+
+
+def calibrate(name: str, instance: Dict, size: int = DEFAULT_SIZE,
+              repeat: int = DEFAULT_REPEAT, timeout: float = 30.0,
+              data: Optional[bytes] = None, remote_path: Optional[str] = None,
+              bastion: Optional[paramiko.Transport] = None,
+              on_measure: Optional[Callable[[Measurement], None]] = None) -> Calibration:
+    """Cerca il profilo con il throughput più alto verso l'istanza.
+
+    Invece del prodotto completo delle combinazioni la ricerca procede per
+    un parametro alla volta: prima il cifrario con la finestra di
+    riferimento, poi le altre finestre con il cifrario migliore, infine la
+    compressione. Con 4 cifrari e 4 finestre sono 8 misure invece di 32,
+    più quella senza profilo. Anche questa concorre: se nessun profilo la
+    supera, best è la misura senza profilo e improved è falso.
+    """
+    view = memoryview(data if data is not None else sample_data(size))
+    remote_path = remote_path or f".ssh-manager-tuning-{os.getpid()}"
+
+    def run(tuned: Profile) -> Measurement:
+        result = measure(name, instance, tuned, view, remote_path, repeat, timeout, bastion)
+        if on_measure is not None:
+            on_measure(result)
+        return result
+
+    outcome = Calibration(baseline=run(Profile()))
+    if outcome.baseline.error:
+        return outcome
+
+    def best_of(candidates: List[Profile], current: Optional[Measurement]) -> Optional[Measurement]:
+        for tuned in candidates:
+            result = run(tuned)
+            outcome.measurements.append(result)
+            if not result.error and (current is None or result.throughput > current.throughput):
+                current = result
+        return current
+
+    window, packet = REFERENCE_WINDOW
+    best = best_of([Profile(ciphers=(cipher,), window_size=window, max_packet_size=packet)
+                    for cipher in CIPHERS], outcome.baseline)
+    # Se vince la connessione senza profilo si provano le finestre con i cifrari di default
+    ciphers = best.profile.ciphers
+    current = (best.profile.window_size, best.profile.max_packet_size)
+    best = best_of([Profile(ciphers=ciphers, window_size=window, max_packet_size=packet)
+                    for window, packet in WINDOWS if (window, packet) != current], best)
+    best = best_of([Profile(ciphers=ciphers, window_size=best.profile.window_size,
+                            max_packet_size=best.profile.max_packet_size, compression=True)],
+                   best)
+    outcome.best = best
+    return outcome
+
+
+def saved_config(calibration: Calibration) -> Dict:
+    """Valore del campo 'tuning' da salvare nell'istanza."""
+    best = calibration.best
+    return {**best.profile.to_config(), 'throughput': round(best.throughput),
+            'calibrated_at': time.time()}
+
+
+def print_measure(result: Measurement) -> None:
+    if result.error:
+        print(f"  {result.profile.describe()}: {Fore.RED}{result.error}{Style.RESET_ALL}")
+    else:
+        print(f"  {result.profile.describe()}: upload {_rate(result.upload)}, "
+              f"download {_rate(result.download)}")
+
+
+def print_summary(calibration: Calibration) -> None:
+    baseline, best = calibration.baseline, calibration.best
+    if baseline.error:
+        print(f"{Fore.RED}Calibrazione non riuscita: {baseline.error}{Style.RESET_ALL}")
+        return
+    if not calibration.improved:
+        print(f"\n{Fore.YELLOW}Nessun profilo supera la connessione senza profilo "
+              f"({_rate(baseline.throughput)}).{Style.RESET_ALL}")
+        return
+    print(f"\n{Fore.CYAN}=== Profilo migliore ==={Style.RESET_ALL}")
+    print(f"{best.profile.describe()}")
+    print(f"Throughput: {_rate(best.throughput)} (senza profilo: "
+          f"{_rate(baseline.throughput)}, {calibration.gain:+.0%})")